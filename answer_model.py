@@ -0,0 +1,200 @@
+"""
+answer_model.py - Разобранный ответ CMC AI: структура строится один раз
+Version: 1.0.0
+
+- parse_answer: секции TLDR и Deep Dive (TLDR очищен text_cleaning)
+- parse_section: строки с типом (цена / пункт списка / подзаголовок / текст),
+  абзацы, пункты для твитов, строки цен, значение Fear & Greed, границы предложений
+- Один проход по строкам на текст; результат кэшируется по тексту (lru_cache),
+  все форматтеры (Telegram, треды, одиночный твит) рендерят из одной модели
+"""
+
+import re
+import sys
+from functools import lru_cache
+from collections import namedtuple
+
+from text_cleaning import ANSWER_CLEANER
+
+CRYPTO_PRICE_PATTERN = re.compile(r'^[A-Z]{2,10}\s*\([+-]?\d')
+LIST_ITEM_PATTERN = re.compile(r'^[\-•\*]\s+|^\d+\.\s+')
+FEAR_GREED_PATTERN = re.compile(r'Fear & Greed Index:\s*(?:<b>)?(\d+)')
+# Конец предложения: знак препинания, за которым идут пробелы/перевод строки
+SENTENCE_BREAK_PATTERN = re.compile(r'(?<=[.!?])\s+')
+
+HEADING_ENDINGS = (':', '–', '—')
+HEADING_MAX_LENGTH = 50
+BULLET_MIN_LENGTH = 10
+MODEL_CACHE_SIZE = 64
+
+# kind: "price" | "bullet" | "heading" | "text"
+# content: текст без маркера списка; price: content начинается с тикера и изменения цены
+Line = namedtuple('Line', 'raw text kind content price')
+
+
+def classify_line(raw):
+    """Line для непустой строки"""
+    text = raw.strip()
+    if CRYPTO_PRICE_PATTERN.match(text):
+        return Line(raw, text, "price", text, True)
+    if LIST_ITEM_PATTERN.match(text):
+        content = LIST_ITEM_PATTERN.sub('', text).strip()
+        return Line(raw, text, "bullet", content, bool(CRYPTO_PRICE_PATTERN.match(content)))
+    if text.endswith(HEADING_ENDINGS) and len(text) < HEADING_MAX_LENGTH:
+        return Line(raw, text, "heading", text, False)
+    return Line(raw, text, "text", text, False)
+
+
+def first_sentence(text):
+    """Первое предложение строки (до знака конца + пробела) или None, если знака нет"""
+    text = text.strip()
+    match = SENTENCE_BREAK_PATTERN.search(text)
+    sentence = text[:match.start()] if match else text
+    return sentence if sentence.endswith(('.', '!', '?')) else None
+
+
+class Section:
+    """Структура одного текста (TLDR, Deep Dive или уже очищенный текст поста)."""
+
+    def __init__(self, text):
+        self.text = text
+        lines = []
+        paragraphs = []
+        paragraph = []
+        bullets = []
+        for raw in text.split('\n'):
+            if not raw.strip():
+                if paragraph:
+                    paragraphs.append('\n'.join(paragraph))
+                    paragraph = []
+                continue
+            line = classify_line(raw)
+            lines.append(line)
+            paragraph.append(line.text)
+            # Alpha Take / Context - не пункты контента
+            if (line.kind in ("price", "bullet") and len(line.content) > BULLET_MIN_LENGTH
+                    and not line.text.startswith(('Alpha Take', 'Context:'))):
+                bullets.append(line)
+        if paragraph:
+            paragraphs.append('\n'.join(paragraph))
+
+        self.lines = tuple(lines)
+        self.paragraphs = tuple(paragraphs)
+        self.bullets = tuple(bullets)
+        self.price_lines = tuple(line for line in lines if line.kind == "price")
+
+        match = FEAR_GREED_PATTERN.search(text)
+        self.fear_greed = int(match.group(1)) if match else None
+
+        spans = []
+        start = 0
+        for match in SENTENCE_BREAK_PATTERN.finditer(text):
+            spans.append((start, match.start()))
+            start = match.end()
+        if start < len(text):
+            spans.append((start, len(text)))
+        self.sentence_spans = tuple(spans)
+        self.sentences = tuple(s for s in (text[a:b].strip() for a, b in spans) if s)
+
+    def intro_line(self):
+        """
+        Первая содержательная строка: без строк с Alpha Take
+        и без "Context:" после Alpha Take. None если такой нет.
+        """
+        after_alpha = False
+        for line in self.lines:
+            if 'Alpha Take' in line.raw:
+                after_alpha = True
+                continue
+            if after_alpha and line.raw.startswith('Context:'):
+                continue
+            return line
+        return None
+
+
+class ParsedAnswer:
+    """Ответ CMC: секции TLDR и Deep Dive."""
+
+    def __init__(self, answer):
+        self.answer = answer
+        self.cleaning = None
+        tldr_start = answer.find('TLDR')
+        if tldr_start == -1:
+            self.tldr = None
+            deep_dive_start = answer.find('Deep Dive')
+        else:
+            deep_dive_start = answer.find('Deep Dive', tldr_start)
+            end = deep_dive_start if deep_dive_start != -1 else len(answer)
+            tldr_text = answer[tldr_start:end].strip().replace('TLDR', '', 1).strip()
+            # Строка "Researched for Xs" и вводные строки CMC - за один проход
+            tldr_text, self.cleaning = ANSWER_CLEANER.clean(tldr_text)
+            self.tldr = parse_section(tldr_text)
+
+        if deep_dive_start == -1:
+            self.deep_dive = None
+        else:
+            self.deep_dive = parse_section(answer[deep_dive_start:].replace('Deep Dive', '', 1).strip())
+
+
+@lru_cache(maxsize=MODEL_CACHE_SIZE)
+def parse_section(text):
+    return Section(text or "")
+
+
+@lru_cache(maxsize=MODEL_CACHE_SIZE)
+def parse_answer(answer):
+    return ParsedAnswer(answer or "")
+
+
+def _test():
+    """Разбор строк, пунктов, цен, Fear & Greed, предложений и кэш модели"""
+    text = ("Market update:\n"
+            "BTC (+2.1%) holds above $67K.\n"
+            "- Solana memes keep rotating\n"
+            "• ETH (-1.2%) trades near $3.1K\n"
+            "- short\n"
+            "\n"
+            "Fear & Greed Index: <b>62</b>. Sentiment is neutral! Is it? Yes")
+    section = parse_section(text)
+    checks = [
+        ("виды строк", [line.kind for line in section.lines],
+         ["heading", "price", "bullet", "bullet", "bullet", "text"]),
+        ("пункты", [line.content for line in section.bullets],
+         ["BTC (+2.1%) holds above $67K.", "Solana memes keep rotating", "ETH (-1.2%) trades near $3.1K"]),
+        ("цена в пункте", [line.price for line in section.bullets], [True, False, True]),
+        ("price_lines", [line.text for line in section.price_lines], ["BTC (+2.1%) holds above $67K."]),
+        ("абзацы", len(section.paragraphs), 2),
+        ("fear_greed", section.fear_greed, 62),
+        ("fear_greed без индекса", parse_section("No index here").fear_greed, None),
+        # Граница - только знак конца + пробел: "$3.1K" и "(+2.1%)" не режутся
+        ("предложения", section.sentences[-3:], ("Sentiment is neutral!", "Is it?", "Yes")),
+        ("sentence_spans", [text[a:b] for a, b in section.sentence_spans[:1]],
+         ["Market update:\nBTC (+2.1%) holds above $67K."]),
+        ("sentence_spans покрывают текст", section.sentence_spans[-1][1], len(text)),
+        ("intro_line", section.intro_line().text, "Market update:"),
+        ("first_sentence", (first_sentence("Up 3.1%. Then more"), first_sentence("No end")), ("Up 3.1%.", None)),
+        ("кэш parse_section", parse_section(text) is section, True),
+        ("кэш parse_answer", parse_answer("TLDR x") is parse_answer("TLDR x"), True),
+    ]
+
+    answer = parse_answer("TLDR\nBTC (+1%) leads the market today.\nDeep Dive\n- Funding stays positive")
+    checks += [
+        ("TLDR", answer.tldr.text, "BTC (+1%) leads the market today."),
+        ("Deep Dive", [line.content for line in answer.deep_dive.bullets], ["Funding stays positive"]),
+        ("без TLDR", (parse_answer("plain").tldr, parse_answer("plain").deep_dive), (None, None)),
+    ]
+
+    all_passed = True
+    for name, result, expected in checks:
+        status = "✓" if result == expected else "✗"
+        if result != expected:
+            all_passed = False
+            print(f"  {status} {name}: {result!r} (expected {expected!r})")
+        else:
+            print(f"  {status} {name}")
+    print(f"All tests passed: {'✓ YES' if all_passed else '✗ NO'}")
+    return all_passed
+
+
+if __name__ == "__main__":
+    sys.exit(0 if _test() else 1)
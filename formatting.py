@@ -1,8 +1,23 @@
 """
 formatting.py - Модуль улучшенного форматирования для Telegram и Twitter
-Version: 3.3.0
+Version: 3.6.0
 Senior QA Approved - Production Ready
 
+ОБНОВЛЕНО В v3.6.0:
+- Форматтеры рендерят из answer_model.parse_section: строки, пункты, предложения
+  разбираются один раз на текст (кэш), а не заново в каждой функции
+- Intro и предложения для треда режутся только по знаку + пробелу ("$3.1B" цело)
+
+ОБНОВЛЕНО В v3.5.0:
+- Удален TWEET_DELAY: паузы между твитами теперь по лимитам API (twitter_client.publish_thread)
+- split_telegram_html: линейная разбивка длинных сообщений по абзацам,
+  затем предложениям, затем словам; открытые теги переоткрываются в следующей части
+- Графемы (emoji-последовательности) никогда не режутся
+
+ОБНОВЛЕНО В v3.4.0:
+- plan_photo_caption: подпись к фото (до 1024 символов) + остаток отдельными сообщениями
+- Длина считается как в Telegram: видимый текст без HTML-тегов, в UTF-16 units
+
 ОБНОВЛЕНО В v3.3.0:
 - Импорт get_twitter_length из utils.py (унификация)
 - Удалена локальная копия функции
@@ -28,11 +43,13 @@ Senior QA Approved - Production Ready
 """
 
 import re
+import html
 import time
 import logging
 
 # Импорт общих утилит
-from utils import get_twitter_length, safe_truncate
+from utils import get_twitter_length, truncate_by_weight, split_graphemes, text_view
+from answer_model import CRYPTO_PRICE_PATTERN, parse_section, first_sentence
 
 logger = logging.getLogger(__name__)
 
@@ -40,7 +57,7 @@ logger = logging.getLogger(__name__)
 # ВЕРСИЯ И НАСТРОЙКИ
 # ========================================
 
-__version__ = "3.3.0"
+__version__ = "3.6.0"
 
 # НАСТРОЙКА РЕЖИМА TWITTER
 TWITTER_MODE = "thread"  # "thread" или "single"
@@ -57,11 +74,9 @@ EMOJI_DETECTION_TEXT_LIMIT = 2000
 MIN_TWITTER_SPACE = 50
 MAX_TWITTER_LENGTH = 280
 MAX_TELEGRAM_LENGTH = 4000
+MAX_TELEGRAM_CAPTION_LENGTH = 1024  # Лимит caption в sendPhoto
 MAX_THREAD_TWEETS = 5  # Увеличено для Alpha Take (было 3)
 
-# Пауза между твитами
-TWEET_DELAY = 15  # секунды
-
 # Эмодзи для заголовков
 TITLE_EMOJI_MAP = {
     "Crypto Insights": "💡",
@@ -86,9 +101,21 @@ CONTEXT_PATTERNS = [
     ("defi|decentralized finance", "✨", 3),
 ]
 
-# Compiled regex
-CRYPTO_PRICE_PATTERN = re.compile(r'^[A-Z]{2,10}\s*\([+-]?\d')
-LIST_ITEM_PATTERN = re.compile(r'^[\-•\*]\s+|^\d+\.\s+')
+# Compiled regex (CRYPTO_PRICE_PATTERN - из answer_model)
+HTML_TAG_PATTERN = re.compile(r'<(/?)([a-zA-Z][a-zA-Z0-9-]*)[^>]*>')
+
+# Токены для разбивки сообщений: тег | entity | перевод(ы) строки | пробелы | слово | прочий символ
+TELEGRAM_TOKEN_PATTERN = re.compile(
+    r'(<(/?)([a-zA-Z][a-zA-Z0-9-]*)[^>]*>)'
+    r'|(&(?:#\d+|#x[0-9a-fA-F]+|[a-zA-Z]+);)'
+    r'|(\n[ \t]*\n[\s]*)'
+    r'|(\n[ \t]*)'
+    r'|([ \t]+)'
+    r'|([^\s<&]+)'
+    r'|(.)',
+    re.DOTALL
+)
+SENTENCE_END_PATTERN = re.compile(r'[.!?…:;]["»)\]]*$')
 
 # get_twitter_length импортируется из utils.py
 
@@ -105,7 +132,7 @@ def safe_str(value, default="", max_length=None):
     except Exception:
         return default
     if max_length and len(result) > max_length:
-        result = result[:max_length]
+        result = text_view(result).clip(max_length, suffix="")
     return result
 
 
@@ -163,31 +190,21 @@ def format_telegram_improved(title, text, hashtags):
         emoji = TITLE_EMOJI_MAP.get(title, "📰")
         header = f"{emoji} <b>{title}</b>"
         
-        lines = text.split('\n')
-        processed = []
-        line_count = 0
+        lines = parse_section(text).lines
+        if len(lines) > MAX_LINE_COUNT:
+            logger.warning(f"⚠️ Достигнут лимит строк ({MAX_LINE_COUNT})")
+            lines = lines[:MAX_LINE_COUNT]
         
+        processed = []
         for line in lines:
-            if line_count >= MAX_LINE_COUNT:
-                logger.warning(f"⚠️ Достигнут лимит строк ({MAX_LINE_COUNT})")
-                break
-            
-            line = line.strip()
-            if not line:
-                continue
-            
-            line_count += 1
-            
-            if CRYPTO_PRICE_PATTERN.match(line):
-                price_emoji = detect_price_change_emoji(line)
-                processed.append(f"{price_emoji} {line}")
-            elif LIST_ITEM_PATTERN.match(line):
-                clean = LIST_ITEM_PATTERN.sub('', line)
-                processed.append(f"• {clean}")
-            elif line.endswith((':','–','—')) and len(line) < 50:
-                processed.append(f"<b>{line}</b>")
+            if line.kind == "price":
+                processed.append(f"{detect_price_change_emoji(line.text)} {line.text}")
+            elif line.kind == "bullet":
+                processed.append(f"• {line.content}")
+            elif line.kind == "heading":
+                processed.append(f"<b>{line.text}</b>")
             else:
-                processed.append(line)
+                processed.append(line.text)
         
         formatted = '\n\n'.join(processed)
         message = f"{header}\n\n{formatted}"
@@ -197,7 +214,7 @@ def format_telegram_improved(title, text, hashtags):
         
         if len(message) > MAX_TELEGRAM_LENGTH:
             logger.warning(f"⚠️ Сообщение слишком длинное ({len(message)}), обрезаю")
-            message = message[:MAX_TELEGRAM_LENGTH-3] + "..."
+            message = text_view(message).clip(MAX_TELEGRAM_LENGTH)
         
         duration = time.time() - start_time
         if duration > 0.5:
@@ -207,7 +224,245 @@ def format_telegram_improved(title, text, hashtags):
         
     except Exception as e:
         logger.error(f"✗ Ошибка в format_telegram_improved: {e}")
-        return f"<b>{safe_str(title, 'Update')}</b>\n\n{safe_str(text, 'No content')[:500]}"
+        return f"<b>{safe_str(title, 'Update')}</b>\n\n{safe_str(text, 'No content', 500)}"
+
+
+# ========================================
+# TELEGRAM: ПОДПИСЬ К ФОТО
+# ========================================
+
+def telegram_text_length(text):
+    """Длина как ее считает Telegram: видимый текст (без тегов) в UTF-16 units"""
+    if not text:
+        return 0
+    visible = html.unescape(HTML_TAG_PATTERN.sub('', text))
+    return len(visible.encode('utf-16-le')) // 2
+
+
+def _push_tags(stack, text):
+    """Дополняет стек открытых тегов тегами text; False если закрывающий тег без пары"""
+    for match in HTML_TAG_PATTERN.finditer(text):
+        closing, tag = match.group(1), match.group(2).lower()
+        if not closing:
+            stack.append(tag)
+        elif stack and stack[-1] == tag:
+            stack.pop()
+        else:
+            return False
+    return True
+
+
+def is_html_balanced(text):
+    """Проверяет что все HTML-теги закрыты (можно резать текст в этом месте)"""
+    stack = []
+    return _push_tags(stack, text) and not stack
+
+
+def _take_fitting_prefix(blocks, separator, limit):
+    """
+    Берет максимум блоков подряд, которые влезают в limit и не рвут теги.
+    Длина и стек тегов ведутся нарастающим итогом: каждый блок разбирается один раз.
+    """
+    taken = 0
+    separator_length = telegram_text_length(separator)
+    length = -separator_length
+    stack = []
+    for i, block in enumerate(blocks, 1):
+        length += separator_length + telegram_text_length(block)
+        if length > limit:
+            break
+        # Закрывающий тег без пары не исправит ни один следующий блок
+        if not _push_tags(stack, block):
+            break
+        if not stack:
+            taken = i
+    return taken
+
+
+def plan_photo_caption(caption, limit=MAX_TELEGRAM_CAPTION_LENGTH):
+    """
+    Планирует доставку: сколько текста уходит в caption к sendPhoto.
+    
+    Режем только на границах абзацев (затем строк) и только там,
+    где все HTML-теги закрыты.
+    
+    Returns:
+        tuple: (photo_caption или None, remainder или "")
+               remainder отправляется follow-up сообщениями
+    """
+    caption = (caption or "").strip()
+    if not caption:
+        return None, ""
+    
+    if telegram_text_length(caption) <= limit and is_html_balanced(caption):
+        return caption, ""
+    
+    paragraphs = caption.split('\n\n')
+    taken = _take_fitting_prefix(paragraphs, '\n\n', limit)
+    if taken:
+        head = '\n\n'.join(paragraphs[:taken])
+        rest = '\n\n'.join(paragraphs[taken:])
+        return head, rest.strip()
+    
+    # Первый абзац длиннее лимита - режем его по строкам
+    lines = paragraphs[0].split('\n')
+    taken = _take_fitting_prefix(lines, '\n', limit)
+    if taken:
+        head = '\n'.join(lines[:taken])
+        rest = '\n\n'.join(['\n'.join(lines[taken:])] + paragraphs[1:])
+        return head, rest.strip()
+    
+    # Нет безопасной точки разреза - фото без подписи, весь текст сообщением
+    return None, caption
+
+
+# ========================================
+# TELEGRAM: РАЗБИВКА ДЛИННЫХ СООБЩЕНИЙ
+# ========================================
+
+# Приоритеты точек разреза (чем меньше - тем лучше)
+BREAK_PARAGRAPH, BREAK_LINE, BREAK_SENTENCE, BREAK_WORD = range(4)
+SPLIT_PREFERRED_FILL = 0.5  # хороший разрез - не раньше половины лимита
+SPLIT_MIN_FILL = 0.25       # иначе любой разрез не раньше четверти, иначе по графеме
+
+
+def _utf16_length(text):
+    return len(text.encode('utf-16-le')) // 2
+
+
+def _tokenize_telegram_html(text):
+    """
+    Токены: (raw, weight, kind, value)
+    kind: 'open'/'close' (value = имя тега), 'space' (value = приоритет разреза), 'text'
+    weight - видимая длина в UTF-16 units (теги = 0)
+    """
+    tokens = []
+    previous_text = ""
+    for match in TELEGRAM_TOKEN_PATTERN.finditer(text):
+        tag, closing, tag_name, entity, paragraph, line, spaces, word, other = match.groups()
+        if tag:
+            kind = 'close' if closing else 'open'
+            tokens.append((tag, 0, kind, tag_name.lower()))
+        elif paragraph or line or spaces:
+            raw = paragraph or line or spaces
+            if paragraph:
+                level = BREAK_PARAGRAPH
+            elif line:
+                level = BREAK_LINE
+            elif SENTENCE_END_PATTERN.search(previous_text):
+                level = BREAK_SENTENCE
+            else:
+                level = BREAK_WORD
+            tokens.append((raw, _utf16_length(raw), 'space', level))
+        else:
+            raw = entity or word or other
+            weight = _utf16_length(html.unescape(entity)) if entity else _utf16_length(raw)
+            tokens.append((raw, weight, 'text', None))
+            previous_text = raw
+    return tokens
+
+
+def _split_text_token(token, budget):
+    """Режет слово длиннее лимита по границе графемы: (влезающий префикс, остаток)"""
+    raw = token[0]
+    taken, weight = 0, 0
+    for grapheme in split_graphemes(raw):
+        grapheme_weight = _utf16_length(grapheme)
+        if weight + grapheme_weight > budget:
+            break
+        taken += len(grapheme)
+        weight += grapheme_weight
+    if taken == 0:  # одна графема длиннее бюджета - выше не сделать
+        taken = len(split_graphemes(raw)[0])
+        weight = _utf16_length(raw[:taken])
+    head, tail = raw[:taken], raw[taken:]
+    return (head, weight, 'text', None), (tail, token[1] - weight, 'text', None)
+
+
+def _apply_tag(stack, token):
+    raw, _, kind, name = token
+    if kind == 'open':
+        stack.append((name, raw))
+    elif kind == 'close':
+        for depth in range(len(stack) - 1, -1, -1):
+            if stack[depth][0] == name:
+                del stack[depth:]
+                break
+
+
+def split_telegram_html(text, limit=MAX_TELEGRAM_LENGTH):
+    """
+    Разбивает HTML-сообщение Telegram на части не длиннее limit.
+    
+    - Длина = видимый текст в UTF-16 units (как считает Telegram)
+    - Разрез по абзацу, затем по строке, предложению, слову;
+      слово длиннее лимита режется по границе графемы
+    - Теги, открытые на месте разреза, закрываются в конце части
+      и переоткрываются (с теми же атрибутами) в начале следующей
+    - Один проход: каждый токен просматривается O(1) раз
+    
+    Returns:
+        list: части сообщения (пустые части не возвращаются)
+    """
+    tokens = _tokenize_telegram_html(text or "")
+    parts = []
+    stack = []  # открытые теги на начале текущей части: [(имя, raw)]
+    i = 0
+
+    while i < len(tokens):
+        part_stack = list(stack)
+        reopen = [raw for _, raw in part_stack]
+        weight = 0
+        breaks = {}  # приоритет -> (индекс space-токена, длина до него, стек тегов)
+        latest_break = None
+        j = i
+
+        while j < len(tokens):
+            token = tokens[j]
+            if token[2] == 'space':
+                latest_break = breaks[token[3]] = (j, weight, list(part_stack))
+            if weight + token[1] > limit:
+                break
+            weight += token[1]
+            _apply_tag(part_stack, token)
+            j += 1
+
+        if j == len(tokens):
+            body = [t[0] for t in tokens[i:j]]
+            end, end_stack, next_i = j, part_stack, j
+        else:
+            cut = None
+            for level in (BREAK_PARAGRAPH, BREAK_LINE, BREAK_SENTENCE, BREAK_WORD):
+                candidate = breaks.get(level)
+                if candidate and candidate[1] >= limit * SPLIT_PREFERRED_FILL:
+                    cut = candidate
+                    break
+            if cut is None and latest_break and latest_break[1] >= limit * SPLIT_MIN_FILL:
+                cut = latest_break
+
+            if cut:
+                end, _, end_stack = cut
+                body = [t[0] for t in tokens[i:end]]
+                next_i = end + 1  # пробелы на месте разреза выбрасываются
+            elif tokens[j][2] == 'text' and not tokens[j][0].startswith('&'):
+                # Разрезать негде - режем слово по графеме (entity целиком уходит в следующую часть)
+                head, tail = _split_text_token(tokens[j], limit - weight)
+                body = [t[0] for t in tokens[i:j]] + [head[0]]
+                end, end_stack, next_i = j, part_stack, j
+                tokens[j] = tail
+            else:
+                body = [t[0] for t in tokens[i:j]]
+                end, end_stack, next_i = j, part_stack, j + (tokens[j][2] == 'space')
+
+        closing = [f"</{name}>" for name, _ in reversed(end_stack)]
+        part = (''.join(reopen) + ''.join(body) + ''.join(closing)).strip()
+        if html.unescape(HTML_TAG_PATTERN.sub('', part)).strip():
+            parts.append(part)
+
+        stack = end_stack
+        i = next_i
+
+    return parts
 
 
 # ========================================
@@ -216,56 +471,22 @@ def format_telegram_improved(title, text, hashtags):
 
 def extract_bullet_points(text):
     """Извлекает пункты списка из текста"""
-    points = []
-    lines = text.split('\n')
-    
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-        
-        # Пропускаем Alpha Take и Context Tag
-        if line.startswith('Alpha Take') or line.startswith('Context:'):
-            continue
-        
-        if LIST_ITEM_PATTERN.match(line) or CRYPTO_PRICE_PATTERN.match(line):
-            clean = LIST_ITEM_PATTERN.sub('', line).strip()
-            if clean and len(clean) > 10:
-                points.append(clean)
-    
-    return points
+    return [line.content for line in parse_section(text).bullets]
 
 
 def extract_intro_sentence(text):
     """Извлекает первое предложение для intro"""
-    # Пропускаем Alpha Take если он в начале
-    lines = text.split('\n')
-    clean_text = []
-    skip_alpha = False
-    
-    for line in lines:
-        if 'Alpha Take' in line:
-            skip_alpha = True
-            continue
-        if skip_alpha and (line.startswith('Context:') or not line.strip()):
-            continue
-        if line.strip():
-            clean_text.append(line)
-            break
-    
-    if not clean_text:
-        return text[:100]
+    # Первая строка контента (Alpha Take и его Context пропускаются)
+    line = parse_section(text).intro_line()
+    if line is None:
+        return text_view(text).clip(100, suffix="")
     
-    first_line = clean_text[0]
-    match = re.match(r'^([^.!?]+[.!?])', first_line)
-    if match:
-        intro = match.group(1).strip()
-        if get_twitter_length(intro) <= 200:
-            return intro
+    first_line = line.raw
+    intro = first_sentence(first_line)
+    if intro and get_twitter_length(intro) <= 200:
+        return intro
     
-    if len(first_line) > 200:
-        return first_line[:197] + "..."
-    return first_line
+    return text_view(first_line).clip(200)
 
 
 def format_twitter_thread(title, text, hashtags, alpha_take=None, context_tag=None):
@@ -301,6 +522,7 @@ def format_twitter_thread(title, text, hashtags, alpha_take=None, context_tag=No
         
         emoji = TITLE_EMOJI_MAP.get(title, "📰")
         context_emojis = get_context_emojis(text, max_count=2)
+        section = parse_section(text)
         
         # ТВИТ 1: INTRO
         intro = extract_intro_sentence(text)
@@ -313,7 +535,7 @@ def format_twitter_thread(title, text, hashtags, alpha_take=None, context_tag=No
         
         if get_twitter_length(tweet1) > MAX_TWITTER_LENGTH:
             max_intro = MAX_TWITTER_LENGTH - get_twitter_length(f"{emoji} {title} {context_str}\n\n\n\n🧵👇") - 5
-            intro = text[:max_intro-3] + "..."
+            intro = truncate_by_weight(text, max_intro, level="grapheme")
             tweet1 = f"{emoji} {title}"
             if context_str:
                 tweet1 += f" {context_str}"
@@ -321,12 +543,12 @@ def format_twitter_thread(title, text, hashtags, alpha_take=None, context_tag=No
         
         tweets.append(tweet1)
         
-        # ТВИТЫ 2-N: СОБЫТИЯ/ПУНКТЫ
-        points = extract_bullet_points(text)
+        # ТВИТЫ 2-N: СОБЫТИЯ/ПУНКТЫ: (текст, строка цены)
+        points = [(line.content, line.price) for line in section.bullets]
         
         if not points:
-            sentences = re.split(r'(?<=[.!?])\s+', text)
-            points = [s.strip() for s in sentences if len(s.strip()) > 20][:5]
+            points = [(s, bool(CRYPTO_PRICE_PATTERN.match(s)))
+                      for s in section.sentences if len(s) > 20][:5]
         
         if points and len(points) >= 1:
             # Группируем пункты по твитам (2-3 на твит)
@@ -337,25 +559,24 @@ def format_twitter_thread(title, text, hashtags, alpha_take=None, context_tag=No
                 
                 # Берем 2-3 пункта пока влезает
                 while i < len(points) and len(batch) < 3:
-                    point = points[i]
+                    point, is_price = points[i]
                     
                     # Форматируем пункт
-                    if CRYPTO_PRICE_PATTERN.match(point):
+                    if is_price:
                         price_emoji = detect_price_change_emoji(point)
                         formatted = f"{price_emoji} {point}"
                     else:
                         formatted = f"• {point}"
                     
                     # Сокращаем длинные пункты
-                    if len(formatted) > 100:
-                        formatted = formatted[:97] + "..."
+                    formatted = text_view(formatted).clip(100)
                     
                     # Проверяем влезет ли
                     test_text = "\n\n".join(batch + [formatted])
                     if get_twitter_length(test_text) > MAX_TWITTER_LENGTH:
                         if len(batch) == 0:
                             # Даже один пункт не влезает - берем укороченный
-                            batch.append(formatted[:MAX_TWITTER_LENGTH-10] + "...")
+                            batch.append(truncate_by_weight(formatted, MAX_TWITTER_LENGTH, level="grapheme"))
                             i += 1
                         break
                     
@@ -378,7 +599,7 @@ def format_twitter_thread(title, text, hashtags, alpha_take=None, context_tag=No
             if get_twitter_length(final_tweet) > MAX_TWITTER_LENGTH:
                 # Сокращаем Alpha Take
                 max_alpha = MAX_TWITTER_LENGTH - get_twitter_length(f"◼ Alpha Take\n\n\n\nContext: {context_tag}\n\n{hashtags}") - 10
-                short_alpha = alpha_take[:max_alpha-3] + "..."
+                short_alpha = truncate_by_weight(alpha_take, max_alpha, level="grapheme")
                 final_tweet = f"◼ Alpha Take\n\n{short_alpha}"
                 if context_tag:
                     final_tweet += f"\n\nContext: {context_tag}"
@@ -404,7 +625,7 @@ def format_twitter_thread(title, text, hashtags, alpha_take=None, context_tag=No
         return None
 
 
-def format_twitter_single(title, text, hashtags, max_len=270):
+def format_twitter_single(title, text, hashtags, max_len=MAX_TWITTER_LENGTH):
     """Одиночный сокращенный твит"""
     try:
         title = safe_str(title, "Update", 50)
@@ -422,20 +643,20 @@ def format_twitter_single(title, text, hashtags, max_len=270):
         else:
             header = f"{emoji} {title}"
         
-        reserved = get_twitter_length(header) + get_twitter_length(hashtags) + 6
+        reserved = get_twitter_length(header) + get_twitter_length(hashtags) + 4
         available = max_len - reserved
         
         if available < MIN_TWITTER_SPACE:
             tags_list = hashtags.split()[:2]
             hashtags = " ".join(tags_list) if tags_list else ""
-            reserved = get_twitter_length(header) + get_twitter_length(hashtags) + 6
+            reserved = get_twitter_length(header) + get_twitter_length(hashtags) + 4
             available = max_len - reserved
         
         short_text = extract_short_text_safe(text, available)
         tweet = f"{header}\n\n{short_text}\n\n{hashtags}"
         
         if get_twitter_length(tweet) > MAX_TWITTER_LENGTH:
-            tweet = tweet[:277] + "..."
+            tweet = truncate_by_weight(tweet, MAX_TWITTER_LENGTH, level="grapheme")
         
         return tweet
         
@@ -449,35 +670,8 @@ def extract_short_text_safe(text, max_length):
     if not text or max_length < 10:
         return ""
     
-    text = text.strip()
-    if get_twitter_length(text) <= max_length:
-        return text
-    
-    result = []
-    current = ""
-    char_count = 0
-    max_chars = min(len(text), max_length * 2)
-    
-    for char in text[:max_chars]:
-        current += char
-        char_count += 1
-        
-        if char in '.!?' and char_count > 20:
-            if get_twitter_length(current) <= max_length:
-                result.append(current.strip())
-                current = ""
-            else:
-                break
-        
-        if len(result) >= 3:
-            break
-    
-    if result:
-        final = " ".join(result)
-        if get_twitter_length(final) <= max_length:
-            return final
-    
-    return text[:max_length-3] + "..."
+    # Целые предложения, иначе по словам / графемам с "..."
+    return truncate_by_weight(text.strip(), max_length, level="sentence")
 
 
 # ========================================
@@ -559,7 +753,7 @@ def send_improved(question, answer,
                 
         except Exception as e:
             logger.error(f"  ✗ Ошибка TG: {e}")
-            tg_message = f"<b>{title}</b>\n\n{tldr_text[:500]}\n\n{hashtags}"
+            tg_message = f"<b>{title}</b>\n\n{text_view(tldr_text).clip(500, suffix='')}\n\n{hashtags}"
         
         # 5. Картинка
         image_url = None
@@ -639,3 +833,99 @@ def send_improved(question, answer,
         import traceback
         logger.error(traceback.format_exc())
         return False
+
+
+# ══════════════════════════════════════════════════════════════════
+# ТЕСТЫ И БЕНЧМАРК (для отладки): python formatting.py [--benchmark]
+# ══════════════════════════════════════════════════════════════════
+
+def _styled_graphemes(text):
+    """Видимые графемы (без пробелов) с набором тегов, внутри которых они стоят"""
+    result = []
+    stack = []
+    for token in _tokenize_telegram_html(text):
+        if token[2] in ('open', 'close'):
+            _apply_tag(stack, token)
+        elif token[2] == 'text':
+            styles = tuple(raw for _, raw in stack)
+            visible = html.unescape(token[0]) if token[0].startswith('&') else token[0]
+            result.extend((grapheme, styles) for grapheme in split_graphemes(visible))
+    return result
+
+
+def _random_telegram_html(rng, paragraphs):
+    """Случайный HTML в подмножестве Telegram: вложенные теги, entity, emoji, длинные слова"""
+    words = ["Bitcoin", "ETH", "rally", "liquidations", "&amp;", "&lt;3", "🚀", "👨‍👩‍👧", "🇺🇸",
+             "1️⃣", "👍🏽", "Привет", "mañana", "x" * 120, "end.", "why?", "wow!"]
+    tags = ['<b>', '<i>', '<u>', '<code>', '<a href="https://coinmarketcap.com/?a=1&amp;b=2">']
+    out = []
+    for _ in range(paragraphs):
+        sentence = []
+        open_tags = []
+        for _ in range(rng.randint(5, 60)):
+            if rng.random() < 0.15 and len(open_tags) < 3:
+                tag = rng.choice(tags)
+                open_tags.append(tag[1:].split('>')[0].split(' ')[0])
+                sentence.append(tag)
+            sentence.append(rng.choice(words))
+            if open_tags and rng.random() < 0.2:
+                sentence.append(f"</{open_tags.pop()}>")
+            sentence.append(rng.choice([" ", " ", " ", "\n"]))
+        sentence.extend(f"</{name}>" for name in reversed(open_tags))
+        out.append(''.join(sentence))
+    return '\n\n'.join(out)
+
+
+def _test(iterations=300):
+    """Property-проверки split_telegram_html на случайных входах."""
+    import random
+    
+    rng = random.Random(42)
+    failures = []
+    for iteration in range(iterations):
+        text = _random_telegram_html(rng, rng.randint(1, 12))
+        limit = rng.choice([16, 50, 200, 1024, 4000])
+        parts = split_telegram_html(text, limit)
+        
+        checks = {
+            "длина <= limit": all(telegram_text_length(p) <= limit for p in parts),
+            "теги сбалансированы": all(is_html_balanced(p) for p in parts),
+            "текст и стили сохранены": (
+                [g for p in parts for g in _styled_graphemes(p)] == _styled_graphemes(text)
+            ),
+            "без пустых частей": all(p.strip() for p in parts),
+        }
+        for name, ok in checks.items():
+            if not ok:
+                failures.append((iteration, limit, name))
+    
+    print(f"split_telegram_html: {iterations} случайных входов")
+    for iteration, limit, name in failures[:10]:
+        print(f"  ✗ #{iteration} (limit {limit}): {name}")
+    print(f"All tests passed: {'✓ YES' if not failures else '✗ NO'}")
+    return not failures
+
+
+def _benchmark():
+    """Время разбивки больших сообщений: рост должен быть линейным."""
+    import random
+    
+    rng = random.Random(7)
+    chunk = _random_telegram_html(rng, 40)
+    for repeat in (1, 10, 100):
+        text = '\n\n'.join([chunk] * repeat)
+        start = time.perf_counter()
+        parts = split_telegram_html(text)
+        elapsed = time.perf_counter() - start
+        size_kb = len(text.encode('utf-8')) / 1024
+        print(f"  {size_kb:9.1f} KB -> {len(parts):5d} частей за {elapsed * 1000:8.1f} ms "
+              f"({elapsed * 1e6 / size_kb:.0f} µs/KB)")
+
+
+if __name__ == "__main__":
+    import sys
+    
+    if '--benchmark' in sys.argv:
+        _benchmark()
+    else:
+        sys.exit(0 if _test() else 1)
@@ -0,0 +1,243 @@
+"""
+image_catalog.py - Локальный каталог картинок (Images1/manifest.json)
+Version: 1.0.0
+
+- Манифест строится один раз из Images1/: имя, размер, ширина/высота, sha256
+- Выбор и проверка картинок - по манифесту, без HEAD-запросов к GitHub
+- Размеры JPEG читаются из заголовка SOF (без Pillow)
+- ImageBag: перемешанный "мешок" картинок, сохраняемый между запусками -
+  без повторов в пределах окна и без отсутствующих файлов
+
+Пересборка манифеста после добавления картинок:
+    python image_catalog.py
+Проверка манифеста против папки:
+    python image_catalog.py --check
+"""
+
+import os
+import sys
+import json
+import random
+import struct
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+IMAGES_DIR = os.getenv('IMAGES_DIR', 'Images1')
+MANIFEST_NAME = 'manifest.json'
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg')
+IMAGE_NO_REPEAT_WINDOW = int(os.getenv('IMAGE_NO_REPEAT_WINDOW', '50'))
+
+# Маркеры JPEG Start Of Frame (кроме DHT C4, JPG C8, DAC CC)
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def jpeg_dimensions(data):
+    """(ширина, высота) из заголовка JPEG или (None, None)"""
+    if data[:2] != b'\xff\xd8':
+        return None, None
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            pos += 1
+            continue
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            pos += 2
+            continue
+        segment_length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+        if marker in SOF_MARKERS and pos + 9 <= len(data):
+            height, width = struct.unpack('>HH', data[pos + 5:pos + 9])
+            return width, height
+        pos += 2 + segment_length
+    return None, None
+
+
+def manifest_path(images_dir=IMAGES_DIR):
+    return os.path.join(images_dir, MANIFEST_NAME)
+
+
+def image_sort_key(name):
+    stem = os.path.splitext(name)[0]
+    return (0, int(stem), name) if stem.isdigit() else (1, 0, name)
+
+
+def build_manifest(images_dir=IMAGES_DIR):
+    """Сканирует папку и возвращает манифест (dict)"""
+    images = []
+    names = [n for n in os.listdir(images_dir) if n.lower().endswith(IMAGE_EXTENSIONS)]
+    for name in sorted(names, key=image_sort_key):
+        with open(os.path.join(images_dir, name), 'rb') as f:
+            data = f.read()
+        width, height = jpeg_dimensions(data)
+        images.append({
+            "name": name,
+            "size": len(data),
+            "width": width,
+            "height": height,
+            "sha256": hashlib.sha256(data).hexdigest()
+        })
+    return {"version": 1, "images": images}
+
+
+def write_manifest(manifest, images_dir=IMAGES_DIR):
+    path = manifest_path(images_dir)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+        f.write('\n')
+    os.replace(tmp_path, path)
+    return path
+
+
+class ImageCatalog:
+    """Загруженный манифест: список картинок и индекс по имени."""
+
+    def __init__(self, manifest, images_dir=IMAGES_DIR):
+        self.images_dir = images_dir
+        self.images = manifest.get("images", [])
+        self.by_name = {image["name"]: image for image in self.images}
+
+    @property
+    def names(self):
+        return [image["name"] for image in self.images]
+
+    def __len__(self):
+        return len(self.images)
+
+    def __contains__(self, name):
+        return name in self.by_name
+
+    def get(self, name):
+        return self.by_name.get(name)
+
+    def verify(self, names=None):
+        """
+        Сверяет манифест с файлами (наличие и размер через stat, без чтения).
+
+        Returns:
+            list: имена отсутствующих или измененных картинок
+        """
+        problems = []
+        for name in names if names is not None else self.names:
+            image = self.by_name.get(name)
+            try:
+                size = os.stat(os.path.join(self.images_dir, name)).st_size
+            except OSError:
+                size = None
+            if image is None or size != image["size"]:
+                problems.append(name)
+        return problems
+
+
+class ImageBag:
+    """
+    Shuffle-bag выбора картинок: каждая картинка выпадает один раз за проход
+    по каталогу, а последние `window` картинок не повторяются и на стыке проходов.
+    Состояние - JSON {"bag": [...], "recent": [...]}, выбор - pop() за O(1).
+    """
+
+    def __init__(self, path, catalog, window=IMAGE_NO_REPEAT_WINDOW, rng=None):
+        self.path = path
+        self.catalog = catalog
+        self.window = max(0, min(window, len(catalog) - 1))
+        self.rng = rng or random.Random()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        self.bag = state.get("bag", [])
+        self.recent = state.get("recent", [])[-self.window:] if self.window else []
+
+    def _refill(self):
+        """Новый проход: недавние кладутся на дно мешка, чтобы выпасть последними"""
+        recent = set(self.recent)
+        fresh = [name for name in self.catalog.names if name not in recent]
+        held_back = [name for name in self.catalog.names if name in recent]
+        self.rng.shuffle(fresh)
+        self.rng.shuffle(held_back)
+        self.bag = held_back + fresh
+
+    def draw(self):
+        """Следующая картинка (имя файла) или None, если ни одной нет на диске"""
+        refilled = False
+        while True:
+            if not self.bag:
+                if refilled:
+                    return None
+                self._refill()
+                refilled = True
+                if not self.bag:
+                    return None
+
+            name = self.bag.pop()
+            # Удаленные из каталога и отсутствующие на диске - пропускаем
+            if name not in self.catalog or self.catalog.verify([name]):
+                continue
+
+            if self.window:
+                self.recent = (self.recent + [name])[-self.window:]
+            self.save()
+            return name
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"bag": self.bag, "recent": self.recent}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"⚠️ Не удалось сохранить {self.path}: {e}")
+
+
+_catalog = None
+
+
+def load_catalog(images_dir=IMAGES_DIR):
+    """
+    Возвращает каталог картинок (манифест читается один раз на процесс).
+    Если манифеста нет - строит его в памяти со сканированием папки.
+    """
+    global _catalog
+    if _catalog is not None and _catalog.images_dir == images_dir:
+        return _catalog
+
+    try:
+        with open(manifest_path(images_dir), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        logger.warning(f"⚠️ Нет {manifest_path(images_dir)}, сканирую папку (python image_catalog.py)")
+        manifest = build_manifest(images_dir) if os.path.isdir(images_dir) else {"images": []}
+
+    _catalog = ImageCatalog(manifest, images_dir)
+    return _catalog
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    images_dir = IMAGES_DIR
+
+    if '--check' in argv:
+        catalog = load_catalog(images_dir)
+        on_disk = {n for n in os.listdir(images_dir) if n.lower().endswith(IMAGE_EXTENSIONS)}
+        problems = catalog.verify() + sorted(on_disk - set(catalog.names))
+        if problems:
+            print(f"✗ Манифест устарел: {', '.join(problems[:10])}")
+            return 1
+        print(f"✓ Манифест актуален ({len(catalog)} картинок)")
+        return 0
+
+    manifest = build_manifest(images_dir)
+    path = write_manifest(manifest, images_dir)
+    total_kb = sum(image["size"] for image in manifest["images"]) // 1024
+    print(f"✓ {path}: {len(manifest['images'])} картинок, {total_kb} KB")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,242 @@
+"""
+image_variants.py - Заранее подготовленные картинки под каждую платформу
+Version: 1.1.0
+
+- Из каждой Images1/*.jpg рендерится вариант под Telegram и Twitter
+  (максимальная сторона + качество JPEG) в Images1/variants/<платформа>/
+- Если перекодирование не уменьшает файл - файл варианта не пишется,
+  в index.json отмечается "original" и публикуется оригинал
+- Пересборка инкрементальная: рендерится только то, у чего изменился sha256
+- Варианты коммитятся в этот репозиторий (шаг CI "Build image variants"
+  пушит новые до публикации): Telegram берет фото по raw-URL этого
+  репозитория (GITHUB_REPOSITORY), без него публикуется оригинал
+
+Пересборка (нужен Pillow):
+    python image_variants.py            # только новые/измененные
+    python image_variants.py --force    # все заново
+    python image_variants.py --benchmark
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import logging
+
+from utils import lazy_import
+import image_catalog
+
+logger = logging.getLogger(__name__)
+
+# Pillow нужен только для пересборки, при публикации - нет
+PIL_Image = lazy_import('PIL.Image')
+PIL_ImageOps = lazy_import('PIL.ImageOps')
+
+VARIANTS_DIRNAME = 'variants'
+INDEX_NAME = 'index.json'
+
+# Варианты лежат в этом репозитории, а не там, откуда берутся оригиналы
+# (GITHUB_IMAGES_URL в parser.py). В GitHub Actions оба значения заданы
+GITHUB_REPOSITORY = os.getenv('GITHUB_REPOSITORY')
+GITHUB_REF_NAME = os.getenv('GITHUB_REF_NAME', 'main')
+
+# Telegram пережимает фото до 1280 по большей стороне,
+# Twitter показывает в ленте до ~1200 и тоже перекодирует
+PLATFORM_PROFILES = {
+    "telegram": {"max_side": 1280, "quality": 82},
+    "twitter": {"max_side": 1200, "quality": 85},
+}
+
+
+def variants_dir(images_dir=image_catalog.IMAGES_DIR):
+    return os.path.join(images_dir, VARIANTS_DIRNAME)
+
+
+def render_variant(data, profile):
+    """
+    Перекодирует JPEG под профиль платформы.
+
+    Returns:
+        tuple: (bytes, ширина, высота) - меньший из варианта и оригинала
+        (при оригинале возвращается тот же объект data)
+    """
+    with PIL_Image.open(io.BytesIO(data)) as source:
+        original_size = source.size
+        image = PIL_ImageOps.exif_transpose(source)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.thumbnail((profile["max_side"], profile["max_side"]), PIL_Image.LANCZOS)
+
+        out = io.BytesIO()
+        image.save(out, format='JPEG', quality=profile["quality"], optimize=True, progressive=True)
+        rendered = out.getvalue()
+
+    fits = max(original_size) <= profile["max_side"]
+    if fits and len(rendered) >= len(data):
+        return data, original_size[0], original_size[1]
+    return rendered, image.size[0], image.size[1]
+
+
+class VariantIndex:
+    """index.json: {платформа: {имя: {source_sha256, size, width, height[, original]}}}"""
+
+    def __init__(self, images_dir=image_catalog.IMAGES_DIR):
+        self.images_dir = images_dir
+        self.path = os.path.join(variants_dir(images_dir), INDEX_NAME)
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def relative_path(self, platform_name, name):
+        return f"{VARIANTS_DIRNAME}/{platform_name}/{name}"
+
+    def lookup(self, platform_name, name, source_sha256=None):
+        """Относительный путь варианта или None (нет/устарел/не меньше оригинала)"""
+        entry = self.entries.get(platform_name, {}).get(name)
+        if not entry or entry.get("original"):
+            return None
+        if source_sha256 and entry["source_sha256"] != source_sha256:
+            return None
+        return self.relative_path(platform_name, name)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+            f.write('\n')
+        os.replace(tmp_path, self.path)
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def build_variants(images_dir=image_catalog.IMAGES_DIR, force=False):
+    """
+    Рендерит недостающие и устаревшие варианты.
+
+    Returns:
+        dict: {платформа: {"rendered", "skipped", "source_bytes", "variant_bytes", "seconds"}}
+    """
+    catalog = image_catalog.load_catalog(images_dir)
+    index = VariantIndex(images_dir)
+    stats = {}
+
+    for platform_name, profile in PLATFORM_PROFILES.items():
+        target_dir = os.path.join(variants_dir(images_dir), platform_name)
+        os.makedirs(target_dir, exist_ok=True)
+        platform_entries = index.entries.setdefault(platform_name, {})
+        s = stats[platform_name] = {"rendered": 0, "skipped": 0, "source_bytes": 0, "variant_bytes": 0, "seconds": 0.0}
+        start = time.monotonic()
+
+        for image in catalog.images:
+            name = image["name"]
+            target_path = os.path.join(target_dir, name)
+            entry = platform_entries.get(name)
+            s["source_bytes"] += image["size"]
+
+            if (not force and entry and entry["source_sha256"] == image["sha256"]
+                    and (entry.get("original") or os.path.isfile(target_path))):
+                s["skipped"] += 1
+                s["variant_bytes"] += entry["size"]
+                continue
+
+            with open(os.path.join(images_dir, name), 'rb') as f:
+                source = f.read()
+            data, width, height = render_variant(source, profile)
+
+            platform_entries[name] = {
+                "source_sha256": image["sha256"],
+                "size": len(data),
+                "width": width,
+                "height": height
+            }
+            if data is source:
+                # Копию оригинала не храним: публикуется сам оригинал
+                platform_entries[name]["original"] = True
+                _remove_file(target_path)
+            else:
+                with open(target_path, 'wb') as f:
+                    f.write(data)
+            s["rendered"] += 1
+            s["variant_bytes"] += len(data)
+
+        # Варианты удаленных картинок
+        for name in [n for n in platform_entries if n not in catalog]:
+            del platform_entries[name]
+            _remove_file(os.path.join(target_dir, name))
+
+        s["seconds"] = time.monotonic() - start
+
+    index.save()
+    return stats
+
+
+def print_benchmark(stats):
+    """Сколько байт экономят варианты по сравнению с оригиналами"""
+    for platform_name, s in stats.items():
+        saved = s["source_bytes"] - s["variant_bytes"]
+        percent = 100.0 * saved / s["source_bytes"] if s["source_bytes"] else 0.0
+        count = s["rendered"] + s["skipped"]
+        print(f"{platform_name:9s} {count} картинок: {s['source_bytes'] / 1024:,.0f} KB -> "
+              f"{s['variant_bytes'] / 1024:,.0f} KB (-{percent:.1f}%, "
+              f"в среднем -{saved / max(count, 1) / 1024:.1f} KB на пост), "
+              f"отрендерено {s['rendered']} за {s['seconds']:.1f}s")
+
+
+_index = None
+
+
+def variants_base_url(images_dir=image_catalog.IMAGES_DIR):
+    """raw-URL папки с картинками в этом репозитории или None вне GitHub Actions"""
+    if not GITHUB_REPOSITORY:
+        return None
+    folder = os.path.basename(os.path.normpath(images_dir))
+    return f"https://raw.githubusercontent.com/{GITHUB_REPOSITORY}/{GITHUB_REF_NAME}/{folder}"
+
+
+def platform_image_url(platform_name, image_url, images_dir=image_catalog.IMAGES_DIR):
+    """
+    Подменяет URL оригинала на URL варианта платформы, если вариант
+    есть в index.json, собран из текущей версии картинки и его файл
+    лежит в checkout этого репозитория - тогда он закоммичен и доступен
+    по raw-URL репозитория (GITHUB_REPOSITORY). Иначе - URL оригинала.
+    """
+    global _index
+    base = variants_base_url(images_dir)
+    if not image_url or not base:
+        return image_url
+
+    name = image_url.rpartition('/')[2]
+    image = image_catalog.load_catalog(images_dir).get(name)
+    if image is None:
+        return image_url
+
+    if _index is None:
+        _index = VariantIndex(images_dir)
+    relative = _index.lookup(platform_name, name, image["sha256"])
+    if not relative or not os.path.isfile(os.path.join(images_dir, *relative.split('/'))):
+        return image_url
+    return f"{base}/{relative}"
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    stats = build_variants(force='--force' in argv)
+    if '--benchmark' in argv:
+        print_benchmark(stats)
+    else:
+        for platform_name, s in stats.items():
+            print(f"✓ {platform_name}: отрендерено {s['rendered']}, без изменений {s['skipped']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -17,30 +17,48 @@ Version: 3.0.0 - Actionable insights, not summaries
 
 import os
 import logging
-import re
-from openai import OpenAI
 
 # Импорт общих утилит
-from utils import get_twitter_length, safe_truncate, sanitize_hashtags
+from utils import (get_twitter_length, safe_truncate, truncate_by_weight, sanitize_hashtags, lazy_import,
+                   text_view, MAX_TWEET_LENGTH)
+from text_cleaning import INTRO_CLEANER
 
 logger = logging.getLogger(__name__)
 
 # get_twitter_length и safe_truncate импортируются из utils.py
 
+# SDK грузится лениво - import этого модуля не тянет openai/httpx
+openai = lazy_import('openai')
+
 # OpenAI API Key
 OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
 
-# Инициализация клиента
-client = None
-if OPENAI_API_KEY:
+# Клиент создается при первом использовании (get_openai_client)
+_client = None
+_client_initialized = False
+
+
+def get_openai_client():
+    """
+    Возвращает OpenAI клиент, создавая его при первом вызове.
+    None если нет ключа или инициализация не удалась (повторно не пытается).
+    """
+    global _client, _client_initialized
+    if _client_initialized:
+        return _client
+    
+    _client_initialized = True
+    if not OPENAI_API_KEY:
+        logger.warning("⚠️ OPENAI_API_KEY not found - Alpha Take generation disabled")
+        return None
+    
     try:
-        client = OpenAI(api_key=OPENAI_API_KEY)
+        _client = openai.OpenAI(api_key=OPENAI_API_KEY)
         logger.info("✓ OpenAI client initialized for CMC AI v3.0.0")
     except Exception as e:
         logger.error(f"✗ Failed to initialize OpenAI client: {e}")
-        client = None
-else:
-    logger.warning("⚠️ OPENAI_API_KEY not found - Alpha Take generation disabled")
+        _client = None
+    return _client
 
 
 # MASTER PROMPT для CMC AI новостей - v3.0.0
@@ -153,6 +171,7 @@ def get_ai_alpha_take(news_text, question_context=""):
         }
         или None если ошибка
     """
+    client = get_openai_client()
     if not client:
         logger.warning("OpenAI client not initialized - skipping Alpha Take generation")
         return None
@@ -300,22 +319,8 @@ def enhance_caption_with_alpha_take(title, text, hashtags_fallback, ai_result):
         if alpha_start > 0:
             text = text[:alpha_start].strip()
     
-    # Убираем вводные строки CMC (все варианты)
-    import re
-    text = re.sub(
-        r"Here are the trending (?:narratives|cryptos) based on CoinMarketCap['\u2018\u2019\"]?s evolving (?:narrative|momentum) algorithm[^:]*:?\s*",
-        '',
-        text,
-        flags=re.IGNORECASE
-    )
-    
-    # Убираем "These are the upcoming crypto events..."
-    text = re.sub(
-        r"These are the upcoming crypto events that may impact crypto the most:?\s*",
-        '',
-        text,
-        flags=re.IGNORECASE
-    )
+    # Убираем вводные строки CMC (все варианты, один проход)
+    text, _ = INTRO_CLEANER.clean(text)
     
     # Также убираем "CONTEXT_TAG:" и "HASHTAGS:" если они в тексте
     if 'CONTEXT_TAG:' in text:
@@ -330,8 +335,7 @@ def enhance_caption_with_alpha_take(title, text, hashtags_fallback, ai_result):
     
     # Сокращаем оригинальный текст если добавляем Alpha Take
     max_original_text = 800
-    if len(text) > max_original_text:
-        text = text[:max_original_text-3] + "..."
+    text = text_view(text).clip(max_original_text)
     
     # Формируем enhanced caption (хэштеги ВВЕРХУ)
     caption = f"{hashtags}\n" if hashtags else ""
@@ -353,7 +357,7 @@ def enhance_caption_with_alpha_take(title, text, hashtags_fallback, ai_result):
         logger.warning(f"⚠️ Caption слишком длинный ({len(caption)}), сокращаю оригинальный текст")
         # Агрессивное сокращение
         max_original_text = 400
-        text = text[:max_original_text-3] + "..."
+        text = text_view(text).clip(max_original_text)
         
         caption = f"{hashtags}\n" if hashtags else ""
         caption += f"<b>{title}</b>\n\n"
@@ -381,9 +385,10 @@ def enhance_twitter_with_alpha_take(title, alpha_take, context_tag, hashtags):
     Returns:
         str: Twitter-formatted текст
     """
-    max_length = 270
+    max_length = MAX_TWEET_LENGTH
     
-    reserved = get_twitter_length(title) + get_twitter_length(hashtags) + 20
+    # Длина считается точно как в Twitter: резерв только под 4 перевода строки
+    reserved = get_twitter_length(title) + get_twitter_length(hashtags) + 4
     available_for_alpha = max_length - reserved
     
     if get_twitter_length(alpha_take) > available_for_alpha:
@@ -393,13 +398,13 @@ def enhance_twitter_with_alpha_take(title, alpha_take, context_tag, hashtags):
     
     tweet = f"{title}\n\n{short_alpha}\n\n{hashtags}"
     
-    if get_twitter_length(tweet) > 280:
-        tweet = safe_truncate(tweet, 280)
+    if get_twitter_length(tweet) > max_length:
+        tweet = safe_truncate(tweet, max_length)
     
     return tweet
 
 
-def optimize_tweet_for_twitter(title, alpha_take, hashtags, max_length=280):
+def optimize_tweet_for_twitter(title, alpha_take, hashtags, max_length=MAX_TWEET_LENGTH):
     """
     Оптимизирует твит под 280 символов используя AI
     
@@ -422,6 +427,7 @@ def optimize_tweet_for_twitter(title, alpha_take, hashtags, max_length=280):
     alpha_take = str(alpha_take).strip()
     hashtags = str(hashtags).strip() if hashtags else ""
     
+    client = get_openai_client()
     if not client:
         basic_tweet = f"{title}\n\n{alpha_take}\n\n{hashtags}"
         if get_twitter_length(basic_tweet) <= max_length:
@@ -439,7 +445,8 @@ def optimize_tweet_for_twitter(title, alpha_take, hashtags, max_length=280):
         
         title_safe = title.replace('"', "'")
         
-        ai_limit = 240
+        # Результат проверяется точным счетчиком и при необходимости обрезается
+        ai_limit = max_length
         
         prompt = f"""Optimize this crypto tweet to fit in {ai_limit} characters.
 
@@ -450,7 +457,7 @@ Rules:
 - Keep title: {title_safe}
 - Condense the main message from Alpha Take into 1-2 sentences maximum
 - Remove ALL hashtags if needed to fit the limit
-- Target length: 220-240 characters (aim for this range for safety)
+- Target length: {ai_limit - 20}-{ai_limit} characters
 - CRITICAL: Each emoji counts as 2 characters - avoid emoji if possible
 - Remove filler words: "however", "additionally", "furthermore", "meanwhile", etc
 - Use short words and direct language
@@ -488,11 +495,7 @@ Return ONLY the optimized tweet text, nothing else. No explanations."""
         final_length = get_twitter_length(optimized)
         if final_length > max_length:
             logger.error(f"  ✗ Still too long after truncate: {final_length} chars!")
-            while get_twitter_length(optimized) > max_length and len(optimized) > 0:
-                optimized = optimized[:-1]
-            optimized = optimized.rstrip()
-            if get_twitter_length(optimized + "...") <= max_length:
-                optimized = optimized + "..."
+            optimized = truncate_by_weight(optimized, max_length, level="grapheme")
         
         logger.info(f"✓ Tweet optimized: {get_twitter_length(initial_tweet)} → {get_twitter_length(optimized)} chars")
         return optimized
@@ -0,0 +1,249 @@
+"""
+outbox.py - Надежная очередь публикаций (SQLite outbox)
+Version: 1.1.0
+
+- Готовые (отрендеренные) посты пишутся в outbox до отправки
+- Доставка с повторами и экспоненциальным backoff
+- Idempotency key: один и тот же пост не ставится в очередь и не отправляется дважды
+- Неотправленное переживает перезапуск процесса и доставляется в следующем запуске
+- RetryLater: handler просит повторить не раньше указанного времени (например reset
+  rate limit) - это не считается неудачной попыткой
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+from contextlib import closing
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_PATH = os.getenv('OUTBOX_PATH', 'outbox.db')
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '6'))
+OUTBOX_BACKOFF_BASE = 30       # секунд; задержка = base * 2^(attempts-1)
+OUTBOX_BACKOFF_MAX = 3600
+OUTBOX_SENDING_LEASE = 600     # "sending" дольше этого = процесс упал посреди отправки
+OUTBOX_RETENTION_DAYS = 14
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    platform TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    sent_at REAL
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at);
+"""
+
+
+class RetryLater(Exception):
+    """Доставка сейчас невозможна (лимит платформы) - повторить через delay секунд"""
+
+    def __init__(self, delay, reason="rate limit"):
+        super().__init__(f"{reason}, повтор через {delay:.0f}s")
+        self.delay = max(0.0, delay)
+        self.reason = reason
+
+
+def make_idempotency_key(platform, payload):
+    """Ключ = платформа + хэш содержимого поста"""
+    digest = hashlib.sha256(
+        json.dumps(payload, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    ).hexdigest()[:32]
+    return f"{platform}:{digest}"
+
+
+def backoff_delay(attempts):
+    """Экспоненциальная задержка перед следующей попыткой"""
+    return min(OUTBOX_BACKOFF_BASE * (2 ** max(0, attempts - 1)), OUTBOX_BACKOFF_MAX)
+
+
+class Outbox:
+    """SQLite outbox. Соединение открывается на каждую операцию - безопасно из разных потоков."""
+
+    def __init__(self, path=OUTBOX_PATH):
+        self.path = path
+        self._initialized = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        if not self._initialized:
+            conn.executescript(SCHEMA)
+            self._initialized = True
+        return conn
+
+    def enqueue(self, platform, payload, idempotency_key=None, not_before=None):
+        """
+        Кладет пост в очередь.
+
+        Args:
+            not_before: unix-время, раньше которого пост не отправлять (опционально)
+
+        Returns:
+            tuple: (idempotency_key, created) - created=False если такой пост уже был
+        """
+        key = idempotency_key or make_idempotency_key(platform, payload)
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO outbox "
+                "(idempotency_key, platform, payload, next_attempt_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, platform, json.dumps(payload, ensure_ascii=False), max(now, not_before or 0), now, now)
+            )
+            created = cursor.rowcount == 1
+        if created:
+            logger.info(f"📮 Outbox: {platform} пост в очереди ({key})")
+        else:
+            logger.info(f"📮 Outbox: {platform} пост уже в очереди/отправлен ({key})")
+        return key, created
+
+    def status(self, idempotency_key):
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT status FROM outbox WHERE idempotency_key = ?", (idempotency_key,)
+            ).fetchone()
+        return row["status"] if row else None
+
+    def pending_count(self, due_only=True):
+        """Сколько постов ждут доставки (без создания файла, если его нет)"""
+        if not os.path.exists(self.path):
+            return 0
+        query = "SELECT COUNT(*) FROM outbox WHERE status = 'pending'"
+        params = ()
+        if due_only:
+            query += " AND next_attempt_at <= ?"
+            params = (time.time(),)
+        with closing(self._connect()) as conn:
+            return conn.execute(query, params).fetchone()[0]
+
+    def _claim(self, conn, row_id):
+        """Атомарно переводит pending -> sending; False если уже забрал другой воркер"""
+        cursor = conn.execute(
+            "UPDATE outbox SET status = 'sending', updated_at = ? WHERE id = ? AND status = 'pending'",
+            (time.time(), row_id)
+        )
+        return cursor.rowcount == 1
+
+    def _recover_stale(self, conn):
+        """Возвращает в очередь посты, застрявшие в 'sending' после падения процесса"""
+        cutoff = time.time() - OUTBOX_SENDING_LEASE
+        cursor = conn.execute(
+            "UPDATE outbox SET status = 'pending', updated_at = ? WHERE status = 'sending' AND updated_at < ?",
+            (time.time(), cutoff)
+        )
+        if cursor.rowcount:
+            logger.warning(f"⚠️ Outbox: {cursor.rowcount} зависших отправок возвращены в очередь")
+
+    def drain(self, handlers, platform=None, idempotency_key=None):
+        """
+        Доставляет все готовые к отправке посты.
+
+        Args:
+            handlers: dict {платформа: fn(payload) -> bool}
+            platform: только эта платформа (опционально)
+            idempotency_key: только этот пост (опционально)
+
+        Returns:
+            dict: {"sent": n, "failed": n, "dead": n, "deferred": n}
+        """
+        summary = {"sent": 0, "failed": 0, "dead": 0, "deferred": 0}
+
+        with closing(self._connect()) as conn:
+            with conn:
+                self._recover_stale(conn)
+
+            query = "SELECT * FROM outbox WHERE status = 'pending' AND next_attempt_at <= ?"
+            params = [time.time()]
+            if platform:
+                query += " AND platform = ?"
+                params.append(platform)
+            if idempotency_key:
+                query += " AND idempotency_key = ?"
+                params.append(idempotency_key)
+            rows = conn.execute(query + " ORDER BY id", params).fetchall()
+
+            for row in rows:
+                handler = handlers.get(row["platform"])
+                if handler is None:
+                    continue
+                with conn:
+                    if not self._claim(conn, row["id"]):
+                        continue
+
+                error = None
+                retry_later = None
+                try:
+                    success = bool(handler(json.loads(row["payload"])))
+                except RetryLater as e:
+                    success, error, retry_later = False, str(e), e
+                except Exception as e:
+                    success, error = False, str(e)
+
+                now = time.time()
+                attempts = row["attempts"] + 1
+                with conn:
+                    if retry_later:
+                        # Лимит платформы - не ошибка доставки, попытку не засчитываем
+                        conn.execute(
+                            "UPDATE outbox SET status = 'pending', next_attempt_at = ?, updated_at = ?, last_error = ? "
+                            "WHERE id = ?",
+                            (now + retry_later.delay, now, error, row["id"])
+                        )
+                        summary["deferred"] += 1
+                        logger.info(f"⏳ Outbox: {row['platform']} отложен: {error}")
+                    elif success:
+                        conn.execute(
+                            "UPDATE outbox SET status = 'sent', attempts = ?, sent_at = ?, updated_at = ?, last_error = NULL "
+                            "WHERE id = ?",
+                            (attempts, now, now, row["id"])
+                        )
+                        summary["sent"] += 1
+                        logger.info(f"📬 Outbox: {row['platform']} доставлен (попытка {attempts})")
+                    elif attempts >= OUTBOX_MAX_ATTEMPTS:
+                        conn.execute(
+                            "UPDATE outbox SET status = 'dead', attempts = ?, updated_at = ?, last_error = ? WHERE id = ?",
+                            (attempts, now, error or "delivery failed", row["id"])
+                        )
+                        summary["dead"] += 1
+                        logger.error(f"✗ Outbox: {row['platform']} не доставлен после {attempts} попыток, снят с очереди")
+                    else:
+                        delay = backoff_delay(attempts)
+                        conn.execute(
+                            "UPDATE outbox SET status = 'pending', attempts = ?, next_attempt_at = ?, updated_at = ?, "
+                            "last_error = ? WHERE id = ?",
+                            (attempts, now + delay, now, error or "delivery failed", row["id"])
+                        )
+                        summary["failed"] += 1
+                        logger.warning(f"⚠️ Outbox: {row['platform']} ошибка (попытка {attempts}), повтор через {delay}s")
+
+        return summary
+
+    def purge(self, days=OUTBOX_RETENTION_DAYS):
+        """Удаляет старые доставленные и снятые с очереди записи"""
+        cutoff = time.time() - days * 86400
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "DELETE FROM outbox WHERE status IN ('sent', 'dead') AND updated_at < ?", (cutoff,)
+            )
+
+
+_outbox = None
+
+
+def get_outbox():
+    """Общий outbox процесса"""
+    global _outbox
+    if _outbox is None:
+        _outbox = Outbox()
+    return _outbox
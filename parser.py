@@ -11,23 +11,23 @@
 ✅ Bullish/Altcoins в расписании (NEW в v2.1.0)
 """
 
+import argparse
 import asyncio
-from playwright.async_api import async_playwright
-from bs4 import BeautifulSoup
+import signal
 import time
 import json
 import traceback
-from datetime import datetime, timezone
-import requests
+from datetime import datetime, timedelta, timezone
 import os
 import sys
 import random
 import logging
-import tweepy
-from io import BytesIO
 import tempfile
 import platform
 import re
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
 
 # Пытаемся импортировать fcntl (только Unix) - FIX BUG #15
 try:
@@ -38,17 +38,26 @@ except ImportError:
     # На Windows fcntl недоступен - используем альтернативный механизм
 
 # Импорт общих утилит (v2.1.0)
-from utils import get_twitter_length, safe_truncate, truncate_to_tweet_length
-
-# Импорт модуля улучшенного форматирования
-from formatting import send_improved, __version__ as formatting_version
-
-# Импорт OpenAI интеграции (NEW в v2.1.0)
-from openai_cmc_integration import (
-    get_ai_alpha_take,
-    enhance_caption_with_alpha_take,
-    optimize_tweet_for_twitter
-)
+from utils import get_twitter_length, truncate_by_weight, lazy_import, import_time_report, MAX_TWEET_LENGTH
+from text_cleaning import ANSWER_CLEANER, QUESTION_CLEANER, SENTIMENT_QUESTION_CLEANER
+
+# Тяжелые зависимости грузятся лениво: пустой слот (--plan / нет публикации)
+# завершается без импорта Playwright, BeautifulSoup, tweepy, requests и OpenAI
+playwright_api = lazy_import('playwright.async_api')
+bs4 = lazy_import('bs4')
+requests = lazy_import('requests')
+tweepy = lazy_import('tweepy')
+
+# Модуль улучшенного форматирования и OpenAI интеграция (NEW в v2.1.0)
+formatting = lazy_import('formatting')
+answer_model = lazy_import('answer_model')
+openai_integration = lazy_import('openai_cmc_integration')
+telegram_client = lazy_import('telegram_client')
+twitter_client = lazy_import('twitter_client')
+image_catalog = lazy_import('image_catalog')
+image_variants = lazy_import('image_variants')
+outbox = lazy_import('outbox')
+publish_ledger = lazy_import('publish_ledger')
 
 # Настройка логирования
 logging.basicConfig(
@@ -67,6 +76,12 @@ MAX_RETRIES = int(os.getenv('MAX_RETRIES', '2'))
 # Telegram настройки
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
+# Несколько каналов/групп: TELEGRAM_CHAT_IDS="-100111,-100222,@channel" (иначе TELEGRAM_CHAT_ID)
+TELEGRAM_CHAT_IDS = [
+    chat_id.strip()
+    for chat_id in (os.getenv('TELEGRAM_CHAT_IDS') or TELEGRAM_CHAT_ID or '').split(',')
+    if chat_id.strip()
+]
 
 # Twitter API настройки (только из Secrets)
 TWITTER_API_KEY = os.getenv('TWITTER_API_KEY')
@@ -84,7 +99,104 @@ OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 
 # GitHub настройки для картинок
 GITHUB_IMAGES_URL = "https://raw.githubusercontent.com/BRKME/Radar_CMC_AI/main/Images1/"
-IMAGE_FILES = [f"{i}.jpg" for i in range(10, 259)]  # 10.jpg до 258.jpg
+
+CMC_AI_URL = 'https://coinmarketcap.com/cmc-ai/ask/'
+
+# Сбор ответов на все вопросы за один запуск браузера (--harvest)
+MAX_PARALLEL_PAGES = int(os.getenv('MAX_PARALLEL_PAGES', '3'))
+HARVEST_PATH = os.getenv('HARVEST_PATH', 'harvested_answers.json')
+
+# Очередь картинок (рядом с publication_history.json, коммитится вместе с ней)
+IMAGE_BAG_PATH = os.getenv('IMAGE_BAG_PATH', 'image_bag.json')
+HARVEST_MAX_AGE_HOURS = float(os.getenv('HARVEST_MAX_AGE_HOURS', '24'))
+
+# Ожидание ответа CMC AI (MutationObserver в странице)
+# Селектор по префиксу класса - переживает смену CSS-хэша
+ASSISTANT_WRAPPER_SELECTOR = 'div[class*="MemoizedChatMessage_message-assistant-wrapper"]'
+QUESTION_CHIP_SELECTOR = 'div[class*="BaseChip_labelWrapper"]'
+ANSWER_MIN_LENGTH = 200
+ANSWER_IDLE_MS = 1500      # ответ считается готовым, если текст не растет столько мс
+ANSWER_TIMEOUT_MS = 30000  # общий лимит ожидания (раньше: 5 с + 25 попыток по 1 с)
+
+# JS-детектор завершения ответа: резолвится, когда появилось новое сообщение
+# ассистента (узлов больше, чем baseCount до клика), в нем есть TLDR и текст
+# перестал расти ANSWER_IDLE_MS миллисекунд
+ANSWER_WATCHER_JS = """
+({selector, baseCount, minLength, idleMs, timeoutMs}) => new Promise((resolve) => {
+    let lastText = null;
+    let idleTimer = null;
+    let deadline = null;
+    let observer = null;
+
+    const read = () => {
+        // Предыдущие ответы (узлы до клика) не считаются
+        const nodes = document.querySelectorAll(selector);
+        return nodes.length > baseCount ? nodes[nodes.length - 1].innerText || '' : '';
+    };
+
+    const finish = (complete) => {
+        if (observer) observer.disconnect();
+        clearTimeout(idleTimer);
+        clearTimeout(deadline);
+        resolve({
+            text: read(),
+            complete: complete,
+            fresh: document.querySelectorAll(selector).length > baseCount
+        });
+    };
+
+    const check = () => {
+        const text = read();
+        if (text === lastText) return;
+        lastText = text;
+        clearTimeout(idleTimer);
+        if (text.length > minLength && text.includes('TLDR')) {
+            idleTimer = setTimeout(() => finish(true), idleMs);
+        }
+    };
+
+    observer = new MutationObserver(check);
+    observer.observe(document.body, {childList: true, subtree: true, characterData: true});
+    deadline = setTimeout(() => finish(false), timeoutMs);
+    check();
+})
+"""
+
+# Число сообщений ассистента на странице - снимок до отправки вопроса
+ASSISTANT_COUNT_JS = "(selector) => document.querySelectorAll(selector).length"
+
+# Захват ответа из сети (page.on("response")) вместо чтения DOM
+# "network" - сначала JSON/SSE стрим бэкенда, DOM только как fallback; "dom" - только DOM
+ANSWER_CAPTURE_MODE = os.getenv('ANSWER_CAPTURE_MODE', 'network').lower()
+ANSWER_STREAM_URL_PATTERN = re.compile(
+    os.getenv('ANSWER_STREAM_URL_PATTERN', r'cmc-ai|/ai/|chat|completion|stream'),
+    re.IGNORECASE
+)
+ANSWER_STREAM_RESOURCE_TYPES = ('fetch', 'xhr', 'eventsource')
+ANSWER_STREAM_TEXT_KEYS = ('content', 'text', 'delta', 'answer', 'message', 'markdown')
+ANSWER_STREAM_START_TIMEOUT = 10  # секунд до первого payload'а с текстом ответа, иначе fallback на DOM
+ANSWER_STREAM_IDLE_TIMEOUT = 5    # секунд без новых payload'ов после начала ответа
+ANSWER_STREAM_TIMEOUT = 40        # жесткий лимит на весь стрим
+
+# Фильтр запросов Chromium (context.route): не качаем картинки, шрифты, рекламу и аналитику
+RESOURCE_BLOCKING_ENABLED = os.getenv('RESOURCE_BLOCKING_ENABLED', 'true').lower() == 'true'
+BLOCKED_RESOURCE_TYPES = {
+    t.strip() for t in os.getenv('BLOCKED_RESOURCE_TYPES', 'image,media,font').split(',') if t.strip()
+}
+# Домены, нужные чат-виджету (с поддоменами); все остальные считаются third-party
+ALLOWED_DOMAINS = tuple(
+    d.strip().lower() for d in os.getenv('ALLOWED_DOMAINS', 'coinmarketcap.com').split(',') if d.strip()
+)
+# Байты заблокированных запросов неизвестны (они не скачиваются) - оцениваем их по
+# среднему размеру ответа каждого типа из разового прогона без фильтра
+# (RESOURCE_BASELINE_RECORD=true: ничего не блокирует и перезаписывает файл)
+RESOURCE_BASELINE_PATH = os.getenv('RESOURCE_BASELINE_PATH', 'resource_baseline.json')
+RESOURCE_BASELINE_RECORD = os.getenv('RESOURCE_BASELINE_RECORD', 'false').lower() == 'true'
+
+# Сохраненное состояние браузера (cookies, localStorage, consent) между запусками
+STORAGE_STATE_PATH = os.getenv('STORAGE_STATE_PATH', 'browser_state.json')
+STORAGE_STATE_MAX_AGE_HOURS = float(os.getenv('STORAGE_STATE_MAX_AGE_HOURS', '72'))
+STORAGE_STATE_CONSENT_KEY = 'consent_at'  # время принятия cookie-баннера (unix), хранится в том же JSON
 
 # Расписание публикаций (час UTC : тип вопроса)
 # v2.1.0: Добавлены bullish (10:00) и altcoins (15:00)
@@ -115,6 +227,14 @@ SCHEDULE = {
     23: "narratives"     # 23:00
 }
 
+# Бюджет на import модулей проекта (--import-report), мс
+IMPORT_TIME_BUDGET_MS = float(os.getenv('IMPORT_TIME_BUDGET_MS', '300'))
+IMPORT_REPORT_MODULES = ['parser', 'formatting', 'openai_cmc_integration']
+
+# Режим --daemon: минута часа, в которую запускается слот (как cron '5 * * * *')
+DAEMON_SLOT_MINUTE = int(os.getenv('DAEMON_SLOT_MINUTE', '5'))
+OUTBOX_DRAIN_INTERVAL = 60  # секунд между проходами outbox-воркера в daemon
+
 # Группы вопросов (для обработки вариаций)
 QUESTION_GROUPS = {
     "market_direction": [
@@ -166,6 +286,16 @@ QUESTION_DISPLAY_CONFIG = {
     }
 }
 
+# Общая HTTP-сессия (keep-alive между запросами и слотами в режиме --daemon)
+_http_session = None
+
+def get_http_session():
+    """Возвращает общую requests.Session (создается при первом вызове)"""
+    global _http_session
+    if _http_session is None:
+        _http_session = requests.Session()
+    return _http_session
+
 def get_question_group(question_text):
     """Определяет к какой группе относится вопрос"""
     if not question_text:
@@ -286,22 +416,17 @@ def release_lock(lock_file, lock_path):
 
 def validate_telegram_credentials():
     """Проверяет что Telegram токены валидные - FIX BUG #20"""
-    if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
+    if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_IDS:
         logger.warning("⚠️ Telegram credentials не установлены")
         return False
     
     try:
-        # Тестовый запрос getMe
-        url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/getMe"
-        response = requests.get(url, timeout=5)
-        
-        if response.status_code != 200:
-            logger.error(f"✗ Telegram токен невалидный: {response.status_code}")
-            return False
+        # Тестовый запрос getMe (заодно прогревает соединение транспорта)
+        tg = get_telegram()
+        bot_info = tg.run(tg.call('getMe', timeout=5))
         
-        bot_info = response.json()
         if not bot_info.get('ok'):
-            logger.error("✗ Telegram токен невалидный")
+            logger.error(f"✗ Telegram токен невалидный: {bot_info.get('error_code')} - {bot_info.get('description')}")
             return False
         
         bot_username = bot_info.get('result', {}).get('username', 'unknown')
@@ -312,47 +437,34 @@ def validate_telegram_credentials():
         logger.error(f"✗ Ошибка проверки Telegram credentials: {e}")
         return False
 
-def validate_image_availability(sample_size=3):
-    """Проверяет что картинки доступны (выборочно) - FIX BUG #21, #25"""
-    if not IMAGE_FILES:
-        logger.warning("⚠️ Список картинок пуст")
+def validate_image_availability(sample_size=None):
+    """
+    Проверяет картинки по манифесту Images1/ (stat вместо HEAD-запросов) - FIX BUG #21, #25
+    
+    Args:
+        sample_size: проверить только N случайных картинок (None = все)
+    """
+    catalog = image_catalog.load_catalog()
+    if not len(catalog):
+        logger.warning("⚠️ Каталог картинок пуст")
         logger.warning("   Публикация будет без картинок (только текст)")
         return True  # Не критично, можно продолжать без картинок
     
-    logger.info(f"🔍 Проверка доступности картинок ({sample_size} из {len(IMAGE_FILES)})...")
-    
-    # Проверяем случайные картинки
-    sample = random.sample(IMAGE_FILES, min(sample_size, len(IMAGE_FILES)))
+    names = catalog.names
+    if sample_size:
+        names = random.sample(names, min(sample_size, len(names)))
     
-    if not sample:
-        logger.warning("⚠️ Нечего проверять")
-        return True
-    
-    failed = 0
-    for img in sample:
-        url = GITHUB_IMAGES_URL + img
-        try:
-            response = requests.head(url, timeout=5)
-            if response.status_code == 200:
-                logger.info(f"  ✓ {img}")
-            else:
-                logger.warning(f"  ⚠️ {img} - статус {response.status_code}")
-                failed += 1
-        except Exception as e:
-            logger.warning(f"  ✗ {img} - ошибка: {e}")
-            failed += 1
-    
-    if failed == len(sample):
-        logger.error("✗ Все проверенные картинки недоступны!")
-        logger.error(f"   Проверьте URL: {GITHUB_IMAGES_URL}")
+    missing = catalog.verify(names)
+    if len(missing) == len(names):
+        logger.error("✗ Ни одна картинка из манифеста не найдена!")
+        logger.error(f"   Проверьте {catalog.images_dir}/ и пересоберите манифест: python image_catalog.py")
         logger.warning("   Продолжаем без картинок (только текст)")
-        return True  # Не блокируем выполнение
-    elif failed > 0:
-        logger.warning(f"⚠️ {failed}/{len(sample)} картинок недоступны (продолжаем)")
-        return True
+    elif missing:
+        logger.warning(f"⚠️ {len(missing)}/{len(names)} картинок не совпадают с манифестом: "
+                       f"{', '.join(missing[:5])} (продолжаем)")
     else:
-        logger.info(f"✓ Картинки доступны")
-        return True
+        logger.info(f"✓ Картинки на месте ({len(names)} по манифесту)")
+    return True  # Не блокируем выполнение
 
 def validate_display_config():
     """
@@ -385,7 +497,7 @@ def validate_display_config():
             warnings_count += 1
         
         # Проверка места для текста (минимум 100 символов!)
-        min_text_space = 270 - len(title) - len(hashtags) - 6
+        min_text_space = MAX_TWEET_LENGTH - get_twitter_length(title) - get_twitter_length(hashtags) - 4
         if min_text_space < 100:
             logger.error(f"✗ Недостаточно места для текста в '{question[:30]}...': {min_text_space} символов (минимум 100)")
             logger.error(f"   Заголовок: {len(title)} + Хэштеги: {len(hashtags)} = слишком много!")
@@ -476,182 +588,214 @@ def find_question_by_group(questions_list, group_name):
     logger.warning(f"⚠️ Не найден вопрос для группы '{group_name}'")
     return None
 
-def send_telegram_message(message, parse_mode='HTML', add_subscribe_button=True):
-    """Отправляет сообщение в Telegram с разбивкой на части при необходимости"""
+# Кнопка подписки под последним сообщением публикации
+SUBSCRIBE_MARKUP = {
+    'inline_keyboard': [
+        [{'text': '⭐ Subscribe', 'url': 'https://t.me/frogfriends'}]
+    ]
+}
+
+def get_telegram():
+    """Общий async-транспорт Telegram (пул keep-alive соединений)"""
+    return telegram_client.get_telegram_transport(TELEGRAM_BOT_TOKEN)
+
+async def send_telegram_parts(tg, chat_id, parts, parse_mode='HTML', reply_markup=None, on_sent=None):
+    """
+    Отправляет части сообщения в один чат по порядку; кнопка - под последней частью.
+    На первой ошибке останавливается (следующие части без нее потеряли бы порядок).
+    on_sent(n) вызывается после каждой доставленной части (прогресс переживает исключение).
+    Возвращает число отправленных частей.
+    """
+    for i, part in enumerate(parts, 1):
+        markup = reply_markup if i == len(parts) else None
+        result = await tg.send_message(chat_id, part, parse_mode, reply_markup=markup)
+        if not result.get('ok'):
+            logger.error(f"  ✗ [{chat_id}] Часть {i}/{len(parts)}: {result.get('error_code')} - {result.get('description')}")
+            return i - 1
+        if on_sent:
+            on_sent(i)
+        if len(parts) > 1:
+            logger.info(f"  ✓ [{chat_id}] Часть {i}/{len(parts)} отправлена")
+    return len(parts)
+
+def queue_missing_parts(chat_id, parts, parse_mode='HTML'):
+    """
+    Начало публикации в чате уже вышло, недошедшие части - отдельной записью outbox:
+    повтор досылает только их, а не всю публикацию заново (как остаток треда в Twitter)
+    """
+    outbox.get_outbox().enqueue("telegram", {
+        "chat_id": chat_id,
+        "parts": parts,
+        "parse_mode": parse_mode
+    })
+    logger.warning(f"⚠️ [{chat_id}] {len(parts)} част(ей) не дошли, отложены в outbox")
+
+def send_telegram_followup(chat_id, parts, parse_mode='HTML'):
+    """Outbox: досылает части публикации в чат; True если дошли все (или остаток снова в очереди)"""
+    tg = get_telegram()
+    sent = tg.run(send_telegram_parts(tg, chat_id, parts, parse_mode, SUBSCRIBE_MARKUP))
+    if sent == len(parts):
+        return True
+    if sent:
+        queue_missing_parts(chat_id, parts[sent:], parse_mode)
+        return True
+    return False
+
+def send_telegram_message(message, parse_mode='HTML', add_subscribe_button=True, chat_ids=None):
+    """
+    Отправляет сообщение в Telegram с разбивкой на части при необходимости.
+    chat_ids: список чатов (по умолчанию TELEGRAM_CHAT_IDS) - отправка во все параллельно.
+    Возвращает True, если сообщение дошло во все чаты.
+    """
     try:
+        chat_ids = chat_ids or TELEGRAM_CHAT_IDS
+        
         # Проверка на пустые значения
-        if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID or TELEGRAM_BOT_TOKEN.strip() == "" or TELEGRAM_CHAT_ID.strip() == "":
+        if not TELEGRAM_BOT_TOKEN or not chat_ids or TELEGRAM_BOT_TOKEN.strip() == "":
             logger.error("✗ Не заданы TELEGRAM_BOT_TOKEN или TELEGRAM_CHAT_ID")
             return False
         
-        max_length = 4000
+        tg = get_telegram()
         
         # Subscribe button
-        subscribe_markup = None
-        if add_subscribe_button:
-            subscribe_markup = {
-                'inline_keyboard': [
-                    [{'text': '⭐ Subscribe', 'url': 'https://t.me/frogfriends'}]
-                ]
-            }
+        subscribe_markup = SUBSCRIBE_MARKUP if add_subscribe_button else None
         
-        if len(message) <= max_length:
-            url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-            payload = {
-                'chat_id': TELEGRAM_CHAT_ID,
-                'text': message,
-                'parse_mode': parse_mode
-            }
-            if subscribe_markup:
-                payload['reply_markup'] = json.dumps(subscribe_markup)
-            
-            response = requests.post(url, data=payload, timeout=10)
-            if response.status_code == 200:
-                logger.info("✓ Сообщение отправлено в Telegram")
-                return True
-            else:
-                logger.error(f"✗ Ошибка отправки в Telegram: {response.status_code} - {response.text}")
-                return False
+        # Части по абзацам/предложениям/словам, теги переоткрываются, длина - в UTF-16 units
+        parts = formatting.split_telegram_html(message) if parse_mode == 'HTML' else [message]
+        if not parts:
+            parts = [message]
+        if len(parts) > 1:
+            logger.info(f"📨 Сообщение длинное ({len(message)} chars), разбито на {len(parts)} части")
+        
+        async def send_to_chat(chat_id):
+            return await send_telegram_parts(tg, chat_id, parts, parse_mode, subscribe_markup) == len(parts)
+        
+        # Паузы между частями и чатами выдерживают token buckets транспорта
+        delivered = tg.run(tg.broadcast(chat_ids, send_to_chat))
+        
+        sent = sum(delivered.values())
+        if sent == len(chat_ids):
+            logger.info(f"✓ Сообщение отправлено в Telegram ({sent} чат(ов))")
         else:
-            logger.info(f"📨 Сообщение длинное ({len(message)} chars), разбиваю на части...")
-            parts = []
-            current_part = ""
-            
-            for line in message.split('\n'):
-                if len(current_part) + len(line) + 1 > max_length:
-                    if current_part:
-                        parts.append(current_part)
-                        current_part = line
-                    else:
-                        for i in range(0, len(line), max_length - 100):
-                            parts.append(line[i:i + max_length - 100])
-                else:
-                    current_part = current_part + "\n" + line if current_part else line
-            
-            if current_part:
-                parts.append(current_part)
-            
-            for i, part in enumerate(parts, 1):
-                url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-                payload = {
-                    'chat_id': TELEGRAM_CHAT_ID,
-                    'text': part,
-                    'parse_mode': parse_mode
-                }
-                # Add subscribe button only to last part
-                if i == len(parts) and subscribe_markup:
-                    payload['reply_markup'] = json.dumps(subscribe_markup)
-                    
-                response = requests.post(url, data=payload, timeout=10)
-                logger.info(f"  ✓ Часть {i}/{len(parts)} отправлена")
-                time.sleep(0.5)
-            
-            return True
+            logger.error(f"✗ Ошибка отправки в Telegram: доставлено в {sent}/{len(chat_ids)} чатов")
+        return sent == len(chat_ids)
             
     except Exception as e:
         logger.error(f"✗ Ошибка при отправке в Telegram: {e}")
         traceback.print_exc()
         return False
 
-def send_telegram_photo_with_caption(photo_url, caption, parse_mode='HTML'):
-    """Отправляет фото с подписью в Telegram"""
+def send_telegram_photo_with_caption(photo_url, caption, parse_mode='HTML', chat_ids=None):
+    """
+    Отправляет фото с подписью в Telegram (во все chat_ids параллельно).
+    Сколько влезает (1024) - уходит в caption того же sendPhoto,
+    остаток - follow-up сообщениями. Если фото не ушло - только текст.
+    
+    Прогресс ведется по чатам: после ошибки в чат досылается только недостающее,
+    а если начало публикации в чате уже вышло - недошедшие части уходят в outbox.
+    Возвращает True, если публикация дошла (или дослана через outbox) во все чаты.
+    """
+    chat_ids = chat_ids or TELEGRAM_CHAT_IDS
+    # chat_id -> {"started": что-то уже опубликовано, "missing": неотправленные части}
+    progress = {}
+    
+    async def send_parts(tg, chat_id, parts):
+        state = progress[chat_id]
+        state["missing"] = parts
+        
+        def on_sent(count):
+            state["missing"] = parts[count:]
+            state["started"] = True
+        
+        await send_telegram_parts(tg, chat_id, parts, parse_mode, SUBSCRIBE_MARKUP, on_sent=on_sent)
+    
     try:
-        url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendPhoto"
+        tg = get_telegram()
         
         logger.info(f"🔍 Попытка отправить фото: {photo_url}")
         logger.info(f"📏 Длина caption: {len(caption)} символов")
         
-        payload = {
-            'chat_id': TELEGRAM_CHAT_ID,
-            'photo': photo_url
-        }
-        response = requests.post(url, data=payload, timeout=30)
+        photo_caption, remainder = formatting.plan_photo_caption(caption)
+        remainder_parts = formatting.split_telegram_html(remainder) if remainder else []
+        caption_parts = formatting.split_telegram_html(caption) or [caption]
+        
+        async def send_to_chat(chat_id):
+            progress[chat_id] = {"started": False, "missing": None}
+            # Кнопка подписки - под последним сообщением публикации
+            result = await tg.send_photo(
+                chat_id, photo_url,
+                caption=photo_caption,
+                parse_mode=parse_mode,
+                reply_markup=None if remainder_parts else SUBSCRIBE_MARKUP
+            )
+            
+            if result.get('ok'):
+                progress[chat_id] = {"started": True, "missing": []}
+                if remainder_parts:
+                    logger.info(f"✓ [{chat_id}] Фото отправлено (caption: {len(photo_caption or '')}, остаток: {len(remainder)} символов)")
+                    await send_parts(tg, chat_id, remainder_parts)
+                else:
+                    logger.info(f"✓ [{chat_id}] Фото с подписью отправлено одним сообщением")
+                return
+            
+            logger.warning(f"⚠️ [{chat_id}] Ошибка отправки фото: {result.get('error_code')} - {result.get('description')}")
+            logger.info(f"⚠️ [{chat_id}] Отправляю только текст без фото")
+            await send_parts(tg, chat_id, caption_parts)
         
-        if response.status_code == 200:
-            logger.info("✓ Фото отправлено в Telegram")
-            time.sleep(1)
-            send_telegram_message(caption, parse_mode)
-            return True
-        else:
-            logger.warning(f"⚠️ Ошибка отправки фото: {response.status_code} - {response.text}")
-            logger.info("⚠️ Отправляю только текст без фото")
-            send_telegram_message(caption, parse_mode)
-            return False
+        tg.run(tg.broadcast(chat_ids, send_to_chat))
                 
     except Exception as e:
         logger.error(f"✗ Ошибка при отправке фото в Telegram: {e}")
         traceback.print_exc()
-        logger.info("⚠️ Отправляю только текст без фото")
-        send_telegram_message(caption, parse_mode)
-        return False
+        logger.info("⚠️ Досылаю недостающее текстом без фото")
+        for chat_id in chat_ids:
+            state = progress.get(chat_id)
+            if state is None or not state["started"]:
+                # В чат ничего не ушло - публикация текстом целиком
+                if send_telegram_message(caption, parse_mode, chat_ids=[chat_id]):
+                    progress[chat_id] = {"started": True, "missing": []}
+    
+    delivered = 0
+    for chat_id in chat_ids:
+        state = progress.get(chat_id)
+        if not state or state["missing"] is None:
+            continue
+        if not state["missing"]:
+            delivered += 1
+        elif state["started"]:
+            queue_missing_parts(chat_id, state["missing"], parse_mode)
+            delivered += 1
+    return delivered == len(chat_ids)
 
 def get_random_image_url():
-    """Возвращает случайный URL картинки из GitHub с fallback"""
-    max_attempts = 5
-    fallback_range = range(10, 151)
-    
-    for attempt in range(max_attempts):
-        if attempt < 3:
-            random_image = random.choice(IMAGE_FILES)
-        else:
-            random_image = f"{random.choice(fallback_range)}.jpg"
-        
-        url = GITHUB_IMAGES_URL + random_image
-        
-        try:
-            response = requests.head(url, timeout=3)
-            if response.status_code == 200:
-                logger.info(f"🎨 Выбрана картинка: {random_image}")
-                return url
-        except Exception as e:
-            if attempt < max_attempts - 1:
-                continue
-            logger.warning(f"⚠️ Ошибка проверки картинки: {e}")
+    """
+    Возвращает URL следующей картинки из каталога Images1/ (без сетевых проверок).
+    Shuffle-bag: без повторов в пределах IMAGE_NO_REPEAT_WINDOW публикаций.
+    """
+    catalog = image_catalog.load_catalog()
+    random_image = image_catalog.ImageBag(IMAGE_BAG_PATH, catalog).draw()
+    if not random_image:
+        logger.warning("⚠️ Каталог картинок пуст")
+        return None
     
-    fallback_image = f"{random.choice(fallback_range)}.jpg"
-    logger.warning(f"⚠️ Используем fallback картинку: {fallback_image}")
-    return GITHUB_IMAGES_URL + fallback_image
+    logger.info(f"🎨 Выбрана картинка: {random_image}")
+    return GITHUB_IMAGES_URL + random_image
 
 def extract_tldr_from_answer(answer):
-    """Извлекает только TLDR часть из ответа"""
+    """Извлекает только TLDR часть из ответа (разбор ответа кэшируется в answer_model)"""
     try:
         if not answer:
             return ""
         
-        # Убираем строку "Researched for Xs"
-        answer = '\n'.join([line for line in answer.split('\n') if not line.strip().startswith('Researched for')])
-        
-        # Ищем TLDR секцию
-        if 'TLDR' in answer:
-            tldr_start = answer.find('TLDR')
-            deep_dive_start = answer.find('Deep Dive')
-            
-            if deep_dive_start != -1:
-                tldr_section = answer[tldr_start:deep_dive_start].strip()
-            else:
-                tldr_section = answer[tldr_start:].strip()
-            
-            tldr_section = tldr_section.replace('TLDR', '', 1).strip()
-            
-            # КРИТИЧНО: Убираем вводные строки CMC (самая ранняя очистка)
-            tldr_section = re.sub(
-                r"Here are the trending (?:narratives|cryptos) based on CoinMarketCap['\u2018\u2019\"]?s evolving (?:narrative|momentum) algorithm[^:]*:?\s*",
-                '',
-                tldr_section,
-                flags=re.IGNORECASE
-            )
-            
-            # Убираем "These are the upcoming crypto events..."
-            tldr_section = re.sub(
-                r"These are the upcoming crypto events that may impact crypto the most:?\s*",
-                '',
-                tldr_section,
-                flags=re.IGNORECASE
-            )
-            
-            return tldr_section
+        parsed = answer_model.parse_answer(answer)
+        if parsed.tldr is not None:
+            # Строка "Researched for Xs" и вводные строки CMC уже убраны при разборе
+            if parsed.cleaning:
+                logger.info(f"  🧹 Очистка TLDR: {', '.join(sorted(parsed.cleaning))}")
+            return parsed.tldr.text
         else:
             logger.warning("⚠️ TLDR не найден, возвращаю первые 500 символов")
+            answer, _ = ANSWER_CLEANER.clean(answer.strip())
             return answer[:500] + ("..." if len(answer) > 500 else "")
             
     except Exception as e:
@@ -664,44 +808,19 @@ def clean_question_specific_text(question, text):
         if not text:
             return text
         
-        # Агрессивная очистка всех вводных строк CMC
-        text = re.sub(
-            r"Here are the trending (?:narratives|cryptos) based on CoinMarketCap['\u2018\u2019\"]?s evolving (?:narrative|momentum) algorithm[^:]*:?\s*",
-            '',
-            text,
-            flags=re.IGNORECASE
-        )
-        
-        # Убираем "These are the upcoming crypto events..."
-        text = re.sub(
-            r"These are the upcoming crypto events that may impact crypto the most:?\s*",
-            '',
-            text,
-            flags=re.IGNORECASE
-        )
-        
-        # Убираем "(from CMC's Social Sentiment Algorithm)" и подобные
-        text = re.sub(
-            r"\s*\(from CMC['\u2018\u2019\"]?s Social Sentiment Algorithm\)",
-            '',
-            text,
-            flags=re.IGNORECASE
-        )
-        
-        # Sentiment форматирование
-        if "sentiment" in question.lower():
-            text = re.sub(
-                r'\(CMC Fear & Greed Index:\s*(\d+)/\d+\)',
-                r'<b>\1</b>',
-                text
-            )
+        # Вводные строки CMC, "(from CMC's Social Sentiment Algorithm)",
+        # для sentiment - Fear & Greed жирным; все за один проход
+        cleaner = SENTIMENT_QUESTION_CLEANER if "sentiment" in question.lower() else QUESTION_CLEANER
+        text, fired = cleaner.clean(text)
+        if fired:
+            logger.info(f"  🧹 Очистка текста: {', '.join(sorted(fired))}")
         
         return text
     except Exception as e:
         logger.error(f"⚠️ Ошибка очистки текста: {e}")
         return text
 
-def smart_shorten_for_twitter(text, title, hashtags, max_total=270):
+def smart_shorten_for_twitter(text, title, hashtags, max_total=MAX_TWEET_LENGTH):
     """
     Умное сокращение текста для Twitter (макс 280 символов)
     Сохраняет полные предложения и не обрезает слова
@@ -711,8 +830,8 @@ def smart_shorten_for_twitter(text, title, hashtags, max_total=270):
     
     # Резервируем место под заголовок, хэштеги и форматирование
     # Формат: "Title\n\n[text]\n\n#hashtags"
-    # Используем get_twitter_length для правильного подсчета с emoji
-    reserved = get_twitter_length(title) + get_twitter_length(hashtags) + 6
+    # get_twitter_length считает точно как Twitter - запас не нужен, только 4 перевода строки
+    reserved = get_twitter_length(title) + get_twitter_length(hashtags) + 4
     available_for_text = max_total - reserved
     
     # Защита от слишком длинных заголовков/хэштегов (FIX BUG #8)
@@ -729,13 +848,13 @@ def smart_shorten_for_twitter(text, title, hashtags, max_total=270):
             hashtags = " ".join(hashtags_list)
             logger.warning(f"   Хэштеги сокращены до: {hashtags}")
             
-            reserved = get_twitter_length(title) + get_twitter_length(hashtags) + 6
+            reserved = get_twitter_length(title) + get_twitter_length(hashtags) + 4
             available_for_text = max_total - reserved
             logger.info(f"   Теперь доступно: {available_for_text} символов")
         elif get_twitter_length(hashtags) > 50:
             hashtags_list = hashtags.split()[:5]
             hashtags = " ".join(hashtags_list)
-            reserved = get_twitter_length(title) + get_twitter_length(hashtags) + 6
+            reserved = get_twitter_length(title) + get_twitter_length(hashtags) + 4
             available_for_text = max_total - reserved
     
     # Убираем избыточные пробелы, но сохраняем структуру (FIX BUG #5)
@@ -747,46 +866,12 @@ def smart_shorten_for_twitter(text, title, hashtags, max_total=270):
     if get_twitter_length(text) <= available_for_text:
         return text
     
-    # Разбиваем на предложения
-    sentences = re.split(r'([.!?]+\s*)', text)
-    sentences = ["".join(sentences[i:i+2]).strip() 
-                 for i in range(0, len(sentences)-1, 2) if sentences[i].strip()]
-    
-    # Собираем предложения пока влезают
-    result = []
-    current_length = 0
-    
-    for sentence in sentences:
-        sentence = sentence.strip()
-        if not sentence:
-            continue
-        
-        sent_length = get_twitter_length(sentence)
-        
-        if current_length + sent_length + 1 <= available_for_text:
-            result.append(sentence)
-            current_length += sent_length + 1
-        else:
-            if not result:
-                # Обрезаем по последнему слову
-                words = sentence.split()
-                shortened = []
-                for word in words:
-                    test_text = " ".join(shortened + [word])
-                    if get_twitter_length(test_text) + 3 <= available_for_text:
-                        shortened.append(word)
-                    else:
-                        break
-                if shortened:
-                    return " ".join(shortened) + "..."
-                else:
-                    return sentence[:available_for_text-3] + "..."
-            break
-    
-    return " ".join(result)
+    # Целые предложения (из модели ответа) пока влезают, иначе - по словам с "..."
+    sentences = " ".join(answer_model.parse_section(text).sentences)
+    return truncate_by_weight(sentences, available_for_text, level="sentence")
 
 def init_twitter_client():
-    """Инициализирует Twitter API клиент"""
+    """Возвращает общую на процесс Twitter-сессию (клиенты создаются один раз)"""
     try:
         # Проверяем обязательные ключи (Bearer Token опциональный!)
         if not all([TWITTER_API_KEY, TWITTER_API_SECRET, 
@@ -798,27 +883,13 @@ def init_twitter_client():
         if not TWITTER_BEARER_TOKEN:
             logger.info("ℹ️  Bearer Token не установлен (опционально для постинга)")
         
-        # Tweepy v2 Client для API v2
-        client = tweepy.Client(
-            bearer_token=TWITTER_BEARER_TOKEN,  # Может быть None - это ОК для постинга
-            consumer_key=TWITTER_API_KEY,
-            consumer_secret=TWITTER_API_SECRET,
-            access_token=TWITTER_ACCESS_TOKEN,
-            access_token_secret=TWITTER_ACCESS_TOKEN_SECRET,
-            wait_on_rate_limit=True
-        )
-        
-        # API v1.1 для загрузки медиа (картинок)
-        auth = tweepy.OAuth1UserHandler(
+        return twitter_client.get_twitter_session(
             TWITTER_API_KEY,
             TWITTER_API_SECRET,
             TWITTER_ACCESS_TOKEN,
-            TWITTER_ACCESS_TOKEN_SECRET
+            TWITTER_ACCESS_TOKEN_SECRET,
+            bearer_token=TWITTER_BEARER_TOKEN
         )
-        api = tweepy.API(auth)
-        
-        logger.info("✓ Twitter API клиент инициализирован")
-        return {"client": client, "api": api}
         
     except Exception as e:
         logger.error(f"✗ Ошибка инициализации Twitter API: {e}")
@@ -833,10 +904,14 @@ def send_twitter_thread(twitter_content, image_url):
             - mode: "thread" или "single"
             - tweets: list (для thread)
             - tweet: str (для single)
+            - reply_to: id твита, к которому цеплять (продолжение отложенного треда)
         image_url: URL картинки
     
     Returns:
-        bool: True если успешно
+        bool: True если успешно (остаток треда, упершийся в лимит, отложен в outbox)
+    
+    Raises:
+        outbox.RetryLater: лимит исчерпан до первого твита - outbox повторит после reset
     """
     try:
         if not TWITTER_ENABLED:
@@ -848,180 +923,248 @@ def send_twitter_thread(twitter_content, image_url):
             logger.error("✗ Не удалось инициализировать Twitter клиент")
             return False
         
-        client = twitter["client"]
-        api = twitter["api"]
+        mode = twitter_content.get("mode", "single")
+        reply_to = twitter_content.get("reply_to")
+        
+        if mode == "thread":
+            tweets = [t for t in twitter_content.get("tweets") or [] if t]
+            if len(tweets) < 2 and not reply_to:
+                logger.warning("⚠️ Тред слишком короткий, переключаюсь на single")
+                mode = "single"
+                tweets = tweets[:1] or [twitter_content.get("tweet")]
+        else:
+            tweets = [twitter_content.get("tweet")]
+        
+        if not tweets or not tweets[0]:
+            logger.error("✗ Нет текста твита")
+            return False
+        
+        # Лимит уже исчерпан - не грузим картинку зря, outbox повторит после reset
+        reset_at = twitter.rate_limits.exhausted_until(twitter_client.TWEETS_ENDPOINT)
+        if reset_at:
+            raise outbox.RetryLater(reset_at - time.time(), reason="Twitter rate limit")
         
-        # Загружаем картинку
+        # Загружаем картинку (media_id переиспользуется, пока действителен)
         media_id = None
-        if image_url:
+        if image_url and not reply_to:
             try:
                 logger.info(f"🖼️  Загрузка картинки...")
-                response = requests.get(image_url, timeout=30)
-                if response.status_code == 200:
-                    media = api.media_upload(filename="image.jpg", file=BytesIO(response.content))
-                    media_id = media.media_id
-                    logger.info(f"✓ Картинка загружена")
+                media_id = twitter.upload_image(image_url, http_session=get_http_session())
             except Exception as e:
                 logger.warning(f"⚠️ Ошибка загрузки картинки: {e}")
         
-        mode = twitter_content.get("mode", "single")
+        if mode == "thread":
+            logger.info(f"🧵 Публикация треда из {len(tweets)} твитов...")
+        else:
+            logger.info(f"📏 Одиночный твит: {get_twitter_length(tweets[0])} символов")
         
-        # РЕЖИМ: ТРЕД
-        if mode == "thread" and "tweets" in twitter_content:
-            tweets = twitter_content["tweets"]
-            
-            if not tweets or len(tweets) < 2:
-                logger.warning("⚠️ Тред слишком короткий, переключаюсь на single")
-                mode = "single"
-            else:
-                logger.info(f"🧵 Публикация треда из {len(tweets)} твитов...")
-                
-                previous_tweet_id = None
-                published_count = 0
-                
-                for i, tweet_text in enumerate(tweets, 1):
-                    try:
-                        logger.info(f"  📤 Твит {i}/{len(tweets)}: {len(tweet_text)} символов")
-                        
-                        if i == 1 and media_id:
-                            response = client.create_tweet(text=tweet_text, media_ids=[media_id])
-                        elif previous_tweet_id:
-                            response = client.create_tweet(text=tweet_text, in_reply_to_tweet_id=previous_tweet_id)
-                        else:
-                            response = client.create_tweet(text=tweet_text)
-                        
-                        if response and hasattr(response, 'data'):
-                            try:
-                                if hasattr(response.data, 'get'):
-                                    tweet_id = response.data.get('id')
-                                elif hasattr(response.data, 'id'):
-                                    tweet_id = response.data.id
-                                else:
-                                    tweet_id = response.data['id']
-                                
-                                if tweet_id:
-                                    previous_tweet_id = tweet_id
-                                    published_count += 1
-                                    logger.info(f"    ✓ Твит {i} опубликован")
-                                    
-                                    if i < len(tweets):
-                                        time.sleep(2)
-                                else:
-                                    logger.error(f"    ✗ Нет ID для твита {i}")
-                                    break
-                            except Exception as e:
-                                logger.error(f"    ✗ Ошибка получения ID твита {i}: {e}")
-                                break
-                        else:
-                            logger.error(f"    ✗ Пустой ответ для твита {i}")
-                            break
-                    
-                    except tweepy.TweepyException as e:
-                        error_str = str(e)
-                        
-                        if "rate limit" in error_str.lower() or "429" in error_str:
-                            logger.warning(f"⚠️ Rate limit на твите {i}")
-                            return published_count >= 1
-                        
-                        if "duplicate" in error_str.lower() or "187" in error_str:
-                            logger.warning(f"⚠️ Твит {i} дубликат, пропускаем")
-                            continue
-                        
-                        logger.error(f"✗ Ошибка публикации твита {i}: {e}")
-                        return published_count >= 1
-                
-                if published_count >= 2:
-                    logger.info(f"✓ Тред опубликован ({published_count} твитов)")
-                    return True
-                elif published_count == 1:
-                    logger.warning("⚠️ Опубликован только 1 твит (не тред)")
-                    return True
-                else:
-                    logger.error("✗ Не удалось опубликовать тред")
-                    return False
+        result = twitter.publish_thread(tweets, media_id=media_id, reply_to=reply_to)
+        posted = result["posted"]
         
-        # РЕЖИМ: ОДИНОЧНЫЙ ТВИТ
-        if mode == "single":
-            tweet_text = twitter_content.get("tweet")
-            
-            if not tweet_text:
-                logger.error("✗ Нет текста твита")
-                return False
+        if result["retry_at"]:
+            wait = result["retry_at"] - time.time()
+            if not posted:
+                raise outbox.RetryLater(wait, reason="Twitter rate limit")
             
-            logger.info(f"📏 Одиночный твит: {len(tweet_text)} символов")
-            
-            try:
-                if media_id:
-                    response = client.create_tweet(text=tweet_text, media_ids=[media_id])
-                else:
-                    response = client.create_tweet(text=tweet_text)
-                
-                if not response or not hasattr(response, 'data'):
-                    logger.error("✗ Пустой ответ от Twitter API")
-                    return False
-                
-                tweet_id = None
-                try:
-                    if hasattr(response.data, 'get'):
-                        tweet_id = response.data.get('id')
-                    elif hasattr(response.data, 'id'):
-                        tweet_id = response.data.id
-                    else:
-                        tweet_id = response.data['id']
-                except Exception as e:
-                    logger.error(f"✗ Ошибка получения ID: {e}")
-                    return False
-                
-                if tweet_id:
-                    logger.info(f"✓ Твит опубликован (ID: {tweet_id})")
-                    return True
-                else:
-                    logger.error("✗ Нет ID твита")
-                    return False
-                
-            except tweepy.TweepyException as e:
-                error_str = str(e)
-                
-                if "rate limit" in error_str.lower() or "429" in error_str:
-                    logger.warning("⚠️ Rate limit")
-                    return True
-                
-                if "duplicate" in error_str.lower() or "187" in error_str:
-                    logger.warning("⚠️ Дубликат твита")
+            # Начало треда вышло - остаток цепляем к последнему твиту после reset
+            outbox.get_outbox().enqueue("twitter", {
+                "content": {
+                    "mode": "thread",
+                    "tweets": result["remaining"],
+                    "reply_to": result["reply_to"]
+                },
+                "image_url": None
+            }, not_before=result["retry_at"])
+            logger.warning(f"⚠️ Rate limit: {len(result['remaining'])} твит(ов) треда отложены "
+                           f"на {wait / 60:.0f} мин (outbox)")
+            return True
+        
+        if result["duplicate"]:
+            # Повтор упрется в тот же дубликат - в outbox не возвращаем
+            logger.warning(f"⚠️ Тред остановлен на дубликате: {len(result['remaining'])} твит(ов) "
+                           f"не опубликованы (id уже опубликованного твита неизвестен)")
+            return True
+        
+        if result["error"]:
+            logger.error(f"✗ Ошибка публикации: {result['error']}")
+            if not posted and media_id and mode == "single":
+                logger.info("🔄 Попытка без картинки...")
+                retry = twitter.publish_thread(tweets)
+                if retry["posted"]:
+                    logger.info("✓ Опубликовано без картинки")
                     return True
-                
-                logger.error(f"✗ Ошибка: {e}")
-                
-                if media_id:
-                    logger.info("🔄 Попытка без картинки...")
-                    try:
-                        response = client.create_tweet(text=tweet_text)
-                        if response and hasattr(response, 'data'):
-                            logger.info("✓ Опубликовано без картинки")
-                            return True
-                    except:
-                        pass
-                
-                return False
+            return bool(posted)
+        
+        if mode == "thread":
+            if len(posted) >= 2 or reply_to:
+                logger.info(f"✓ Тред опубликован ({len(posted)} твитов)")
+            else:
+                logger.warning(f"⚠️ Опубликовано {len(posted)} твит(ов) из {len(tweets)}")
+        elif not posted:
+            logger.warning("⚠️ Дубликат твита")
+        return True
     
+    except outbox.RetryLater:
+        raise
     except Exception as e:
         logger.error(f"✗ Критическая ошибка: {e}")
         import traceback
         traceback.print_exc()
         return False
 
-def send_question_answer_to_telegram(question, answer):
+def fan_out(sinks):
+    """
+    Запускает публикацию во все платформы параллельно (пул потоков).
+    Время публикации = самая медленная платформа, а не сумма.
+    
+    Args:
+        sinks: dict {платформа: функция без аргументов -> bool}
+    
+    Returns:
+        dict: {платформа: {"success": bool, "seconds": float, "error": str|None}}
+    """
+    def run_sink(name, fn):
+        start = time.monotonic()
+        try:
+            success, error = bool(fn()), None
+        except Exception as e:
+            logger.error(f"✗ {name}: {e}")
+            logger.error(traceback.format_exc())
+            success, error = False, str(e)
+        return {"success": success, "seconds": time.monotonic() - start, "error": error}
+    
+    with ThreadPoolExecutor(max_workers=max(1, len(sinks))) as pool:
+        futures = {name: pool.submit(run_sink, name, fn) for name, fn in sinks.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+def deliver_telegram_post(payload):
+    """Outbox handler: готовый пост -> Telegram (один чат на запись outbox)"""
+    chat_ids = [payload["chat_id"]] if payload.get("chat_id") else None
+    if payload.get("parts"):
+        # Досылка недошедших частей публикации (см. queue_missing_parts)
+        return send_telegram_followup(payload["chat_id"], payload["parts"], payload.get("parse_mode", "HTML"))
+    if not payload.get("photo_url"):
+        return send_telegram_message(payload["caption"], payload.get("parse_mode", "HTML"), chat_ids=chat_ids)
+    return send_telegram_photo_with_caption(
+        photo_url=payload["photo_url"],
+        caption=payload["caption"],
+        parse_mode=payload.get("parse_mode", "HTML"),
+        chat_ids=chat_ids
+    )
+
+def deliver_twitter_post(payload):
+    """Outbox handler: готовый пост -> Twitter"""
+    return send_twitter_thread(payload["content"], payload.get("image_url"))
+
+OUTBOX_HANDLERS = {
+    "telegram": deliver_telegram_post,
+    "twitter": deliver_twitter_post,
+}
+
+def publish_via_outbox(platform_name, payload, ledger_key=None, question=None):
+    """
+    Кладет готовый пост в outbox и сразу пытается его доставить.
+    При ошибке пост остается в очереди и уйдет с backoff'ом позже
+    (outbox-воркер daemon или следующий запуск).
+    С ledger_key пост отмечается в журнале публикаций: "queued" до отправки,
+    "sent" после - перезапуск слота его не повторит.
+    Пост, уже отправленный раньше с тем же содержимым (тот же ключ outbox),
+    не публикуется повторно и отмечается в журнале как "duplicate".
+    """
+    box = outbox.get_outbox()
+    key, created = box.enqueue(platform_name, payload)
+    ledger = publish_ledger.get_ledger() if ledger_key else None
+    if not created and box.status(key) == "sent":
+        logger.warning(f"⚠️ {platform_name}: такой же пост уже отправлен раньше ({key}), повторно не публикую")
+        if ledger:
+            ledger.mark(ledger_key, publish_ledger.STATUS_DUPLICATE, question=question, outbox_key=key)
+        return True
+    if ledger:
+        ledger.mark(ledger_key, publish_ledger.STATUS_QUEUED, question=question, outbox_key=key)
+    box.drain(OUTBOX_HANDLERS, idempotency_key=key)
+    status = box.status(key)
+    if status == "pending":
+        logger.warning(f"⚠️ {platform_name}: пост остался в outbox, будет повторная попытка")
+    if ledger and status == "sent":
+        ledger.mark(ledger_key, publish_ledger.STATUS_SENT)
+    return status == "sent"
+
+def twitter_configured():
+    return TWITTER_ENABLED and all([TWITTER_API_KEY, TWITTER_API_SECRET,
+                                    TWITTER_ACCESS_TOKEN, TWITTER_ACCESS_TOKEN_SECRET])
+
+def expected_platforms():
+    """Платформы журнала публикаций: telegram:<чат> на каждый чат + twitter"""
+    platforms = [f"telegram:{chat_id}" for chat_id in TELEGRAM_CHAT_IDS]
+    if twitter_configured():
+        platforms.append("twitter")
+    return platforms
+
+def ledger_entry_done(entry):
+    """
+    Платформа уже опубликована: отправлена или стоит в outbox (доставит outbox).
+    Пост, снятый outbox'ом с очереди (dead) или потерянный вместе с outbox.db,
+    публикуется заново.
+    """
+    if not entry:
+        return False
+    if entry["status"] in (publish_ledger.STATUS_SENT, publish_ledger.STATUS_DUPLICATE):
+        return True
+    if not entry.get("outbox_key"):
+        return False
+    return outbox.get_outbox().status(entry.get("outbox_key")) in ("pending", "sending", "sent")
+
+def slot_published(slot):
+    """Публикация слота уже дошла до всех платформ (по журналу)"""
+    platforms = expected_platforms()
+    return bool(platforms) and publish_ledger.get_ledger().slot_complete(slot, platforms, ledger_entry_done)
+
+def drain_outbox():
+    """Доставляет посты, оставшиеся в outbox с прошлых запусков. True если ничего не упало."""
+    box = outbox.get_outbox()
+    if not box.pending_count():
+        return True
+    logger.info("📮 Outbox: доставка отложенных публикаций...")
+    summary = box.drain(OUTBOX_HANDLERS)
+    box.purge()
+    logger.info(f"📮 Outbox: отправлено {summary['sent']}, ошибок {summary['failed']}, "
+                f"ждут лимитов {summary['deferred']}, снято {summary['dead']}")
+    return not summary["failed"] and not summary["dead"]
+
+def send_question_answer_to_telegram(question, answer, slot=None, group=None):
     """
     Отправляет вопрос и TLDR в Telegram с картинкой и Alpha Take (V2).
     Возвращает True если успешно.
     
+    slot/group: ключ журнала публикаций - платформы, уже получившие
+    этот вопрос в этом слоте, пропускаются (без повторного OpenAI, если все).
+    
     NEW в V2.0:
     - Генерация Alpha Take через OpenAI
     - Enhanced caption с Alpha Take + Context Tag
     - Улучшенное форматирование для Twitter
     """
     try:
-        logger.info(f"\n📤 ОТПРАВКА (форматирование v{formatting_version})")
+        logger.info(f"\n📤 ОТПРАВКА (форматирование v{formatting.__version__})")
+        
+        # Журнал публикаций: что уже ушло в этом слоте
+        ledger_keys = {}
+        if slot:
+            ledger = publish_ledger.get_ledger()
+            for platform_name in expected_platforms():
+                key = publish_ledger.make_ledger_key(slot, group, question, platform_name)
+                if ledger_entry_done(ledger.get(key)):
+                    logger.info(f"  ✓ {platform_name}: уже опубликовано в слоте {slot}, пропускаем")
+                    ledger_keys[platform_name] = None
+                else:
+                    ledger_keys[platform_name] = key
+            if not any(ledger_keys.values()):
+                logger.info("✓ Слот уже опубликован во все платформы")
+                return True
+        
+        def pending(platform_name):
+            """Нужно ли публиковать платформу (без журнала - всегда)"""
+            return not slot or bool(ledger_keys.get(platform_name))
         
         # ==========================================
         # 1. ИЗВЛЕЧЕНИЕ И ОЧИСТКА КОНТЕНТА
@@ -1041,6 +1184,11 @@ def send_question_answer_to_telegram(question, answer):
         
         logger.info(f"  ✓ TLDR извлечен: {len(tldr_text)} символов")
         
+        section = answer_model.parse_section(tldr_text)
+        fear_greed = f", Fear & Greed {section.fear_greed}" if section.fear_greed is not None else ""
+        logger.info(f"  ✓ Структура: абзацев {len(section.paragraphs)}, пунктов {len(section.bullets)}, "
+                    f"цен {len(section.price_lines)}{fear_greed}")
+        
         # ==========================================
         # 2. ПОЛУЧЕНИЕ КОНФИГУРАЦИИ
         # ==========================================
@@ -1067,7 +1215,7 @@ def send_question_answer_to_telegram(question, answer):
             logger.info(f"   Используем OpenAI для анализа...")
             
             try:
-                ai_result = get_ai_alpha_take(
+                ai_result = openai_integration.get_ai_alpha_take(
                     news_text=tldr_text,
                     question_context=question
                 )
@@ -1101,7 +1249,7 @@ def send_question_answer_to_telegram(question, answer):
         if ai_result:
             # С Alpha Take - enhanced формат
             logger.info("   Режим: Enhanced (с Alpha Take)")
-            telegram_caption = enhance_caption_with_alpha_take(
+            telegram_caption = openai_integration.enhance_caption_with_alpha_take(
                 title=title,
                 text=tldr_text,
                 hashtags_fallback=hashtags,
@@ -1119,84 +1267,85 @@ def send_question_answer_to_telegram(question, answer):
         # ==========================================
         
         image_url = get_random_image_url()
-        logger.info(f"  ✓ Картинка выбрана: {image_url.split('/')[-1]}")
+        if image_url:
+            logger.info(f"  ✓ Картинка выбрана: {image_url.split('/')[-1]}")
         
         # ==========================================
-        # 6. ОТПРАВКА В TELEGRAM
+        # 6-7. ПАРАЛЛЕЛЬНАЯ ОТПРАВКА ВО ВСЕ ПЛАТФОРМЫ
         # ==========================================
         
-        logger.info("\n📤 ОТПРАВКА В TELEGRAM")
+        telegram_chats = [chat_id for chat_id in TELEGRAM_CHAT_IDS if pending(f"telegram:{chat_id}")]
         
-        telegram_success = False
-        try:
-            telegram_success = send_telegram_photo_with_caption(
-                photo_url=image_url,
-                caption=telegram_caption,
-                parse_mode='HTML'
-            )
-            
-            if telegram_success:
+        def publish_telegram():
+            if not telegram_chats:
+                return True
+            logger.info(f"\n📤 ОТПРАВКА В TELEGRAM ({len(telegram_chats)} чат(ов))")
+            photo_url = image_variants.platform_image_url("telegram", image_url)
+            # Запись outbox на каждый чат: повтор после сбоя не дублирует пост в других чатах
+            delivered = fan_out({
+                chat_id: (lambda chat_id=chat_id: publish_via_outbox("telegram", {
+                    "chat_id": chat_id,
+                    "photo_url": photo_url,
+                    "caption": telegram_caption,
+                    "parse_mode": "HTML"
+                }, ledger_key=ledger_keys.get(f"telegram:{chat_id}"), question=question))
+                for chat_id in telegram_chats
+            })
+            success = all(result["success"] for result in delivered.values())
+            if success:
                 logger.info("✓ Telegram: Успешно отправлено")
             else:
                 logger.error("✗ Telegram: Ошибка отправки")
-                return False
-                
-        except Exception as e:
-            logger.error(f"✗ Telegram ошибка: {e}")
-            return False
+            return success
         
-        # Пауза между платформами
-        time.sleep(2)
-        
-        # ==========================================
-        # 7. ОТПРАВКА В TWITTER (ОПЦИОНАЛЬНО)
-        # ==========================================
-        
-        if TWITTER_ENABLED and all([TWITTER_API_KEY, TWITTER_API_SECRET,
-                                    TWITTER_ACCESS_TOKEN, TWITTER_ACCESS_TOKEN_SECRET]):
-            
+        def publish_twitter():
             logger.info("\n🐦 ПОДГОТОВКА TWITTER КОНТЕНТА")
             
-            try:
-                if ai_result:
-                    logger.info("   Используем Alpha Take для Twitter")
-                    
-                    twitter_text = optimize_tweet_for_twitter(
-                        title=title,
-                        alpha_take=ai_result.get('alpha_take') or tldr_text,
-                        hashtags=ai_result.get('hashtags') or hashtags
-                    )
-                else:
-                    logger.info("   Используем стандартное сокращение")
-                    
-                    twitter_text = smart_shorten_for_twitter(
-                        text=tldr_text,
-                        title=title,
-                        hashtags=hashtags,
-                        max_total=270
-                    )
-                    twitter_text = f"{title}\n\n{twitter_text}\n\n{hashtags}"
-                
-                twitter_content = {
-                    "mode": "single",
-                    "tweet": twitter_text
-                }
-                
-                logger.info(f"  ✓ Tweet подготовлен: {get_twitter_length(twitter_text)} символов")
+            if ai_result:
+                logger.info("   Используем Alpha Take для Twitter")
                 
-                logger.info("\n📤 ОТПРАВКА В TWITTER")
-                tw_success = send_twitter_thread(twitter_content, image_url)
-                
-                if tw_success:
-                    logger.info("✓ Twitter: Успешно отправлено")
-                else:
-                    logger.warning("⚠️ Twitter: Ошибка отправки (не критично)")
+                twitter_text = openai_integration.optimize_tweet_for_twitter(
+                    title=title,
+                    alpha_take=ai_result.get('alpha_take') or tldr_text,
+                    hashtags=ai_result.get('hashtags') or hashtags
+                )
+            else:
+                logger.info("   Используем стандартное сокращение")
                 
-            except Exception as e:
-                logger.error(f"✗ Twitter ошибка: {e}")
-                logger.warning("   Twitter публикация пропущена (не критично)")
-        else:
+                twitter_text = smart_shorten_for_twitter(
+                    text=tldr_text,
+                    title=title,
+                    hashtags=hashtags,
+                    max_total=MAX_TWEET_LENGTH
+                )
+                twitter_text = f"{title}\n\n{twitter_text}\n\n{hashtags}"
+            
+            twitter_content = {
+                "mode": "single",
+                "tweet": twitter_text
+            }
+            
+            logger.info(f"  ✓ Tweet подготовлен: {get_twitter_length(twitter_text)} символов")
+            
+            logger.info("\n📤 ОТПРАВКА В TWITTER")
+            success = publish_via_outbox("twitter", {
+                "content": twitter_content,
+                "image_url": image_variants.platform_image_url("twitter", image_url)
+            }, ledger_key=ledger_keys.get("twitter"), question=question)
+            
+            if success:
+                logger.info("✓ Twitter: Успешно отправлено")
+            else:
+                logger.warning("⚠️ Twitter: Ошибка отправки (не критично)")
+            return success
+        
+        sinks = {"telegram": publish_telegram}
+        if not twitter_configured():
             logger.info("\nℹ️  Twitter отключен или не настроен")
+        elif pending("twitter"):
+            sinks["twitter"] = publish_twitter
+        
+        results = fan_out(sinks)
         
         # ==========================================
         # 8. ИТОГОВЫЙ ОТЧЕТ
@@ -1208,16 +1357,19 @@ def send_question_answer_to_telegram(question, answer):
         logger.info(f"  Вопрос: {question[:50]}...")
         logger.info(f"  Заголовок: {title}")
         logger.info(f"  TLDR длина: {len(tldr_text)} символов")
-        logger.info(f"  Telegram: ✓ Отправлено")
+        for platform_name, result in results.items():
+            status = '✓ Отправлено' if result["success"] else '✗ Ошибка'
+            logger.info(f"  {platform_name.capitalize()}: {status} ({result['seconds']:.1f}s)")
         logger.info(f"  Alpha Take: {'✓ Включен' if ai_result else '✗ Отключен'}")
         
         if ai_result:
             logger.info(f"  Context Tag: {ai_result.get('context_tag', 'N/A')}")
             logger.info(f"  AI Hashtags: {'✓ Да' if ai_result.get('hashtags') else '✗ Fallback'}")
         
+        telegram_client.log_all_stats()
         logger.info(f"{'='*50}\n")
         
-        return True
+        return results["telegram"]["success"]
         
     except Exception as e:
         logger.error(f"\n❌ КРИТИЧЕСКАЯ ОШИБКА В ОТПРАВКЕ")
@@ -1226,17 +1378,208 @@ def send_question_answer_to_telegram(question, answer):
         logger.error(traceback.format_exc())
         return False
 
-async def accept_cookies(page):
-    """Принимает cookies если баннер появился"""
-    try:
-        cookie_buttons = [
-            'button:has-text("Accept Cookies and Continue")',
-            'button:has-text("Accept All")',
-            'button:has-text("Accept")',
-            'text="Accept Cookies and Continue"'
-        ]
+class ResourceFilter:
+    """
+    Фильтр запросов для context.route: прерывает ненужные типы ресурсов
+    и third-party домены, считает статистику за запуск.
+    Байты заблокированных запросов не скачиваются: они оцениваются по базовому
+    замеру (RESOURCE_BASELINE_PATH) - число блокировок типа × средний размер ответа.
+    С record_baseline=True ничего не блокирует и собирает этот замер.
+    """
 
-        for selector in cookie_buttons:
+    def __init__(self, blocked_types=None, allowed_domains=None, record_baseline=False):
+        self.record_baseline = record_baseline
+        self.blocked_types = set(BLOCKED_RESOURCE_TYPES if blocked_types is None else blocked_types)
+        self.allowed_domains = tuple(ALLOWED_DOMAINS if allowed_domains is None else allowed_domains)
+        self.blocked_requests = 0
+        self.allowed_requests = 0
+        self.allowed_bytes = 0
+        self.blocked_by_type = Counter()
+        self.blocked_by_domain = Counter()
+        # Ответы с content-length по типам ресурса: для базового замера
+        self.responses_by_type = Counter()
+        self.bytes_by_type = Counter()
+
+    def is_allowed_host(self, host):
+        host = (host or '').lower()
+        return any(host == d or host.endswith('.' + d) for d in self.allowed_domains)
+
+    def block_reason(self, resource_type, url):
+        """Возвращает причину блокировки или None если запрос нужно пропустить"""
+        if self.record_baseline:
+            return None
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            return None  # data:, blob: и т.п. не уходят в сеть
+        if resource_type in self.blocked_types:
+            return f"type:{resource_type}"
+        if not self.is_allowed_host(parts.hostname):
+            return f"domain:{parts.hostname}"
+        return None
+
+    async def handle(self, route):
+        request = route.request
+        reason = self.block_reason(request.resource_type, request.url)
+        if reason:
+            self.blocked_requests += 1
+            self.blocked_by_type[request.resource_type] += 1
+            self.blocked_by_domain[urlsplit(request.url).hostname or ''] += 1
+            await route.abort()
+        else:
+            self.allowed_requests += 1
+            await route.continue_()
+
+    def on_response(self, response):
+        try:
+            size = int(response.headers.get('content-length', 0))
+        except (TypeError, ValueError):
+            return
+        self.allowed_bytes += size
+        if size:
+            resource_type = response.request.resource_type
+            self.responses_by_type[resource_type] += 1
+            self.bytes_by_type[resource_type] += size
+
+    async def install(self, context):
+        await context.route('**/*', self.handle)
+        context.on('response', self.on_response)
+        if self.record_baseline:
+            logger.info(f"🚫 Фильтр запросов: базовый замер без блокировок → {RESOURCE_BASELINE_PATH}")
+        else:
+            logger.info(f"🚫 Фильтр запросов: типы {sorted(self.blocked_types)}, домены {list(self.allowed_domains)}")
+
+    def save_baseline(self, path=None):
+        """Сохраняет средний размер ответа по типам ресурса (JSON {type: bytes})"""
+        path = path or RESOURCE_BASELINE_PATH
+        averages = {
+            resource_type: round(self.bytes_by_type[resource_type] / count)
+            for resource_type, count in self.responses_by_type.items()
+        }
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({"recorded_at": datetime.now(timezone.utc).isoformat(), "avg_bytes": averages},
+                          f, ensure_ascii=False, indent=2)
+            logger.info(f"🚫 Базовый замер сохранен: {averages}")
+        except OSError as e:
+            logger.warning(f"⚠️ Не удалось сохранить базовый замер: {e}")
+
+    @staticmethod
+    def load_baseline(path=None):
+        """Средний размер ответа по типам из базового замера или None"""
+        path = path or RESOURCE_BASELINE_PATH
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return {t: int(size) for t, size in json.load(f).get("avg_bytes", {}).items()}
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            logger.warning(f"⚠️ Ошибка чтения базового замера: {e}")
+            return None
+
+    def estimate_blocked_bytes(self, baseline):
+        """Оценка байтов заблокированных запросов: блокировки типа × средний размер из замера"""
+        return sum(count * baseline.get(resource_type, 0) for resource_type, count in self.blocked_by_type.items())
+
+    def log_summary(self):
+        if self.record_baseline:
+            logger.info(f"🚫 Базовый замер: {self.allowed_requests} запросов, "
+                        f"{self.allowed_bytes / 1024:.0f} KB по content-length")
+            self.save_baseline()
+            return
+        total = self.blocked_requests + self.allowed_requests
+        baseline = self.load_baseline()
+        if baseline is None:
+            blocked_bytes = "байты не оценены (нет базового замера)"
+        else:
+            blocked_bytes = f"~{self.estimate_blocked_bytes(baseline) / 1024:.0f} KB по базовому замеру"
+        logger.info(f"🚫 Фильтр запросов: заблокировано {self.blocked_requests}/{total}, {blocked_bytes}; "
+                    f"скачано {self.allowed_bytes / 1024:.0f} KB")
+        if self.blocked_by_type:
+            logger.info(f"   • По типам: {dict(self.blocked_by_type.most_common())}")
+        if self.blocked_by_domain:
+            logger.info(f"   • По доменам: {dict(self.blocked_by_domain.most_common(5))}")
+
+def load_storage_state():
+    """
+    Возвращает (storage_state dict, consent_at) если сохраненная сессия свежая, иначе (None, None).
+    Возраст считается от момента принятия cookie-баннера (consent_at), а не от mtime:
+    файл перезаписывается каждый слот, и по mtime сессия никогда бы не устаревала.
+    Устаревший, битый или сохраненный без consent файл удаляется - состояние будет создано заново.
+    """
+    if not STORAGE_STATE_PATH or not os.path.exists(STORAGE_STATE_PATH):
+        return None, None
+
+    try:
+        with open(STORAGE_STATE_PATH, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+
+        consent_at = state.pop(STORAGE_STATE_CONSENT_KEY, None)
+        if not consent_at:
+            logger.info("🍪 В сохраненной сессии нет принятого cookie-баннера, обновляю")
+            os.remove(STORAGE_STATE_PATH)
+            return None, None
+
+        age_hours = (time.time() - consent_at) / 3600
+        if age_hours > STORAGE_STATE_MAX_AGE_HOURS:
+            logger.info(f"🍪 Сохраненная сессия устарела ({age_hours:.0f}ч), обновляю")
+            os.remove(STORAGE_STATE_PATH)
+            return None, None
+
+        now = time.time()
+        cookies = state.get('cookies', [])
+        expiring = [c for c in cookies if c.get('expires', -1) > 0]
+        if cookies and expiring and all(c['expires'] < now for c in expiring):
+            logger.info("🍪 Cookies сохраненной сессии истекли, обновляю")
+            os.remove(STORAGE_STATE_PATH)
+            return None, None
+
+        logger.info(f"🍪 Используем сохраненную сессию ({len(cookies)} cookies, consent {age_hours:.1f}ч назад)")
+        return state, consent_at
+
+    except Exception as e:
+        logger.warning(f"⚠️ Ошибка чтения storage_state: {e}, удаляю")
+        try:
+            os.remove(STORAGE_STATE_PATH)
+        except OSError:
+            pass
+        return None, None
+
+async def save_storage_state(session):
+    """
+    Сохраняет cookies/localStorage контекста для следующих запусков.
+    Только если cookie-баннер принят (session["consent_at"]): иначе следующий
+    запуск пропустил бы accept_cookies навсегда.
+    """
+    if not STORAGE_STATE_PATH:
+        return False
+    consent_at = session.get("consent_at")
+    if not consent_at:
+        logger.info("🍪 Cookie-баннер не принят - сессия браузера не сохраняется")
+        return False
+    try:
+        state = await session["context"].storage_state()
+        state[STORAGE_STATE_CONSENT_KEY] = consent_at
+        tmp_path = STORAGE_STATE_PATH + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, STORAGE_STATE_PATH)
+        logger.info(f"✓ Сессия браузера сохранена: {STORAGE_STATE_PATH}")
+        return True
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось сохранить сессию браузера: {e}")
+        return False
+
+async def accept_cookies(page):
+    """Принимает cookies если баннер появился"""
+    try:
+        cookie_buttons = [
+            'button:has-text("Accept Cookies and Continue")',
+            'button:has-text("Accept All")',
+            'button:has-text("Accept")',
+            'text="Accept Cookies and Continue"'
+        ]
+
+        for selector in cookie_buttons:
             try:
                 button = await page.query_selector(selector)
                 if button:
@@ -1278,7 +1621,7 @@ async def reset_to_question_list(page):
                 continue
 
         logger.info("  ℹ️  Переход на базовый URL...")
-        await page.goto('https://coinmarketcap.com/cmc-ai/ask/', wait_until='domcontentloaded', timeout=15000)
+        await page.goto(CMC_AI_URL, wait_until='domcontentloaded', timeout=15000)
         await accept_cookies(page)
         await asyncio.sleep(3)
         return True
@@ -1286,58 +1629,234 @@ async def reset_to_question_list(page):
     except Exception as e:
         logger.warning(f"  ⚠️ Ошибка сброса: {e}")
         try:
-            await page.goto('https://coinmarketcap.com/cmc-ai/ask/', timeout=15000)
+            await page.goto(CMC_AI_URL, timeout=15000)
             await asyncio.sleep(2)
             return True
         except:
             return False
 
-async def get_ai_response(page, question_text):
-    """Получает ответ AI используя точный селектор"""
+def parse_stream_payload(body):
+    """Разбирает тело ответа бэкенда: SSE (data: ...) или обычный JSON"""
+    if not body:
+        return []
+
+    events = []
+    if re.search(r'^data:', body, re.MULTILINE):
+        for line in body.splitlines():
+            if not line.startswith('data:'):
+                continue
+            data = line[5:].strip()
+            if not data or data == '[DONE]':
+                continue
+            try:
+                events.append(json.loads(data))
+            except ValueError:
+                events.append(data)
+        return events
+
     try:
-        logger.info("  ⏳ Ожидание генерации ответа AI...")
-        await asyncio.sleep(5)
+        return [json.loads(body)]
+    except ValueError:
+        return []
 
-        max_attempts = 25
+def collect_stream_texts(node, out, in_delta=False):
+    """
+    Рекурсивно собирает текстовые поля (content/text/delta/...) из JSON
+    как пары (дельта?, текст): дельта - поле "delta" или поле внутри него
+    """
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if isinstance(value, str):
+                if key in ANSWER_STREAM_TEXT_KEYS:
+                    out.append((in_delta or key == 'delta', value))
+            elif isinstance(value, (dict, list)):
+                collect_stream_texts(value, out, in_delta or key == 'delta')
+    elif isinstance(node, list):
+        for item in node:
+            collect_stream_texts(item, out, in_delta)
+    return out
+
+def stream_answer_text(payloads):
+    """
+    Текст ответа из payload'ов без проверки.
+    Полные (накопительные) сообщения не склеиваются: берется последнее с TLDR,
+    у события - только самое длинное текстовое поле (остальное - метаданные).
+    Дельты склеиваются по порядку.
+    """
+    latest = None
+    deltas = []
+    for body in payloads:
+        for event in parse_stream_payload(body):
+            if isinstance(event, str):
+                chunks = [(False, event)]
+            else:
+                chunks = collect_stream_texts(event, [])
+            deltas.extend(text for is_delta, text in chunks if is_delta)
+            snapshot = max((text for is_delta, text in chunks if not is_delta), key=len, default='')
+            if 'TLDR' in snapshot:
+                latest = snapshot
+    return latest or ''.join(deltas)
+
+def strip_markdown(text):
+    """Убирает markdown-разметку, которую бэкенд отдает вместо отрендеренного текста"""
+    text = re.sub(r'\[([^\]]+)\]\([^)]+\)', r'\1', text)
+    text = re.sub(r'^#{1,6}\s*', '', text, flags=re.MULTILINE)
+    text = text.replace('**', '').replace('__', '')
+    return text.strip()
+
+def assemble_stream_answer(payloads):
+    """
+    Собирает ответ из перехваченных payload'ов: последнее полное сообщение (с TLDR),
+    иначе склеенные дельты. None если ответа с TLDR нет.
+    """
+    text = stream_answer_text(payloads)
+    if 'TLDR' in text and len(text) > ANSWER_MIN_LENGTH:
+        return strip_markdown(text)
+    return None
 
-        for attempt in range(max_attempts):
-            try:
-                assistant_container = await page.query_selector('div.MemoizedChatMessage_message-assistant-wrapper__eAoOF')
+def is_answer_stream_response(response):
+    """Проверяет что ответ похож на JSON/SSE стрим чата CMC AI"""
+    try:
+        if response.request.resource_type not in ANSWER_STREAM_RESOURCE_TYPES:
+            return False
+        if not ANSWER_STREAM_URL_PATTERN.search(response.url):
+            return False
+        content_type = response.headers.get('content-type', '')
+        return 'json' in content_type or 'event-stream' in content_type
+    except Exception:
+        return False
 
-                if assistant_container:
-                    full_text = await assistant_container.inner_text()
+class AnswerStreamCapture:
+    """Перехватывает payload'ы бэкенда чата через page.on("response")"""
 
-                    if (full_text and len(full_text) > 200 and 'TLDR' in full_text):
-                        if full_text.startswith('BTC$'):
-                            parts = full_text.split(question_text)
-                            if len(parts) > 1:
-                                full_text = question_text + parts[1]
+    def __init__(self, page):
+        self.page = page
+        self.payloads = []
+        self.started = False         # пришел payload с текстом ответа (TLDR)
+        self.last_payload_at = None  # monotonic время последнего payload'а с текстом ответа
+        self.pending = set()
 
-                        logger.info(f"  ✓ Ответ найден на попытке {attempt + 1}")
-                        return full_text.strip()
+    def attach(self):
+        self.page.on('response', self._on_response)
 
-                html = await page.content()
-                soup = BeautifulSoup(html, 'html.parser')
-                assistant_div = soup.find('div', class_=lambda x: x and 'message-assistant' in str(x))
+    def detach(self):
+        try:
+            self.page.remove_listener('response', self._on_response)
+        except Exception:
+            pass
+        for task in self.pending:
+            task.cancel()
 
-                if assistant_div:
-                    paragraphs = assistant_div.find_all('p')
-                    if len(paragraphs) > 2:
-                        full_answer = '\n\n'.join([p.get_text(strip=True) for p in paragraphs if p.get_text(strip=True)])
-                        if len(full_answer) > 200 and 'TLDR' in full_answer:
-                            logger.info(f"  ✓ Ответ найден на попытке {attempt + 1} (BeautifulSoup)")
-                            return full_answer
+    def _on_response(self, response):
+        if not is_answer_stream_response(response):
+            return
+        task = asyncio.ensure_future(self._read(response))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
 
-            except Exception as e:
-                pass
+    async def _read(self, response):
+        try:
+            # Для SSE text() завершается вместе со стримом
+            body = await response.text()
+            # Посторонние JSON/XHR под тот же URL-паттерн (поллинг страницы)
+            # не считаются ни началом ответа, ни активностью стрима
+            if 'TLDR' in stream_answer_text([body]):
+                self.started = True
+                self.last_payload_at = time.monotonic()
+                self.payloads.append(body)
+        except Exception as e:
+            logger.debug(f"  Не удалось прочитать {response.url}: {e}")
+
+    async def wait_answer(self):
+        """
+        Ждет ответ из стрима; None если бэкенд не ответил или TLDR не найден.
+        Пока стрим читается (pending), ждем до жесткого лимита; без чтений - до
+        ANSWER_STREAM_START_TIMEOUT с начала ожидания (ответ не начался) или
+        ANSWER_STREAM_IDLE_TIMEOUT с последнего payload'а с ответом (ответ начался,
+        но не собрался).
+        """
+        start = time.monotonic()
+        deadline = start + ANSWER_STREAM_TIMEOUT
+        while time.monotonic() < deadline:
+            answer = assemble_stream_answer(self.payloads)
+            if answer:
+                return answer
+            if not self.pending:
+                if self.started:
+                    idle = time.monotonic() - self.last_payload_at > ANSWER_STREAM_IDLE_TIMEOUT
+                else:
+                    idle = time.monotonic() - start > ANSWER_STREAM_START_TIMEOUT
+                if idle:
+                    break
+            await asyncio.sleep(0.25)
+
+        return assemble_stream_answer(self.payloads)
+
+def normalize_assistant_text(full_text, question_text):
+    """Убирает тикер-ленту (BTC$...) перед вопросом в тексте ответа"""
+    if full_text.startswith('BTC$'):
+        parts = full_text.split(question_text)
+        if len(parts) > 1:
+            full_text = question_text + parts[1]
+    return full_text.strip()
+
+def extract_answer_from_html(html):
+    """Fallback: извлекает ответ из HTML страницы через BeautifulSoup"""
+    soup = bs4.BeautifulSoup(html, 'html.parser')
+    # Последнее сообщение ассистента - ответ на только что заданный вопрос
+    assistant_divs = soup.find_all('div', class_=lambda x: x and 'message-assistant' in str(x))
+    assistant_div = assistant_divs[-1] if assistant_divs else None
+
+    if assistant_div:
+        paragraphs = assistant_div.find_all('p')
+        if len(paragraphs) > 2:
+            full_answer = '\n\n'.join([p.get_text(strip=True) for p in paragraphs if p.get_text(strip=True)])
+            if len(full_answer) > ANSWER_MIN_LENGTH and 'TLDR' in full_answer:
+                return full_answer
+    return None
 
-            if attempt < max_attempts - 1:
-                await asyncio.sleep(1)
+async def get_ai_response(page, question_text, base_count=0):
+    """
+    Получает ответ AI через MutationObserver в странице.
+    Ждет новое сообщение ассистента (их больше, чем base_count до клика),
+    пока ответ содержит TLDR и перестал расти (без поллинга и
+    повторной сериализации DOM). BeautifulSoup - только один раз в конце.
+    """
+    try:
+        logger.info("  ⏳ Ожидание генерации ответа AI...")
+        start = time.monotonic()
+
+        result = await page.evaluate(ANSWER_WATCHER_JS, {
+            'selector': ASSISTANT_WRAPPER_SELECTOR,
+            'baseCount': base_count,
+            'minLength': ANSWER_MIN_LENGTH,
+            'idleMs': ANSWER_IDLE_MS,
+            'timeoutMs': ANSWER_TIMEOUT_MS
+        })
+
+        elapsed = time.monotonic() - start
+        full_text = (result or {}).get('text') or ''
 
-            if (attempt + 1) % 5 == 0:
-                logger.info(f"  ⏳ Попытка {attempt + 1}/{max_attempts}...")
+        if result and result.get('complete'):
+            logger.info(f"  ✓ Ответ получен за {elapsed:.1f}s")
+            return normalize_assistant_text(full_text, question_text)
 
-        logger.warning("  ⚠️ Ответ не найден после всех попыток")
+        # Таймаут: возможно ответ есть, но стрим не успокоился
+        if len(full_text) > ANSWER_MIN_LENGTH and 'TLDR' in full_text:
+            logger.warning(f"  ⚠️ Ответ не стабилизировался за {elapsed:.1f}s, беру текущий текст")
+            return normalize_assistant_text(full_text, question_text)
+
+        # Нового сообщения так и нет - в HTML только предыдущие ответы
+        if not (result or {}).get('fresh'):
+            logger.warning(f"  ⚠️ Новый ответ не появился за {elapsed:.1f}s")
+            return None
+
+        full_answer = extract_answer_from_html(await page.content())
+        if full_answer:
+            logger.info("  ✓ Ответ найден (BeautifulSoup)")
+            return full_answer
+
+        logger.warning(f"  ⚠️ Ответ не найден за {elapsed:.1f}s")
         return None
 
     except Exception as e:
@@ -1355,19 +1874,44 @@ async def click_and_get_response(page, question_text, attempt_num=1):
             logger.error(f"✗ Кнопка не найдена")
             return None
 
-        logger.info(f"✓ Кнопка найдена, выполняю клик...")
-        await button.click()
+        # Слушатель ставим до клика, чтобы не пропустить начало стрима
+        capture = None
+        if ANSWER_CAPTURE_MODE == 'network':
+            capture = AnswerStreamCapture(page)
+            capture.attach()
 
-        response = await get_ai_response(page, question_text)
+        try:
+            # Снимок до клика: DOM-детектор ждет только новый ответ
+            base_count = await page.evaluate(ASSISTANT_COUNT_JS, ASSISTANT_WRAPPER_SELECTOR)
+
+            logger.info(f"✓ Кнопка найдена, выполняю клик...")
+            await button.click()
+
+            response = None
+            source = 'dom'
+            if capture:
+                response = await capture.wait_answer()
+                if response:
+                    source = 'network'
+                    logger.info("  ✓ Ответ собран из сетевого стрима")
+                else:
+                    logger.info("  ℹ️  Стрим ответа не найден, fallback на DOM")
+
+            if not response:
+                response = await get_ai_response(page, question_text, base_count)
+        finally:
+            if capture:
+                capture.detach()
 
         if response:
-            logger.info(f"✓ Обработка завершена (длина ответа: {len(response)} символов)")
+            logger.info(f"✓ Обработка завершена (длина ответа: {len(response)} символов, источник: {source})")
             return {
                 'question': question_text,
                 'answer': response,
                 'timestamp': datetime.now(timezone.utc).isoformat(),
                 'attempt': attempt_num,
-                'length': len(response)
+                'length': len(response),
+                'source': source
             }
         else:
             logger.error(f"✗ Ответ не получен")
@@ -1380,7 +1924,7 @@ async def click_and_get_response(page, question_text, attempt_num=1):
 async def get_all_questions(page):
     """Получает список всех доступных вопросов"""
     try:
-        elements = await page.query_selector_all('div.BaseChip_labelWrapper__pQXPT')
+        elements = await page.query_selector_all(QUESTION_CHIP_SELECTOR)
         
         questions_list = []
         seen = set()
@@ -1398,205 +1942,403 @@ async def get_all_questions(page):
         logger.error(f"✗ Ошибка получения списка вопросов: {e}")
         return []
 
-async def main_parser():
-    """Главная функция парсера с умным расписанием"""
-    browser = None
-    try:
-        logger.info("="*70)
-        logger.info("🚀 ЗАПУСК ПАРСЕРА COINMARKETCAP AI v2.1.0")
-        logger.info("="*70)
-        
-        async with async_playwright() as p:
-            logger.info("🌐 Загрузка страницы...")
+async def fetch_answer_with_retries(page, question_text):
+    """Получает ответ на вопрос с повторными попытками и сбросом чата между ними"""
+    for retry in range(MAX_RETRIES + 1):
+        if retry > 0:
+            logger.info(f"\n🔄 Повторная попытка {retry}/{MAX_RETRIES}: {question_text}")
+            await reset_to_question_list(page)
+            await asyncio.sleep(3)
 
-            browser = await p.chromium.launch(
-                headless=True,
-                args=[
-                    '--no-sandbox',
-                    '--disable-setuid-sandbox',
-                    '--disable-dev-shm-usage',
-                    '--disable-gpu',
-                    '--single-process'
-                ]
-            )
+        result = await click_and_get_response(page, question_text, attempt_num=retry + 1)
 
-            context = await browser.new_context(
-                user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                viewport={'width': 1920, 'height': 1080}
-            )
+        if result:
+            return result
+    return None
 
-            page = await context.new_page()
+async def open_question_page(context):
+    """Открывает новую страницу CMC AI в общем контексте (cookies уже приняты)"""
+    page = await context.new_page()
+    await page.goto(CMC_AI_URL, wait_until='domcontentloaded', timeout=20000)
+    await page.wait_for_selector(QUESTION_CHIP_SELECTOR, timeout=15000)
+    return page
 
-            for attempt in range(3):
-                try:
-                    await page.goto('https://coinmarketcap.com/cmc-ai/ask/', wait_until='domcontentloaded', timeout=20000)
-                    logger.info("✓ Страница загружена")
-                    break
-                except Exception as e:
-                    if attempt < 2:
-                        logger.warning(f"⚠️ Попытка {attempt + 1} не удалась, пробую еще раз...")
-                        await asyncio.sleep(3)
-                    else:
-                        raise
+async def harvest_all_answers(context, questions_list, pool_size=MAX_PARALLEL_PAGES):
+    """
+    Собирает ответы на все вопросы параллельно пулом из pool_size страниц.
+    Каждая страница берет вопросы из общей очереди, делает свои retry
+    и возвращается к списку вопросов. Возвращает {вопрос: result}.
+    """
+    queue = asyncio.Queue()
+    for question in questions_list:
+        queue.put_nowait(question)
 
-            logger.info("🍪 Проверка cookie-баннера...")
-            await accept_cookies(page)
+    results = {}
 
-            logger.info("⏳ Ожидание загрузки контента (5 секунд)...")
-            await asyncio.sleep(5)
+    async def worker(worker_id):
+        try:
+            page = await open_question_page(context)
+        except Exception as e:
+            logger.warning(f"  ⚠️ Страница #{worker_id} не открылась: {e}")
+            return
 
-            # Получаем список всех вопросов
-            logger.info("\n🔍 ПОЛУЧЕНИЕ СПИСКА ВОПРОСОВ")
-            questions_list = await get_all_questions(page)
-            
-            if not questions_list:
-                raise Exception("Не найдено ни одного вопроса на странице!")
-            
-            for i, q in enumerate(questions_list, 1):
-                group = get_question_group(q)
-                logger.info(f"  {i}. {q} [{group}]")
+        try:
+            while True:
+                try:
+                    question = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
 
-            # Загружаем историю публикаций
-            history = load_publication_history()
-            
-            # Определяем текущий час UTC
-            current_hour = datetime.now(timezone.utc).hour
-            scheduled_group = SCHEDULE.get(current_hour)
-            
-            logger.info(f"\n⏰ Текущий час UTC: {current_hour}")
-            
-            if not scheduled_group:
-                logger.info(f"⏭️  Нет публикации для часа {current_hour} (scheduled_group=None)")
-                logger.info("✓ Пропускаем этот час - это нормально")
-                logger.info("="*70)
-                return True  # Успешное завершение без публикации
-            
-            logger.info(f"📅 По расписанию должна быть группа: {scheduled_group}")
-            
-            # Определяем какой вопрос публиковать
-            question_to_publish = None
-            
-            if scheduled_group == "DYNAMIC":
-                logger.info("\n🎯 Динамический слот!")
-                
-                # Находим динамический вопрос
-                dynamic_question = None
-                for q in questions_list:
-                    if get_question_group(q) == "dynamic":
-                        dynamic_question = q
-                        break
-                
-                if dynamic_question:
-                    last_dynamic = history.get("last_dynamic_question", "")
-                    
-                    if dynamic_question != last_dynamic:
-                        logger.info(f"✨ Динамический вопрос изменился!")
-                        logger.info(f"   Старый: {last_dynamic}")
-                        logger.info(f"   Новый: {dynamic_question}")
-                        question_to_publish = dynamic_question
-                        
-                        # Обновляем историю динамического вопроса
-                        history["last_dynamic_question"] = dynamic_question
-                    else:
-                        logger.info(f"⚠️ Динамический вопрос не изменился: {dynamic_question}")
-                        logger.info(f"   Ищем самый старый вопрос...")
-                        oldest_group = get_oldest_question_group(history)
-                        question_to_publish = find_question_by_group(questions_list, oldest_group)
-                        if question_to_publish:
-                            scheduled_group = oldest_group
-                        else:
-                            logger.warning(f"⚠️ Не найден вопрос для группы {oldest_group}, публикуем динамический")
-                            question_to_publish = dynamic_question
-                            scheduled_group = "DYNAMIC"
+                result = await fetch_answer_with_retries(page, question)
+                if result:
+                    results[question] = result
+                    logger.info(f"  ✓ [#{worker_id}] {question}")
                 else:
-                    logger.warning("⚠️ Динамический вопрос не найден на странице")
-                    logger.info("   Публикуем самый старый вопрос...")
-                    oldest_group = get_oldest_question_group(history)
-                    question_to_publish = find_question_by_group(questions_list, oldest_group)
-                    if question_to_publish:
-                        scheduled_group = oldest_group
-                    else:
-                        raise Exception(f"Критическая ошибка: не найден вопрос для {oldest_group}")
-            else:
-                # Обычный слот по расписанию
-                question_to_publish = find_question_by_group(questions_list, scheduled_group)
-            
-            # Fallback если вопрос для группы не найден (FIX BUG #14)
-            if not question_to_publish:
-                logger.warning(f"⚠️ Не найден вопрос для группы '{scheduled_group}'")
-                logger.warning(f"   Пытаюсь найти любой доступный вопрос...")
-                
-                # Пробуем найти хоть что-то из стандартных групп
-                for fallback_group in ["kols", "sentiment", "events", "bullish", "narratives", "altcoins"]:
-                    question_to_publish = find_question_by_group(questions_list, fallback_group)
-                    if question_to_publish:
-                        logger.info(f"✓ Найден вопрос из группы '{fallback_group}': {question_to_publish}")
-                        scheduled_group = fallback_group
-                        break
-                
-                # Если совсем ничего - берем первый доступный
-                if not question_to_publish and questions_list:
-                    question_to_publish = questions_list[0]
-                    scheduled_group = get_question_group(question_to_publish)
-                    logger.info(f"✓ Выбран первый доступный вопрос: {question_to_publish}")
-            
-            if not question_to_publish:
-                raise Exception("Критическая ошибка: на странице нет вопросов!")
-            
-            logger.info(f"\n✅ Выбран вопрос для публикации: {question_to_publish}")
-            
-            # Парсим ответ на выбранный вопрос с повторными попытками
-            result = None
-            for retry in range(MAX_RETRIES + 1):
-                if retry > 0:
-                    logger.info(f"\n🔄 Повторная попытка {retry}/{MAX_RETRIES}")
+                    logger.warning(f"  ⚠️ [#{worker_id}] Нет ответа: {question}")
+
+                if not queue.empty():
                     await reset_to_question_list(page)
-                    await asyncio.sleep(3)
-                
-                result = await click_and_get_response(page, question_to_publish, attempt_num=retry + 1)
-                
-                if result:
-                    break
-            
-            if not result:
-                raise Exception(f"Не удалось получить ответ после {MAX_RETRIES + 1} попыток")
-            
-            # Отправляем в Telegram
-            logger.info("\n📤 ОТПРАВКА В TELEGRAM")
-            send_success = send_question_answer_to_telegram(result['question'], result['answer'])
-            
-            if not send_success:
-                logger.warning("⚠️ Ошибка отправки в Telegram, но продолжаем")
-            
-            # Обновляем историю публикаций
-            if scheduled_group == "DYNAMIC":
-                history["dynamic_published_at"] = datetime.now(timezone.utc).isoformat()
-                history["last_published"]["dynamic"] = datetime.now(timezone.utc).isoformat()
+        finally:
+            try:
+                await page.close()
+            except Exception:
+                pass
+
+    pool_size = max(1, min(pool_size, len(questions_list)))
+    logger.info(f"\n🌾 СБОР ОТВЕТОВ: {len(questions_list)} вопросов, {pool_size} страниц")
+    start = time.monotonic()
+
+    await asyncio.gather(*(worker(i + 1) for i in range(pool_size)))
+
+    logger.info(f"✓ Собрано ответов: {len(results)}/{len(questions_list)} за {time.monotonic() - start:.1f}s")
+    return results
+
+def save_harvested_answers(questions_list, answers):
+    """Сохраняет собранные ответы (атомарно через временный файл)"""
+    try:
+        data = {
+            "harvested_at": datetime.now(timezone.utc).isoformat(),
+            "questions": questions_list,
+            "answers": answers
+        }
+        tmp_path = HARVEST_PATH + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, HARVEST_PATH)
+        logger.info(f"✓ Ответы сохранены: {HARVEST_PATH}")
+        return True
+    except Exception as e:
+        logger.error(f"✗ Ошибка сохранения ответов: {e}")
+        return False
+
+def load_harvested_answer(question_text, now=None):
+    """
+    Возвращает ранее собранный ответ на вопрос, если он из текущего окна harvest:
+    собран в тот же день UTC (один пакет слотов) и не старше HARVEST_MAX_AGE_HOURS.
+    Вчерашний ответ о рынке не публикуется - вопрос парсится заново.
+    """
+    try:
+        if not os.path.exists(HARVEST_PATH):
+            return None
+        with open(HARVEST_PATH, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        result = data.get("answers", {}).get(question_text)
+        if not result:
+            return None
+
+        now = now or datetime.now(timezone.utc)
+        harvested_at = datetime.fromisoformat(result['timestamp'].replace('Z', '+00:00'))
+        if harvested_at.tzinfo is None:
+            harvested_at = harvested_at.replace(tzinfo=timezone.utc)
+        age_hours = (now - harvested_at).total_seconds() / 3600
+        if harvested_at.astimezone(timezone.utc).date() != now.date():
+            logger.info(f"ℹ️  Собранный ответ из прошлого пакета harvest ({harvested_at:%Y-%m-%d}): {question_text}")
+            return None
+        if age_hours > HARVEST_MAX_AGE_HOURS:
+            logger.info(f"ℹ️  Собранный ответ устарел ({age_hours:.1f}ч): {question_text}")
+            return None
+
+        logger.info(f"✓ Используем собранный ответ ({age_hours:.1f}ч назад): {question_text}")
+        return result
+    except Exception as e:
+        logger.warning(f"⚠️ Ошибка чтения собранных ответов: {e}")
+        return None
+
+async def launch_browser(p):
+    """Запускает headless Chromium"""
+    return await p.chromium.launch(
+        headless=True,
+        args=[
+            '--no-sandbox',
+            '--disable-setuid-sandbox',
+            '--disable-dev-shm-usage',
+            '--disable-gpu',
+            '--single-process'
+        ]
+    )
+
+async def load_cmc_page(page):
+    """Открывает CMC AI (3 попытки) и ждет появления чипов с вопросами"""
+    for attempt in range(3):
+        try:
+            await page.goto(CMC_AI_URL, wait_until='domcontentloaded', timeout=20000)
+            logger.info("✓ Страница загружена")
+            break
+        except Exception as e:
+            if attempt < 2:
+                logger.warning(f"⚠️ Попытка {attempt + 1} не удалась, пробую еще раз...")
+                await asyncio.sleep(3)
             else:
-                history["last_published"][scheduled_group] = datetime.now(timezone.utc).isoformat()
-            
-            # Сохраняем дополнительную информацию для отладки
-            history["last_publication"] = {
-                "question": result['question'],
-                "group": scheduled_group,
-                "published_at": datetime.now(timezone.utc).isoformat(),
-                "hour_utc": current_hour,
-                "answer_length": result['length']
-            }
-            
-            save_publication_history(history)
-            
-            logger.info(f"\n🎯 ИТОГ")
-            logger.info(f"  ✓ Вопрос: {result['question']}")
-            logger.info(f"  ✓ Группа: {scheduled_group}")
-            logger.info(f"  ✓ Длина ответа: {result['length']} символов")
-            logger.info(f"  ✓ Опубликовано в Telegram: {send_success}")
-            logger.info("="*70)
+                raise
+
+async def wait_for_questions(page):
+    """Ждет чипы с вопросами вместо фиксированной паузы"""
+    logger.info("⏳ Ожидание загрузки контента...")
+    try:
+        await page.wait_for_selector(QUESTION_CHIP_SELECTOR, timeout=15000)
+    except Exception as e:
+        logger.warning(f"⚠️ Чипы с вопросами не появились: {e}")
+
+async def open_cmc_session(browser):
+    """
+    Создает контекст и страницу CMC AI: storage_state, фильтр запросов, cookies.
+    Возвращает dict {"context", "page", "resource_filter", "consent_at"}
+    """
+    storage_state, consent_at = load_storage_state()
+
+    context = await browser.new_context(
+        user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+        viewport={'width': 1920, 'height': 1080},
+        storage_state=storage_state
+    )
+
+    resource_filter = None
+    if RESOURCE_BLOCKING_ENABLED or RESOURCE_BASELINE_RECORD:
+        resource_filter = ResourceFilter(record_baseline=RESOURCE_BASELINE_RECORD)
+        await resource_filter.install(context)
+
+    page = await context.new_page()
+    await load_cmc_page(page)
+
+    session = {"context": context, "page": page, "resource_filter": resource_filter, "consent_at": consent_at}
+    if storage_state:
+        logger.info("🍪 Сессия восстановлена, cookie-баннер пропущен")
+    else:
+        logger.info("🍪 Проверка cookie-баннера...")
+        if await accept_cookies(page):
+            session["consent_at"] = time.time()
+            await save_storage_state(session)
+
+    return session
+
+async def close_cmc_session(session):
+    """Сохраняет сессию браузера, логирует статистику фильтра и закрывает контекст"""
+    # Обновляем сохраненную сессию (продлевает cookies; срок жизни - от consent_at)
+    await save_storage_state(session)
+
+    if session.get("resource_filter"):
+        session["resource_filter"].log_summary()
+
+    try:
+        await session["context"].close()
+    except Exception:
+        pass
+
+async def run_scheduled_slot(session, harvest=False, current_hour=None):
+    """
+    Выбирает вопрос по расписанию, получает ответ и публикует его.
+    Возвращает True (в т.ч. для пустого слота); ошибки пробрасываются.
+    """
+    page = session["page"]
+    context = session["context"]
+
+    slot = publish_ledger.slot_id(hour=current_hour)
+    if not harvest and slot_published(slot):
+        logger.info(f"✓ Слот {slot} уже опубликован (publish_ledger.json) - пропускаем")
+        return True
+
+    await wait_for_questions(page)
+
+    # Получаем список всех вопросов
+    logger.info("\n🔍 ПОЛУЧЕНИЕ СПИСКА ВОПРОСОВ")
+    questions_list = await get_all_questions(page)
+    
+    if not questions_list:
+        raise Exception("Не найдено ни одного вопроса на странице!")
+    
+    for i, q in enumerate(questions_list, 1):
+        group = get_question_group(q)
+        logger.info(f"  {i}. {q} [{group}]")
+    
+    if harvest:
+        answers = await harvest_all_answers(context, questions_list)
+        if answers:
+            save_harvested_answers(questions_list, answers)
+    
+    # Загружаем историю публикаций
+    history = load_publication_history()
+    
+    # Определяем текущий час UTC
+    if current_hour is None:
+        current_hour = datetime.now(timezone.utc).hour
+    scheduled_group = SCHEDULE.get(current_hour)
+    
+    logger.info(f"\n⏰ Текущий час UTC: {current_hour}")
+    
+    if not scheduled_group:
+        logger.info(f"⏭️  Нет публикации для часа {current_hour} (scheduled_group=None)")
+        logger.info("✓ Пропускаем этот час - это нормально")
+        logger.info("="*70)
+        return True  # Успешное завершение без публикации
+    
+    logger.info(f"📅 По расписанию должна быть группа: {scheduled_group}")
+    
+    # Определяем какой вопрос публиковать
+    question_to_publish = None
+    
+    if scheduled_group == "DYNAMIC":
+        logger.info("\n🎯 Динамический слот!")
+    
+        # Находим динамический вопрос
+        dynamic_question = None
+        for q in questions_list:
+            if get_question_group(q) == "dynamic":
+                dynamic_question = q
+                break
+    
+        if dynamic_question:
+            last_dynamic = history.get("last_dynamic_question", "")
+    
+            if dynamic_question != last_dynamic:
+                logger.info(f"✨ Динамический вопрос изменился!")
+                logger.info(f"   Старый: {last_dynamic}")
+                logger.info(f"   Новый: {dynamic_question}")
+                question_to_publish = dynamic_question
+    
+                # Обновляем историю динамического вопроса
+                history["last_dynamic_question"] = dynamic_question
+            else:
+                logger.info(f"⚠️ Динамический вопрос не изменился: {dynamic_question}")
+                logger.info(f"   Ищем самый старый вопрос...")
+                oldest_group = get_oldest_question_group(history)
+                question_to_publish = find_question_by_group(questions_list, oldest_group)
+                if question_to_publish:
+                    scheduled_group = oldest_group
+                else:
+                    logger.warning(f"⚠️ Не найден вопрос для группы {oldest_group}, публикуем динамический")
+                    question_to_publish = dynamic_question
+                    scheduled_group = "DYNAMIC"
+        else:
+            logger.warning("⚠️ Динамический вопрос не найден на странице")
+            logger.info("   Публикуем самый старый вопрос...")
+            oldest_group = get_oldest_question_group(history)
+            question_to_publish = find_question_by_group(questions_list, oldest_group)
+            if question_to_publish:
+                scheduled_group = oldest_group
+            else:
+                raise Exception(f"Критическая ошибка: не найден вопрос для {oldest_group}")
+    else:
+        # Обычный слот по расписанию
+        question_to_publish = find_question_by_group(questions_list, scheduled_group)
+    
+    # Fallback если вопрос для группы не найден (FIX BUG #14)
+    if not question_to_publish:
+        logger.warning(f"⚠️ Не найден вопрос для группы '{scheduled_group}'")
+        logger.warning(f"   Пытаюсь найти любой доступный вопрос...")
+    
+        # Пробуем найти хоть что-то из стандартных групп
+        for fallback_group in ["kols", "sentiment", "events", "bullish", "narratives", "altcoins"]:
+            question_to_publish = find_question_by_group(questions_list, fallback_group)
+            if question_to_publish:
+                logger.info(f"✓ Найден вопрос из группы '{fallback_group}': {question_to_publish}")
+                scheduled_group = fallback_group
+                break
+    
+        # Если совсем ничего - берем первый доступный
+        if not question_to_publish and questions_list:
+            question_to_publish = questions_list[0]
+            scheduled_group = get_question_group(question_to_publish)
+            logger.info(f"✓ Выбран первый доступный вопрос: {question_to_publish}")
+    
+    if not question_to_publish:
+        raise Exception("Критическая ошибка: на странице нет вопросов!")
+    
+    logger.info(f"\n✅ Выбран вопрос для публикации: {question_to_publish}")
+    
+    # Берем собранный ответ или парсим с повторными попытками
+    result = load_harvested_answer(question_to_publish)
+    if not result:
+        result = await fetch_answer_with_retries(page, question_to_publish)
+    
+    if not result:
+        raise Exception(f"Не удалось получить ответ после {MAX_RETRIES + 1} попыток")
+    
+    # Отправляем в Telegram
+    logger.info("\n📤 ОТПРАВКА В TELEGRAM")
+    # Публикация блокирующая (HTTP, OpenAI) - уводим из event loop в поток
+    send_success = await asyncio.to_thread(
+        send_question_answer_to_telegram, result['question'], result['answer'],
+        slot=slot, group=scheduled_group
+    )
+    
+    if not send_success:
+        logger.warning("⚠️ Ошибка отправки в Telegram, но продолжаем")
+    
+    # Обновляем историю публикаций
+    if scheduled_group == "DYNAMIC":
+        history["dynamic_published_at"] = datetime.now(timezone.utc).isoformat()
+        history["last_published"]["dynamic"] = datetime.now(timezone.utc).isoformat()
+    else:
+        history["last_published"][scheduled_group] = datetime.now(timezone.utc).isoformat()
+    
+    # Сохраняем дополнительную информацию для отладки
+    history["last_publication"] = {
+        "question": result['question'],
+        "group": scheduled_group,
+        "published_at": datetime.now(timezone.utc).isoformat(),
+        "hour_utc": current_hour,
+        "answer_length": result['length']
+    }
+    
+    save_publication_history(history)
+    
+    logger.info(f"\n🎯 ИТОГ")
+    logger.info(f"  ✓ Вопрос: {result['question']}")
+    logger.info(f"  ✓ Группа: {scheduled_group}")
+    logger.info(f"  ✓ Длина ответа: {result['length']} символов")
+    logger.info(f"  ✓ Опубликовано в Telegram: {send_success}")
+    logger.info("="*70)
+    
+    return True
+
+async def main_parser(harvest=False):
+    """
+    Главная функция парсера с умным расписанием
+
+    Args:
+        harvest: собрать ответы на все вопросы параллельно перед публикацией слота
+    """
+    browser = None
+    try:
+        logger.info("="*70)
+        logger.info("🚀 ЗАПУСК ПАРСЕРА COINMARKETCAP AI v2.1.0")
+        logger.info("="*70)
+        
+        async with playwright_api.async_playwright() as p:
+            logger.info("🌐 Загрузка страницы...")
+
+            browser = await launch_browser(p)
+            session = await open_cmc_session(browser)
+
+            success = await run_scheduled_slot(session, harvest=harvest)
+
+            await close_cmc_session(session)
 
             await browser.close()
             logger.info("✓ Браузер закрыт\n")
             
-            return True
+            return success
 
     except Exception as e:
         logger.error(f"\n❌ КРИТИЧЕСКАЯ ОШИБКА: {e}")
@@ -1617,10 +2359,207 @@ async def main_parser():
         
         return False
 
+def get_next_slot_time(now=None):
+    """Возвращает время ближайшего слота с публикацией по SCHEDULE (или None)"""
+    now = now or datetime.now(timezone.utc)
+    base = now.replace(minute=DAEMON_SLOT_MINUTE, second=0, microsecond=0)
+
+    for offset in range(25):
+        candidate = base + timedelta(hours=offset)
+        if candidate > now and SCHEDULE.get(candidate.hour):
+            return candidate
+    return None
+
+def install_shutdown_handlers(stop_event):
+    """SIGTERM/SIGINT -> stop_event: текущий слот дорабатывает, новый не начинается"""
+    loop = asyncio.get_running_loop()
+
+    def request_stop(*_):
+        if not stop_event.is_set():
+            logger.info("\n🛑 Получен сигнал остановки, завершаю после текущего слота...")
+        loop.call_soon_threadsafe(stop_event.set)
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, request_stop)
+        except (NotImplementedError, RuntimeError):
+            signal.signal(sig, request_stop)  # Windows
+
+async def run_outbox_worker(stop_event):
+    """Фоновая доставка outbox в daemon: повторы не ждут следующего слота"""
+    while not stop_event.is_set():
+        try:
+            await asyncio.to_thread(drain_outbox)
+        except Exception as e:
+            logger.error(f"✗ Outbox воркер: {e}")
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=OUTBOX_DRAIN_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+async def run_daemon(harvest=False):
+    """
+    Долгоживущий режим: держит браузер, сессию CMC и HTTP-клиенты
+    между слотами и запускает run_scheduled_slot по SCHEDULE.
+    """
+    stop_event = asyncio.Event()
+    install_shutdown_handlers(stop_event)
+
+    logger.info("="*70)
+    logger.info("😈 ЗАПУСК ПАРСЕРА В РЕЖИМЕ DAEMON")
+    logger.info("="*70)
+
+    outbox_task = asyncio.create_task(run_outbox_worker(stop_event))
+
+    async with playwright_api.async_playwright() as p:
+        browser = None
+        session = None
+        try:
+            while not stop_event.is_set():
+                next_slot = get_next_slot_time()
+                if not next_slot:
+                    logger.error("✗ В SCHEDULE нет ни одного слота с публикацией")
+                    return False
+
+                wait_seconds = (next_slot - datetime.now(timezone.utc)).total_seconds()
+                logger.info(f"💤 Следующий слот: {next_slot.strftime('%H:%M')} UTC "
+                            f"[{SCHEDULE[next_slot.hour]}] через {wait_seconds / 60:.0f} мин")
+
+                try:
+                    await asyncio.wait_for(stop_event.wait(), timeout=max(0, wait_seconds))
+                    break
+                except asyncio.TimeoutError:
+                    pass
+
+                slot_start = time.monotonic()
+                try:
+                    if browser is None or not browser.is_connected():
+                        logger.info("🌐 Запуск браузера...")
+                        browser = await launch_browser(p)
+                        session = None
+
+                    if session is None:
+                        session = await open_cmc_session(browser)
+                    else:
+                        await load_cmc_page(session["page"])
+
+                    await run_scheduled_slot(session, harvest=harvest, current_hour=next_slot.hour)
+                    await save_storage_state(session)
+                    logger.info(f"✓ Слот {next_slot.hour}:00 завершен за {time.monotonic() - slot_start:.1f}s")
+
+                except Exception as e:
+                    logger.error(f"\n❌ ОШИБКА СЛОТА {next_slot.hour}:00: {e}")
+                    logger.error(traceback.format_exc())
+                    # Следующий слот начнет с чистой сессии
+                    if session:
+                        await close_cmc_session(session)
+                        session = None
+        finally:
+            stop_event.set()
+            await outbox_task
+            if session:
+                await close_cmc_session(session)
+            if browser:
+                try:
+                    await browser.close()
+                except Exception:
+                    pass
+            logger.info("✓ Daemon остановлен")
+
+    return True
+
+def plan_slot(now=None):
+    """
+    Определяет слот без запуска браузера.
+    Возвращает dict: hour, group (None = пустой слот), due, next_slot,
+    published (слот уже опубликован по журналу - перезапуск ничего не делает),
+    outbox (сколько отложенных публикаций готовы к повторной отправке)
+    """
+    now = now or datetime.now(timezone.utc)
+    group = SCHEDULE.get(now.hour)
+    next_slot = get_next_slot_time(now)
+    published = bool(group) and slot_published(publish_ledger.slot_id(now))
+    return {
+        "hour": now.hour,
+        "group": group,
+        "due": bool(group) and not published,
+        "published": published,
+        "next_slot": next_slot.isoformat() if next_slot else None,
+        "outbox": outbox.get_outbox().pending_count()
+    }
+
+def print_plan(plan):
+    """Печатает план в формате key=value (подходит для $GITHUB_OUTPUT)"""
+    print(f"due={'true' if plan['due'] else 'false'}")
+    print(f"hour={plan['hour']}")
+    print(f"group={plan['group'] or ''}")
+    print(f"next_slot={plan['next_slot'] or ''}")
+    print(f"published={'true' if plan['published'] else 'false'}")
+    print(f"outbox={plan['outbox']}")
+
+def print_import_report():
+    """Печатает отчет -X importtime по модулям проекта; True если бюджет соблюден"""
+    report = import_time_report(IMPORT_REPORT_MODULES, IMPORT_TIME_BUDGET_MS)
+    print(f"Import time: {report['total_ms']:.1f} ms (budget {report['budget_ms']:.0f} ms)")
+    for name, ms in report['top']:
+        print(f"  {ms:8.1f} ms  {name}")
+    if report['heavy']:
+        print(f"✗ Heavy modules loaded at import: {', '.join(report['heavy'])}")
+    print("✓ OK" if report['ok'] else "✗ Import budget exceeded")
+    return report['ok']
+
+def parse_args(argv=None):
+    """Разбирает аргументы командной строки"""
+    arg_parser = argparse.ArgumentParser(description="CoinMarketCap AI parser")
+    arg_parser.add_argument(
+        '--harvest', action='store_true',
+        help="собрать ответы на все вопросы параллельно (пул страниц) и сохранить для следующих слотов"
+    )
+    arg_parser.add_argument(
+        '--plan', action='store_true',
+        help="только показать слот текущего часа (без браузера и тяжелых импортов)"
+    )
+    arg_parser.add_argument(
+        '--import-report', action='store_true',
+        help="отчет о времени import модулей проекта и проверка бюджета IMPORT_TIME_BUDGET_MS"
+    )
+    arg_parser.add_argument(
+        '--daemon', action='store_true',
+        help="долгоживущий режим: теплый браузер и HTTP-клиенты между слотами SCHEDULE"
+    )
+    arg_parser.add_argument(
+        '--drain-outbox', action='store_true',
+        help="только доставить отложенные публикации из outbox (без браузера)"
+    )
+    return arg_parser.parse_args(argv)
+
 def main():
     """Точка входа в программу"""
     lock_file = None
     lock_path = None
+    args = parse_args()
+    
+    if args.import_report:
+        sys.exit(0 if print_import_report() else 1)
+    
+    # Pre-flight: слот определяется до браузера и импорта тяжелых зависимостей.
+    # Только для запуска по расписанию: daemon, harvest и --drain-outbox слот не смотрят
+    scheduled = not (args.daemon or args.harvest or args.drain_outbox)
+    plan = plan_slot() if scheduled or args.plan else None
+    if args.plan:
+        print_plan(plan)
+        sys.exit(0)
+    
+    # В пустой час все равно доставляем то, что застряло в outbox
+    drain_only = args.drain_outbox or (scheduled and not plan["due"] and plan["outbox"] > 0)
+    
+    if scheduled and not plan["due"] and not drain_only:
+        if plan["published"]:
+            logger.info(f"✓ Слот {plan['hour']}:00 UTC уже опубликован (publish_ledger.json) - браузер не запускается")
+        else:
+            logger.info(f"⏭️  Нет публикации для часа {plan['hour']} UTC - браузер не запускается")
+        logger.info(f"   Следующий слот: {plan['next_slot']}")
+        sys.exit(0)
     
     try:
         # Проверка lock-файла (FIX BUG #12, #15, #16, #17, #18)
@@ -1638,8 +2577,12 @@ def main():
         logger.info(f"🔒 Lock файл: {lock_path}")
         logger.info(f"⚙️  Настройки:")
         logger.info(f"   • MAX_RETRIES: {MAX_RETRIES}")
+        logger.info(f"   • Режим: {'outbox' if drain_only else 'daemon' if args.daemon else 'одиночный запуск'}")
+        if plan:
+            logger.info(f"   • Outbox: {plan['outbox']} отложенных публикаций")
+        logger.info(f"   • Harvest: {'✓ Да (' + str(MAX_PARALLEL_PAGES) + ' страниц)' if args.harvest else '✗ Нет'}")
         logger.info(f"   • Telegram Bot Token: {'✓ Установлен' if TELEGRAM_BOT_TOKEN else '✗ Не установлен'}")
-        logger.info(f"   • Telegram Chat ID: {'✓ Установлен' if TELEGRAM_CHAT_ID else '✗ Не установлен'}")
+        logger.info(f"   • Telegram Chat ID: {'✓ ' + str(len(TELEGRAM_CHAT_IDS)) + ' чат(ов)' if TELEGRAM_CHAT_IDS else '✗ Не установлен'}")
         logger.info(f"   • Twitter API: {'✓ Установлен' if all([TWITTER_API_KEY, TWITTER_API_SECRET, TWITTER_ACCESS_TOKEN, TWITTER_ACCESS_TOKEN_SECRET]) else '✗ Не установлен'}")
         logger.info(f"   • Twitter Enabled: {'✓ Да' if TWITTER_ENABLED else '✗ Нет'}")
         logger.info(f"   • Alpha Take Enabled: {'✓ Да' if ALPHA_TAKE_ENABLED else '✗ Нет'}")
@@ -1661,13 +2604,25 @@ def main():
             release_lock(lock_file, lock_path)
             sys.exit(1)
         
+        if drain_only:
+            success = drain_outbox()
+            release_lock(lock_file, lock_path)
+            sys.exit(0 if success else 1)
+        
         # Проверка доступности картинок (FIX BUG #21)
-        validate_image_availability(sample_size=3)
+        validate_image_availability()
         
         logger.info("")
         
+        # Сначала - публикации, не доставленные в прошлых запусках
+        if not args.daemon:
+            drain_outbox()
+        
         # Запускаем основной парсер
-        success = asyncio.run(main_parser())
+        if args.daemon:
+            success = asyncio.run(run_daemon(harvest=args.harvest))
+        else:
+            success = asyncio.run(main_parser(harvest=args.harvest))
         
         # Освобождаем lock
         release_lock(lock_file, lock_path)
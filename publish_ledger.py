@@ -0,0 +1,184 @@
+"""
+publish_ledger.py - Журнал публикаций слота (защита от повторных постов)
+Version: 1.0.0
+
+- Запись на каждую пару (слот, группа, хэш вопроса, платформа/чат)
+- Платформа проверяется по журналу до отправки и отмечается сразу после
+  постановки в outbox ("queued") и после доставки ("sent")
+- Перезапуск в том же слоте (после падения, ручной rerun) не публикует повторно:
+  полностью опубликованный слот пропускается еще до браузера и OpenAI
+- JSON рядом с publication_history.json, запись атомарная (tmp + os.replace)
+
+Проверка (plan_slot в parser.py видит опубликованный слот):
+    python publish_ledger.py
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import threading
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+LEDGER_PATH = os.getenv('PUBLISH_LEDGER_PATH', 'publish_ledger.json')
+LEDGER_RETENTION_DAYS = 7
+
+STATUS_QUEUED = "queued"  # в outbox, доставка еще не подтверждена
+STATUS_SENT = "sent"
+# Пост с тем же содержимым уже отправлен раньше (тот же ключ outbox): повторно не публикуется
+STATUS_DUPLICATE = "duplicate"
+
+
+def slot_id(now=None, hour=None):
+    """Идентификатор часового слота UTC: '2024-05-01T14'"""
+    now = now or datetime.now(timezone.utc)
+    if hour is not None:
+        now = now.replace(hour=hour)
+    return now.strftime('%Y-%m-%dT%H')
+
+
+def content_hash(text):
+    """
+    Хэш публикуемого вопроса. Ответ CMC и Alpha Take между перезапусками
+    меняются, поэтому ключ строится по тексту вопроса, а не по посту.
+    """
+    normalized = ' '.join((text or '').split()).lower()
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()[:16]
+
+
+def make_ledger_key(slot, group, question, platform):
+    return f"{slot}|{group}|{content_hash(question)}|{platform}"
+
+
+class PublishLedger:
+    """{ключ: {"status", "question", "outbox_key", "updated_at"}} в JSON-файле."""
+
+    def __init__(self, path=LEDGER_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def get(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+            return dict(entry) if entry else None
+
+    def mark(self, key, status, question=None, outbox_key=None):
+        """Отмечает платформу и сразу сохраняет журнал на диск"""
+        with self._lock:
+            entry = self.entries.setdefault(key, {})
+            entry["status"] = status
+            if question is not None:
+                entry["question"] = question
+            if outbox_key is not None:
+                entry["outbox_key"] = outbox_key
+            entry["updated_at"] = time.time()
+            self._save_locked()
+
+    def slot_entries(self, slot):
+        """{(группа, хэш): {платформа: запись}} для слота"""
+        publications = {}
+        with self._lock:
+            for key, entry in self.entries.items():
+                entry_slot, group, digest, platform = key.split('|', 3)
+                if entry_slot == slot:
+                    publications.setdefault((group, digest), {})[platform] = dict(entry)
+        return publications
+
+    def slot_complete(self, slot, platforms, is_done=None):
+        """
+        True если в слоте есть публикация, дошедшая до всех platforms.
+
+        Args:
+            is_done: fn(запись) -> bool; по умолчанию - status 'sent' или 'duplicate'
+        """
+        is_done = is_done or (lambda entry: entry["status"] in (STATUS_SENT, STATUS_DUPLICATE))
+        for entries in self.slot_entries(slot).values():
+            if all(p in entries and is_done(entries[p]) for p in platforms):
+                return True
+        return False
+
+    def _save_locked(self):
+        cutoff = time.time() - LEDGER_RETENTION_DAYS * 86400
+        for stale in [k for k, v in self.entries.items() if v.get("updated_at", 0) < cutoff]:
+            del self.entries[stale]
+        try:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, indent=2, ensure_ascii=False, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"⚠️ Не удалось сохранить {self.path}: {e}")
+
+
+_ledger = None
+
+
+def get_ledger():
+    """Общий журнал публикаций процесса"""
+    global _ledger
+    if _ledger is None:
+        _ledger = PublishLedger()
+    return _ledger
+
+
+# ══════════════════════════════════════════════════════════════════
+# ТЕСТЫ
+# ══════════════════════════════════════════════════════════════════
+
+def _test():
+    """plan_slot: published=true только когда в журнале есть все настроенные платформы"""
+    import tempfile
+
+    workdir = tempfile.mkdtemp()
+    # Журнал и outbox parser.py - во временной папке (пути читаются при импорте)
+    os.environ['PUBLISH_LEDGER_PATH'] = os.path.join(workdir, 'publish_ledger.json')
+    os.environ['OUTBOX_PATH'] = os.path.join(workdir, 'outbox.db')
+    import parser as cmc_parser
+
+    cmc_parser.TELEGRAM_CHAT_IDS = ['-1001', '-1002']
+    cmc_parser.TWITTER_ENABLED = True
+    cmc_parser.TWITTER_API_KEY = cmc_parser.TWITTER_API_SECRET = 'key'
+    cmc_parser.TWITTER_ACCESS_TOKEN = cmc_parser.TWITTER_ACCESS_TOKEN_SECRET = 'token'
+
+    now = datetime(2024, 5, 1, 6, 5, tzinfo=timezone.utc)  # слот sentiment
+    slot = slot_id(now)
+    ledger = cmc_parser.publish_ledger.get_ledger()
+    question = "What is the market sentiment?"
+    platforms = cmc_parser.expected_platforms()
+
+    checks = []
+    plan = cmc_parser.plan_slot(now)
+    checks.append(("пустой журнал", not plan["published"] and plan["due"]))
+
+    for platform in platforms[:-1]:
+        ledger.mark(make_ledger_key(slot, "sentiment", question, platform), STATUS_SENT, question=question)
+    plan = cmc_parser.plan_slot(now)
+    checks.append(("не все платформы", not plan["published"] and plan["due"]))
+
+    ledger.mark(make_ledger_key(slot, "sentiment", question, platforms[-1]), STATUS_SENT, question=question)
+    plan = cmc_parser.plan_slot(now)
+    checks.append(("все платформы", plan["published"] and not plan["due"]))
+
+    cmc_parser.TELEGRAM_CHAT_IDS = []
+    cmc_parser.TWITTER_ENABLED = False
+    plan = cmc_parser.plan_slot(now)
+    checks.append(("нет настроенных платформ", not plan["published"]))
+
+    for name, passed in checks:
+        print(f"  {'✓' if passed else '✗'} {name}")
+    all_passed = all(passed for _, passed in checks)
+    print(f"All tests passed: {'✓ YES' if all_passed else '✗ NO'}")
+    return all_passed
+
+
+if __name__ == "__main__":
+    sys.exit(0 if _test() else 1)
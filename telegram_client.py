@@ -0,0 +1,328 @@
+"""
+telegram_client.py - Async транспорт для Telegram Bot API
+Version: 1.1.0
+
+- Один httpx.AsyncClient с keep-alive на весь процесс (без TCP/TLS handshake на каждый вызов)
+- Token bucket на каждый чат (1 msg/s, в группах/каналах еще 20 msg/min)
+  плюс общий bucket бота (30 msg/s) - вместо фиксированных time.sleep
+- Учет retry_after из ответов 429
+- broadcast: одна публикация во много чатов параллельно
+- Счетчики латентности по endpoint'ам (sendMessage, sendPhoto, getMe, ...)
+- Sync-обертки: клиент живет в фоновом event loop, поэтому вызывать можно
+  и из обычного кода, и из другого event loop (await transport.arun(...))
+"""
+
+import os
+import json
+import time
+import atexit
+import asyncio
+import logging
+import threading
+
+from utils import lazy_import
+
+logger = logging.getLogger(__name__)
+
+# httpx грузится при первом запросе
+httpx = lazy_import('httpx')
+
+# httpx логирует URL запросов на INFO - а в URL Bot API есть токен
+logging.getLogger('httpx').setLevel(logging.WARNING)
+
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org')
+
+# Лимиты Telegram: ~1 сообщение в секунду в один чат, 20 в минуту в группу/канал,
+# ~30 в секунду на бота суммарно
+TELEGRAM_CHAT_MIN_INTERVAL = float(os.getenv('TELEGRAM_CHAT_MIN_INTERVAL', '1.0'))
+TELEGRAM_GROUP_PER_MINUTE = float(os.getenv('TELEGRAM_GROUP_PER_MINUTE', '20'))
+TELEGRAM_GLOBAL_PER_SECOND = float(os.getenv('TELEGRAM_GLOBAL_PER_SECOND', '30'))
+TELEGRAM_GROUP_BURST = 5  # сообщений подряд в группу без паузы (фото + остаток + ...)
+
+REQUEST_TIMEOUT = 30
+MAX_RETRY_AFTER = 30  # секунд - дольше на 429 не ждем
+MAX_429_RETRIES = 3
+KEEPALIVE_EXPIRY = 120
+
+
+def is_group_chat(chat_id):
+    """Группы и каналы: отрицательный id или @username канала"""
+    return str(chat_id).startswith(('-', '@'))
+
+
+class TokenBucket:
+    """Token bucket: capacity токенов, пополнение rate токенов в секунду."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    @classmethod
+    def for_window(cls, limit, window, burst=1):
+        """
+        Bucket, который не пропустит больше limit запросов в любом окне window секунд
+        (Telegram считает скользящим окном: burst + rate * window <= limit).
+        """
+        burst = max(1, min(burst, limit))
+        return cls(max(limit - burst, 1) / window, burst)
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        """Сколько ждать до появления токена (0 - можно сейчас)"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def defer(self, seconds, now):
+        """Следующий токен - не раньше чем через seconds (retry_after)"""
+        self._refill(now)
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+
+class ChatRateLimiter:
+    """
+    Per-chat token buckets + общий bucket бота.
+    Токены забираются из всех bucket'ов в один момент - в момент отправки,
+    поэтому ожидание одного лимита не "сжимает" интервалы другого.
+    """
+
+    def __init__(self, min_interval=TELEGRAM_CHAT_MIN_INTERVAL,
+                 group_per_minute=TELEGRAM_GROUP_PER_MINUTE,
+                 global_per_second=TELEGRAM_GLOBAL_PER_SECOND):
+        self.min_interval = min_interval
+        self.group_per_minute = group_per_minute
+        self.global_bucket = TokenBucket.for_window(global_per_second, 1)
+        self._buckets = {}
+        self._locks = {}
+
+    def _chat_buckets(self, chat_id):
+        buckets = self._buckets.get(chat_id)
+        if buckets is None:
+            buckets = [TokenBucket(1 / self.min_interval, 1)]
+            if is_group_chat(chat_id):
+                buckets.append(TokenBucket.for_window(self.group_per_minute, 60, TELEGRAM_GROUP_BURST))
+            self._buckets[chat_id] = buckets
+        return buckets
+
+    async def wait(self, chat_id):
+        buckets = self._chat_buckets(chat_id) + [self.global_bucket]
+        # Запросы в один чат - по очереди; между проверкой и take нет await
+        async with self._locks.setdefault(chat_id, asyncio.Lock()):
+            while True:
+                now = time.monotonic()
+                delay = max(bucket.delay(now) for bucket in buckets)
+                if delay <= 0:
+                    for bucket in buckets:
+                        bucket.take(now)
+                    return
+                await asyncio.sleep(delay)
+
+    def defer(self, chat_id, seconds):
+        """Сдвигает следующий разрешенный запрос в чат (например по retry_after)"""
+        now = time.monotonic()
+        for bucket in self._chat_buckets(chat_id):
+            bucket.defer(seconds, now)
+
+
+class TelegramTransport:
+    """Пул соединений к Bot API одного бота + статистика по endpoint'ам."""
+
+    def __init__(self, token, api_url=TELEGRAM_API_URL, limiter=None):
+        self.token = token
+        self.api_url = api_url.rstrip('/')
+        self.limiter = limiter or ChatRateLimiter()
+        self.stats = {}
+        self._client = None
+        self._loop = None
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    # ------------------------------------------
+    # Фоновый event loop
+    # ------------------------------------------
+
+    def _ensure_loop(self):
+        with self._thread_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever,
+                    name="telegram-transport",
+                    daemon=True
+                )
+                self._thread.start()
+        return self._loop
+
+    def submit(self, coro):
+        """Запускает корутину в loop транспорта, возвращает concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    def run(self, coro, timeout=None):
+        """Синхронно выполняет корутину в loop транспорта"""
+        return self.submit(coro).result(timeout)
+
+    async def arun(self, coro):
+        """Выполняет корутину в loop транспорта из любого другого event loop"""
+        return await asyncio.wrap_future(self.submit(coro))
+
+    def _get_client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=REQUEST_TIMEOUT,
+                # Соединений хватает на весь общий лимит: запрос, получивший токен,
+                # не ждет свободного соединения (иначе интервалы в чат "сжимаются")
+                limits=httpx.Limits(
+                    max_connections=int(TELEGRAM_GLOBAL_PER_SECOND) + 2,
+                    max_keepalive_connections=10,
+                    keepalive_expiry=KEEPALIVE_EXPIRY
+                )
+            )
+        return self._client
+
+    # ------------------------------------------
+    # Bot API
+    # ------------------------------------------
+
+    async def call(self, method, data=None, chat_id=None, timeout=REQUEST_TIMEOUT):
+        """
+        Вызывает метод Bot API.
+
+        Returns:
+            dict: JSON ответа Telegram. При сетевой ошибке -
+                  {"ok": False, "error_code": None, "description": "..."}
+        """
+        url = f"{self.api_url}/bot{self.token}/{method}"
+        # Клиент (и импорт httpx) - до токена лимитера, а не между токеном и отправкой
+        client = self._get_client()
+
+        for attempt in range(MAX_429_RETRIES + 1):
+            if chat_id is not None:
+                await self.limiter.wait(chat_id)
+
+            start = time.monotonic()
+            try:
+                response = await client.post(url, data=data, timeout=timeout)
+            except Exception as e:
+                self._record(method, start, ok=False)
+                return {"ok": False, "error_code": None, "description": str(e)}
+
+            try:
+                result = response.json()
+            except ValueError:
+                result = {"ok": False, "error_code": response.status_code, "description": response.text[:200]}
+
+            self._record(method, start, ok=bool(result.get('ok')))
+
+            if response.status_code == 429 and attempt < MAX_429_RETRIES:
+                retry_after = (result.get('parameters') or {}).get('retry_after', 1)
+                if retry_after <= MAX_RETRY_AFTER:
+                    logger.warning(f"⚠️ Telegram 429 ({method}), повтор через {retry_after}s")
+                    if chat_id is not None:
+                        self.limiter.defer(chat_id, retry_after)
+                    else:
+                        await asyncio.sleep(retry_after)
+                    continue
+
+            return result
+
+        return result
+
+    async def send_message(self, chat_id, text, parse_mode='HTML', reply_markup=None):
+        data = {'chat_id': chat_id, 'text': text, 'parse_mode': parse_mode}
+        if reply_markup:
+            data['reply_markup'] = json.dumps(reply_markup)
+        return await self.call('sendMessage', data, chat_id=chat_id, timeout=10)
+
+    async def send_photo(self, chat_id, photo, caption=None, parse_mode='HTML', reply_markup=None):
+        data = {'chat_id': chat_id, 'photo': photo}
+        if caption:
+            data['caption'] = caption
+            data['parse_mode'] = parse_mode
+        if reply_markup:
+            data['reply_markup'] = json.dumps(reply_markup)
+        return await self.call('sendPhoto', data, chat_id=chat_id, timeout=30)
+
+    async def broadcast(self, chat_ids, send):
+        """
+        Запускает send(chat_id) для всех чатов параллельно
+        (лимиты выдерживают per-chat и общий bucket).
+
+        Returns:
+            dict: {chat_id: True/False}
+        """
+        results = await asyncio.gather(*(send(chat_id) for chat_id in chat_ids), return_exceptions=True)
+        delivered = {}
+        for chat_id, result in zip(chat_ids, results):
+            if isinstance(result, Exception):
+                logger.error(f"✗ Telegram {chat_id}: {result}")
+            delivered[chat_id] = result is True
+        return delivered
+
+    # ------------------------------------------
+    # Статистика и закрытие
+    # ------------------------------------------
+
+    def _record(self, method, start, ok):
+        elapsed_ms = (time.monotonic() - start) * 1000
+        s = self.stats.setdefault(method, {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+        s["calls"] += 1
+        s["total_ms"] += elapsed_ms
+        s["max_ms"] = max(s["max_ms"], elapsed_ms)
+        if not ok:
+            s["errors"] += 1
+
+    def log_stats(self):
+        for method, s in sorted(self.stats.items()):
+            avg = s["total_ms"] / s["calls"] if s["calls"] else 0
+            logger.info(f"📡 Telegram {method}: {s['calls']} вызовов, {s['errors']} ошибок, "
+                        f"avg {avg:.0f} ms, max {s['max_ms']:.0f} ms")
+
+    async def _aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def close(self):
+        if self._loop is None:
+            return
+        try:
+            self.run(self._aclose(), timeout=5)
+        except Exception:
+            pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop.close()
+        self._loop = None
+        self._thread = None
+
+
+_transports = {}
+
+
+def get_telegram_transport(token):
+    """Возвращает общий транспорт для токена (создается при первом вызове)"""
+    transport = _transports.get(token)
+    if transport is None:
+        transport = TelegramTransport(token)
+        _transports[token] = transport
+    return transport
+
+
+def log_all_stats():
+    for transport in _transports.values():
+        transport.log_stats()
+
+
+@atexit.register
+def close_all():
+    for transport in _transports.values():
+        transport.close()
+    _transports.clear()
@@ -0,0 +1,189 @@
+"""
+telegram_stub_server.py - Локальная замена Telegram Bot API для нагрузочных проверок
+Version: 1.0.0
+
+- getMe / sendMessage / sendPhoto отвечают как Bot API (без реальной отправки)
+- Лимиты как у Telegram: 1 msg/s в чат, 20 msg/min в группу/канал, 30 msg/s на бота;
+  превышение -> 429 с parameters.retry_after
+- Нагрузочный прогон TelegramTransport против заглушки:
+    python telegram_stub_server.py --load --chats 40 --messages 3
+- Просто сервер (TELEGRAM_API_URL=http://127.0.0.1:8081 python parser.py ...):
+    python telegram_stub_server.py --port 8081
+"""
+
+import sys
+import json
+import math
+import time
+import argparse
+import threading
+from collections import defaultdict, deque
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import telegram_client
+
+CHAT_MIN_INTERVAL = 1.0
+GROUP_PER_MINUTE = 20
+GLOBAL_PER_SECOND = 30
+# Сетевой джиттер: запросы, пришедшие чуть раньше интервала, не считаем нарушением
+TOLERANCE = 0.05
+
+
+class StubState:
+    """Журнал запросов и проверка лимитов (общий для всех потоков сервера)."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.chat_times = defaultdict(deque)
+        self.global_times = deque()
+        self.accepted = defaultdict(int)
+        self.rejected = defaultdict(int)
+        self.message_id = 0
+
+    def check(self, chat_id, now):
+        """None если запрос разрешен, иначе retry_after (секунды)"""
+        times = self.chat_times[chat_id]
+        while times and now - times[0] > 60 - TOLERANCE:
+            times.popleft()
+        while self.global_times and now - self.global_times[0] > 1 - TOLERANCE:
+            self.global_times.popleft()
+
+        waits = []
+        if times and now - times[-1] < CHAT_MIN_INTERVAL - TOLERANCE:
+            waits.append(CHAT_MIN_INTERVAL - (now - times[-1]))
+        if telegram_client.is_group_chat(chat_id) and len(times) >= GROUP_PER_MINUTE:
+            waits.append(60 - (now - times[-GROUP_PER_MINUTE]))
+        if len(self.global_times) >= GLOBAL_PER_SECOND:
+            waits.append(1 - (now - self.global_times[0]))
+        if waits:
+            return max(1, math.ceil(max(waits)))
+
+        times.append(now)
+        self.global_times.append(now)
+        return None
+
+    def handle(self, method, params):
+        if self.latency:
+            time.sleep(self.latency)
+        if method == 'getMe':
+            return 200, {"ok": True, "result": {"id": 1, "is_bot": True, "username": "stub_bot"}}
+        if method not in ('sendMessage', 'sendPhoto'):
+            return 404, {"ok": False, "error_code": 404, "description": "Not Found: method not found"}
+
+        chat_id = params.get('chat_id')
+        if not chat_id:
+            return 400, {"ok": False, "error_code": 400, "description": "Bad Request: chat_id is empty"}
+
+        with self.lock:
+            retry_after = self.check(chat_id, time.monotonic())
+            if retry_after is not None:
+                self.rejected[chat_id] += 1
+                return 429, {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {retry_after}",
+                    "parameters": {"retry_after": retry_after}
+                }
+            self.accepted[chat_id] += 1
+            self.message_id += 1
+            return 200, {"ok": True, "result": {"message_id": self.message_id, "chat": {"id": chat_id}}}
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, как у настоящего API
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length).decode('utf-8')
+            params = {key: values[0] for key, values in parse_qs(body).items()}
+            method = self.path.rsplit('/', 1)[-1]
+
+            status, payload = state.handle(method, params)
+            data = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def start_server(port=0, latency=0.0):
+    """Запускает заглушку в фоновом потоке; возвращает (server, state, base_url)"""
+    state = StubState(latency)
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="telegram-stub", daemon=True).start()
+    return server, state, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def run_load_test(chats, messages, latency):
+    """Рассылает messages сообщений в каждый из chats чатов через TelegramTransport"""
+    server, state, base_url = start_server(latency=latency)
+    transport = telegram_client.TelegramTransport('STUB', api_url=base_url)
+    chat_ids = [f"-100{i:04d}" if i % 2 else str(1000 + i) for i in range(chats)]
+
+    async def send_all(chat_id):
+        ok = True
+        for n in range(messages):
+            result = await transport.send_message(chat_id, f"load test {n}")
+            ok = ok and bool(result.get('ok'))
+        return ok
+
+    start = time.monotonic()
+    delivered = transport.run(transport.broadcast(chat_ids, send_all))
+    elapsed = time.monotonic() - start
+
+    total = chats * messages
+    rejected = sum(state.rejected.values())
+    # Нижняя граница: 1 msg/s в чат, 20 msg/min в группу, 30 msg/s на бота
+    ideal = max(
+        (messages - 1) * CHAT_MIN_INTERVAL,
+        (math.ceil(messages / GROUP_PER_MINUTE) - 1) * 60 if any(map(telegram_client.is_group_chat, chat_ids)) else 0,
+        (total - GLOBAL_PER_SECOND) / GLOBAL_PER_SECOND,
+        0
+    )
+
+    print(f"Чатов: {chats}, сообщений: {total}, доставлено во все: "
+          f"{sum(delivered.values())}/{chats} чатов")
+    print(f"Время: {elapsed:.2f}s (нижняя граница по лимитам ~{ideal:.2f}s), "
+          f"{total / elapsed:.1f} msg/s")
+    print(f"429 от заглушки: {rejected}")
+    transport.log_stats()
+
+    transport.close()
+    server.shutdown()
+    return rejected == 0 and all(delivered.values())
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Локальная заглушка Telegram Bot API")
+    arg_parser.add_argument('--port', type=int, default=8081)
+    arg_parser.add_argument('--latency', type=float, default=0.0, help="задержка ответа, секунд")
+    arg_parser.add_argument('--load', action='store_true', help="нагрузочный прогон TelegramTransport")
+    arg_parser.add_argument('--chats', type=int, default=40)
+    arg_parser.add_argument('--messages', type=int, default=3)
+    args = arg_parser.parse_args(argv)
+
+    if args.load:
+        return 0 if run_load_test(args.chats, args.messages, args.latency) else 1
+
+    server, _, base_url = start_server(args.port, args.latency)
+    print(f"Заглушка Bot API: {base_url} (Ctrl+C - выход)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""
+text_cleaning.py - Очистка ответов CMC AI по таблице правил
+Version: 1.0.0
+
+- Все правила (вводные фразы CMC, служебные строки, Fear & Greed) - в одной таблице
+- Паттерны компилируются один раз при импорте и сливаются в одну альтернацию:
+  текст проходится за один re.sub вместо цепочки sub/split/join
+- clean() возвращает очищенный текст и сработавшие правила (Counter)
+- Общий движок для parser.py и openai_cmc_integration.py
+
+Проверка и бенчмарк на собранных ответах (harvested_answers.json, иначе встроенные образцы):
+    python text_cleaning.py
+    python text_cleaning.py --benchmark
+"""
+
+import re
+import sys
+import json
+import time
+from collections import Counter
+
+# (имя, ветки, замена). Ветка - (первый символ, остаток паттерна).
+# В слитом regex каждая ветка начинается с литерала: sre собирает из них
+# набор первых символов и пропускает позиции, с которых не начинается
+# ни одно правило, не заходя в альтернативы. Регистронезависимость -
+# внутри остатка через (?i:...), поэтому у первой буквы две ветки.
+TRENDING_REST = (r"(?i:ere are the trending (?:narratives|cryptos) based on CoinMarketCap['\u2018\u2019\"]?s "
+                 r"evolving (?:narrative|momentum) algorithm[^:]*:?\s*)")
+EVENTS_REST = r"(?i:hese are the upcoming crypto events that may impact crypto the most:?\s*)"
+SENTIMENT_SOURCE_REST = r"(?i:from CMC['\u2018\u2019\"]?s Social Sentiment Algorithm\))"
+
+CLEANING_RULES = (
+    # Строка "Researched for Xs" целиком, с начала строки или после отступа
+    # (как line.strip() в прежней версии). Строка с отступом снимается вместе с
+    # переводом строки перед ней: ветка с пробелом в начале проверялась бы на
+    # каждом пробеле текста, а перевод строки встречается редко. Отступ в самом
+    # начале текста не снимается - ответы чистятся после strip()
+    ("researched_for_line", (
+        ("R", r"(?<![^\n]R)esearched for[^\n]*(?:\n|\Z)"),
+        ("\n", r"[ \t\xa0]+Researched for[^\n]*(?=\n|\Z)"),
+    ), ""),
+    ("cmc_trending_intro", (("H", TRENDING_REST), ("h", TRENDING_REST)), ""),
+    ("cmc_events_intro", (("T", EVENTS_REST), ("t", EVENTS_REST)), ""),
+    # "(from CMC's Social Sentiment Algorithm)" вместе с пробелами перед ним
+    ("cmc_sentiment_source", tuple(
+        (space, r"\s*\(" + SENTIMENT_SOURCE_REST) for space in " \n\t\r\xa0"
+    ) + (("(", SENTIMENT_SOURCE_REST),), ""),
+    ("fear_greed_bold", (("(", r"CMC Fear & Greed Index:\s*(\d+)/\d+\)"),), r"<b>\1</b>"),
+)
+
+RULES_BY_NAME = {name: (branches, replacement) for name, branches, replacement in CLEANING_RULES}
+
+CMC_INTRO_RULES = ("cmc_trending_intro", "cmc_events_intro")
+ANSWER_RULES = ("researched_for_line",) + CMC_INTRO_RULES
+QUESTION_RULES = CMC_INTRO_RULES + ("cmc_sentiment_source",)
+SENTIMENT_QUESTION_RULES = QUESTION_RULES + ("fear_greed_bold",)
+
+BACKREFERENCE_PATTERN = re.compile(r'\\(\d+)')
+
+
+class TextCleaner:
+    """
+    Набор правил, слитый в один regex: R(?P<g0>...)|H(?P<g1>...)|...
+    Правило совпадения - по lastgroup; ссылки \\1 в замене пересчитываются
+    на номера групп внутри общего паттерна.
+    """
+
+    def __init__(self, rule_names):
+        self.rule_names = tuple(rule_names)
+        alternatives = []
+        groups = 0
+        self._templates = {}
+        for name in self.rule_names:
+            branches, replacement = RULES_BY_NAME[name]
+            for lead, rest in branches:
+                group = f"g{len(alternatives)}"
+                outer = groups + 1
+                groups = outer + re.compile(rest).groups
+                alternatives.append(f"{re.escape(lead)}(?P<{group}>{rest})")
+                self._templates[group] = (name, BACKREFERENCE_PATTERN.sub(
+                    lambda m, outer=outer: f"\\g<{outer + int(m.group(1))}>", replacement
+                ))
+        self.regex = re.compile('|'.join(alternatives))
+
+    def clean(self, text):
+        """
+        Returns:
+            tuple: (очищенный текст, Counter {имя правила: число срабатываний})
+        """
+        fired = Counter()
+        if not text:
+            return text, fired
+
+        def replace(match):
+            name, template = self._templates[match.lastgroup]
+            fired[name] += 1
+            return match.expand(template) if template else ""
+
+        return self.regex.sub(replace, text), fired
+
+
+# Общие экземпляры - компилируются один раз на процесс
+ANSWER_CLEANER = TextCleaner(ANSWER_RULES)
+INTRO_CLEANER = TextCleaner(CMC_INTRO_RULES)
+QUESTION_CLEANER = TextCleaner(QUESTION_RULES)
+SENTIMENT_QUESTION_CLEANER = TextCleaner(SENTIMENT_QUESTION_RULES)
+
+
+# ══════════════════════════════════════════════════════════════════
+# ТЕСТЫ И БЕНЧМАРК
+# ══════════════════════════════════════════════════════════════════
+
+# Как чистилось до движка: отдельный re.sub на каждое правило + split/join строк
+LEGACY_RULES = {
+    "cmc_trending_intro": (
+        r"Here are the trending (?:narratives|cryptos) based on CoinMarketCap['\u2018\u2019\"]?s evolving "
+        r"(?:narrative|momentum) algorithm[^:]*:?\s*", '', re.IGNORECASE),
+    "cmc_events_intro": (
+        r"These are the upcoming crypto events that may impact crypto the most:?\s*", '', re.IGNORECASE),
+    "cmc_sentiment_source": (
+        r"\s*\(from CMC['\u2018\u2019\"]?s Social Sentiment Algorithm\)", '', re.IGNORECASE),
+    "fear_greed_bold": (r'\(CMC Fear & Greed Index:\s*(\d+)/\d+\)', r'<b>\1</b>', 0),
+}
+
+
+def clean_legacy(text, rule_names):
+    for name in rule_names:
+        if name == "researched_for_line":
+            text = '\n'.join([line for line in text.split('\n') if not line.strip().startswith('Researched for')])
+        else:
+            pattern, replacement, flags = LEGACY_RULES[name]
+            text = re.sub(pattern, replacement, text, flags=flags)
+    return text
+
+
+SAMPLE_ANSWERS = [
+    "Researched for 12s\n\nTLDR\nHere are the trending narratives based on CoinMarketCap's evolving "
+    "narrative algorithm (updated hourly):\n1. AI Agents - tokens up 14% on the week as new launches "
+    "drive volume.\n2. Real World Assets - tokenized treasuries pass $2B TVL.\n3. Memecoins - rotation "
+    "into Solana memes continues.\n\nDeep Dive\n1. AI Agents\nThe sector added $3.1B in market cap "
+    "after several agent frameworks shipped mainnet releases. Volume concentrated in the top 5 tokens.\n"
+    "2. Real World Assets\nInstitutional issuers keep expanding on-chain funds; yields stay near 5%.\n",
+    "Researched for 8s\nTLDR\nMarket sentiment is neutral-to-greedy (CMC Fear & Greed Index: 62/100) "
+    "(from CMC's Social Sentiment Algorithm) as BTC holds above $67K.\n- Funding rates are positive "
+    "but not extreme.\n- Stablecoin inflows rose 3% week over week.\n\nDeep Dive\nBTC dominance "
+    "climbed to 54.2% while ETH/BTC fell to a 3-year low. Options skew turned positive for June expiries.\n",
+    "TLDR\nThese are the upcoming crypto events that may impact crypto the most:\n1. FOMC rate decision "
+    "(Jun 12) - markets price a hold.\n2. Mt. Gox repayments (Jul) - up to 140K BTC could hit exchanges.\n"
+    "3. ETH ETF S-1 approvals - expected before July.\n\nDeep Dive\nMacro: CPI prints on Jun 12, the "
+    "same day as the FOMC decision, which raises volatility risk.\n",
+    "Researched for 15s\nTLDR\nHere are the trending cryptos based on CoinMarketCap\u2019s evolving "
+    "momentum algorithm:\n- TON: +22% after wallet integration news.\n- PEPE: new ATH on rising "
+    "open interest.\n\nDeep Dive\nMomentum leaders share rising social volume and exchange inflows.\n",
+]
+
+
+def load_corpus(path='harvested_answers.json'):
+    """Реальные ответы CMC из harvest (если есть), иначе встроенные образцы"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            answers = json.load(f).get("answers", {})
+        corpus = [a["answer"] for a in answers.values() if a.get("answer")]
+        if corpus:
+            return corpus, path
+    except (OSError, ValueError, AttributeError):
+        pass
+    return SAMPLE_ANSWERS, "встроенные образцы"
+
+
+def _test():
+    """Движок дает тот же результат, что и прежняя цепочка re.sub"""
+    corpus, _ = load_corpus()
+    all_passed = True
+    for cleaner in (ANSWER_CLEANER, QUESTION_CLEANER, SENTIMENT_QUESTION_CLEANER):
+        for text in corpus + ["Researched for 3s\nTLDR\nhere ARE the trending cryptos based on "
+                              "CoinMarketCap\"s evolving momentum algorithm: x \xa0(FROM cmc\u2018s social "
+                              "sentiment algorithm)",
+                              "TLDR\n  Researched for 3s\nBTC up.\n\t\xa0Researched for 5s",
+                              "TLDR\nBTC Researched for nothing\n Researched for\n"]:
+            fused, _ = cleaner.clean(text)
+            if fused != clean_legacy(text, cleaner.rule_names):
+                all_passed = False
+                print(f"  ✗ {cleaner.rule_names}: {text[:60]!r}")
+
+    text, fired = SENTIMENT_QUESTION_CLEANER.clean(SAMPLE_ANSWERS[1])
+    if "<b>62</b>" not in text or fired["fear_greed_bold"] != 1 or fired["cmc_sentiment_source"] != 1:
+        all_passed = False
+        print(f"  ✗ Fear & Greed / источник: {dict(fired)}")
+
+    text, fired = ANSWER_CLEANER.clean(SAMPLE_ANSWERS[0])
+    if "Researched for" in text or "Here are the trending" in text or set(fired) != {
+            "researched_for_line", "cmc_trending_intro"}:
+        all_passed = False
+        print(f"  ✗ Ответ: {dict(fired)}")
+
+    print(f"All tests passed: {'✓ YES' if all_passed else '✗ NO'}")
+    return all_passed
+
+
+def _benchmark(rounds=2000):
+    """Один проход слитого regex против прежней цепочки re.sub/split/join"""
+    corpus, source = load_corpus()
+    total_kb = sum(len(text) for text in corpus) / 1024
+    print(f"Корпус: {len(corpus)} ответов, {total_kb:.1f} KB ({source})")
+
+    for cleaner in (ANSWER_CLEANER, SENTIMENT_QUESTION_CLEANER):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for text in corpus:
+                clean_legacy(text, cleaner.rule_names)
+        legacy = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for text in corpus:
+                cleaner.clean(text)
+        fused = time.perf_counter() - start
+
+        per_kb = 1e6 / (rounds * total_kb)
+        print(f"  {len(cleaner.rule_names)} правил: цепочка {legacy * per_kb:.1f} µs/KB, "
+              f"один проход {fused * per_kb:.1f} µs/KB (x{legacy / fused:.2f})")
+
+
+if __name__ == "__main__":
+    if '--benchmark' in sys.argv[1:]:
+        _benchmark()
+    else:
+        sys.exit(0 if _test() else 1)
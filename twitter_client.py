@@ -0,0 +1,332 @@
+"""
+twitter_client.py - Общая Twitter-сессия и кэш загруженных картинок
+Version: 1.1.0
+
+- tweepy.Client (API v2) и tweepy.API (v1.1, media_upload) создаются один раз на процесс
+- media_id кэшируется по (имя файла, sha256 содержимого) и переиспользуется,
+  пока Twitter считает его действительным (expires_after_secs)
+- Картинка читается из локального Images1/, по HTTP - только если файла нет
+- Лимиты POST /2/tweets берутся из заголовков x-rate-limit-* / x-user-limit-24hour-*
+  и сохраняются между запусками; без wait_on_rate_limit (процесс не засыпает молча)
+- publish_thread: каждый ответ треда - как только позволяют лимиты; если ждать
+  дольше MAX_INLINE_WAIT - возвращает остаток треда для отложенной отправки
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from io import BytesIO
+
+from utils import lazy_import
+
+logger = logging.getLogger(__name__)
+
+tweepy = lazy_import('tweepy')
+requests = lazy_import('requests')
+
+MEDIA_CACHE_PATH = os.getenv('TWITTER_MEDIA_CACHE_PATH', 'twitter_media_cache.json')
+MEDIA_DEFAULT_TTL = 86400  # Twitter: media_id живет 24 часа, если не сказано иное
+MEDIA_REUSE_MARGIN = 3600  # не берем media_id, которому осталось жить меньше часа
+IMAGES_DIR = os.getenv('IMAGES_DIR', 'Images1')
+DOWNLOAD_TIMEOUT = 30
+
+RATE_LIMIT_PATH = os.getenv('TWITTER_RATE_LIMIT_PATH', 'twitter_rate_limits.json')
+TWEETS_ENDPOINT = 'POST /2/tweets'
+RATE_LIMIT_FALLBACK_WAIT = 15 * 60  # 429 без заголовков - окно API v2 по умолчанию
+THREAD_REPLY_MIN_INTERVAL = 1       # секунд между ответами треда (порядок в ленте)
+MAX_INLINE_WAIT = 60                # дольше не ждем в процессе - остаток треда откладывается
+DUPLICATE_STATUS_CODE = 187         # "Status is a duplicate" (API v1.1)
+
+
+class RateLimited(Exception):
+    """Лимит публикаций исчерпан до reset_at (unix-время)"""
+
+    def __init__(self, reset_at):
+        super().__init__(f"rate limit до {time.strftime('%H:%M:%S', time.gmtime(reset_at))} UTC")
+        self.reset_at = reset_at
+
+    @property
+    def retry_after(self):
+        return max(0.0, self.reset_at - time.time())
+
+
+def is_duplicate_tweet_error(error):
+    """
+    Twitter отклонил твит как дубликат. API v1.1 отдает код 187 (api_codes),
+    API v2 - 403 без кода, с detail "...duplicate content" (api_messages).
+    """
+    if DUPLICATE_STATUS_CODE in getattr(error, 'api_codes', ()):
+        return True
+    return isinstance(error, tweepy.Forbidden) and any(
+        'duplicate content' in str(message).lower() for message in error.api_messages
+    )
+
+
+class RateLimitState:
+    """
+    Лимиты endpoint'ов из заголовков ответов, сохраняются в JSON между запусками:
+    {"POST /2/tweets": {"remaining": n, "reset": unix}, "POST /2/tweets [24h]": {...}}
+    """
+
+    HEADER_PREFIXES = (('x-rate-limit', ''), ('x-user-limit-24hour', ' [24h]'))
+
+    def __init__(self, path=RATE_LIMIT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.limits = json.load(f)
+        except (OSError, ValueError):
+            self.limits = {}
+
+    def update(self, endpoint, headers):
+        changed = False
+        for prefix, suffix in self.HEADER_PREFIXES:
+            remaining = headers.get(f'{prefix}-remaining')
+            reset = headers.get(f'{prefix}-reset')
+            if remaining is None or reset is None:
+                continue
+            try:
+                entry = {"remaining": int(remaining), "reset": int(reset)}
+            except ValueError:
+                continue
+            with self._lock:
+                self.limits[endpoint + suffix] = entry
+            changed = True
+        if changed:
+            self.save()
+
+    def mark_exhausted(self, endpoint, reset_at):
+        with self._lock:
+            self.limits[endpoint] = {"remaining": 0, "reset": int(reset_at)}
+        self.save()
+
+    def exhausted_until(self, endpoint, now=None):
+        """Unix-время, до которого лимит endpoint'а исчерпан, или None"""
+        now = now or time.time()
+        until = None
+        with self._lock:
+            for suffix in ('', ' [24h]'):
+                entry = self.limits.get(endpoint + suffix)
+                if entry and entry["remaining"] <= 0 and entry["reset"] > now:
+                    until = max(until or 0, entry["reset"])
+        return until
+
+    def save(self):
+        with self._lock:
+            data = dict(self.limits)
+        try:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"⚠️ Не удалось сохранить лимиты Twitter: {e}")
+
+
+class MediaCache:
+    """JSON-кэш media_id: {"<файл>:<sha256>": {"media_id": ..., "expires_at": ...}}"""
+
+    def __init__(self, path=MEDIA_CACHE_PATH):
+        self.path = path
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def get(self, key):
+        with self._lock:
+            entry = self._load().get(key)
+        if entry and entry["expires_at"] - time.time() > MEDIA_REUSE_MARGIN:
+            return entry["media_id"]
+        return None
+
+    def put(self, key, media_id, ttl):
+        with self._lock:
+            entries = self._load()
+            now = time.time()
+            # Заодно выбрасываем протухшие записи
+            for stale in [k for k, v in entries.items() if v["expires_at"] <= now]:
+                del entries[stale]
+            entries[key] = {"media_id": media_id, "expires_at": now + ttl}
+            try:
+                tmp_path = self.path + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(entries, f, indent=2)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logger.warning(f"⚠️ Не удалось сохранить кэш media_id: {e}")
+
+
+def load_image_bytes(image_url, http_session=None):
+    """Байты картинки: из локального Images1/ (включая variants/), иначе скачиванием"""
+    marker = f"/{IMAGES_DIR}/"
+    name = image_url.split(marker, 1)[1] if marker in image_url else image_url.rsplit('/', 1)[-1]
+    local_path = os.path.join(IMAGES_DIR, *name.split('/'))
+    if os.path.isfile(local_path):
+        with open(local_path, 'rb') as f:
+            return name, f.read()
+
+    session = http_session or requests
+    response = session.get(image_url, timeout=DOWNLOAD_TIMEOUT)
+    response.raise_for_status()
+    return name, response.content
+
+
+class TwitterSession:
+    """tweepy клиенты одного аккаунта + кэш загруженных картинок."""
+
+    def __init__(self, api_key, api_secret, access_token, access_token_secret,
+                 bearer_token=None, media_cache=None, rate_limits=None):
+        self.client = tweepy.Client(
+            bearer_token=bearer_token,  # Может быть None - это ОК для постинга
+            consumer_key=api_key,
+            consumer_secret=api_secret,
+            access_token=access_token,
+            access_token_secret=access_token_secret,
+            # Сырые ответы - ради заголовков x-rate-limit-*; лимиты учитываем сами
+            return_type=requests.Response,
+            wait_on_rate_limit=False
+        )
+        # API v1.1 для загрузки медиа (картинок)
+        self.api = tweepy.API(tweepy.OAuth1UserHandler(
+            api_key, api_secret, access_token, access_token_secret
+        ))
+        self.media_cache = media_cache or MediaCache()
+        self.rate_limits = rate_limits or RateLimitState()
+        self.stats = {"uploads": 0, "cache_hits": 0}
+
+    def upload_image(self, image_url, http_session=None):
+        """
+        Возвращает media_id картинки: из кэша, если он еще действителен,
+        иначе загружает файл в Twitter.
+        """
+        name, data = load_image_bytes(image_url, http_session)
+        key = f"{name}:{hashlib.sha256(data).hexdigest()[:16]}"
+
+        media_id = self.media_cache.get(key)
+        if media_id:
+            self.stats["cache_hits"] += 1
+            logger.info(f"✓ Картинка {name} уже загружена (media_id из кэша)")
+            return media_id
+
+        media = self.api.media_upload(filename=name.rsplit('/', 1)[-1], file=BytesIO(data))
+        ttl = getattr(media, 'expires_after_secs', None) or MEDIA_DEFAULT_TTL
+        self.media_cache.put(key, media.media_id, ttl)
+        self.stats["uploads"] += 1
+        logger.info(f"✓ Картинка {name} загружена ({len(data) // 1024} KB)")
+        return media.media_id
+
+
+    def post_tweet(self, text, media_ids=None, in_reply_to_tweet_id=None):
+        """
+        Публикует твит и обновляет лимиты по заголовкам ответа.
+
+        Returns:
+            str: id твита
+        Raises:
+            RateLimited: лимит исчерпан (по сохраненному состоянию или по 429)
+        """
+        until = self.rate_limits.exhausted_until(TWEETS_ENDPOINT)
+        if until:
+            raise RateLimited(until)
+
+        try:
+            response = self.client.create_tweet(
+                text=text,
+                media_ids=media_ids,
+                in_reply_to_tweet_id=in_reply_to_tweet_id
+            )
+        except tweepy.TooManyRequests as e:
+            self.rate_limits.update(TWEETS_ENDPOINT, e.response.headers)
+            until = self.rate_limits.exhausted_until(TWEETS_ENDPOINT)
+            if not until:
+                until = time.time() + RATE_LIMIT_FALLBACK_WAIT
+                self.rate_limits.mark_exhausted(TWEETS_ENDPOINT, until)
+            raise RateLimited(until)
+
+        self.rate_limits.update(TWEETS_ENDPOINT, response.headers)
+        return response.json()["data"]["id"]
+
+    def publish_thread(self, tweets, media_id=None, reply_to=None,
+                       min_interval=THREAD_REPLY_MIN_INTERVAL, max_wait=MAX_INLINE_WAIT):
+        """
+        Публикует твиты цепочкой ответов. Картинка - к первому твиту.
+        Каждый следующий уходит, как только позволяют лимиты; если ждать
+        дольше max_wait - публикация останавливается.
+
+        Дубликат последнего твита пропускается. Дубликат в середине останавливает
+        тред: id уже опубликованного твита неизвестен, и следующие ответы
+        прицепились бы к предыдущему твиту.
+
+        Returns:
+            dict: posted (id опубликованных), remaining (неотправленные тексты),
+                  reply_to (id, к которому цеплять остаток), retry_at (unix или None),
+                  error (str или None), duplicate (тред остановлен на дубликате)
+        """
+        posted = []
+        result = {"posted": posted, "remaining": [], "reply_to": reply_to, "retry_at": None, "error": None,
+                  "duplicate": False}
+
+        for i, text in enumerate(tweets):
+            wait = min_interval if posted else 0
+            until = self.rate_limits.exhausted_until(TWEETS_ENDPOINT)
+            if until:
+                wait = max(wait, until - time.time())
+            if wait > max_wait:
+                result.update(remaining=tweets[i:], retry_at=time.time() + wait)
+                return result
+            if wait > 0:
+                time.sleep(wait)
+
+            try:
+                tweet_id = self.post_tweet(
+                    text,
+                    media_ids=[media_id] if media_id and not posted and reply_to is None else None,
+                    in_reply_to_tweet_id=result["reply_to"]
+                )
+            except RateLimited as e:
+                result.update(remaining=tweets[i:], retry_at=e.reset_at)
+                return result
+            except tweepy.TweepyException as e:
+                if not is_duplicate_tweet_error(e):
+                    result.update(remaining=tweets[i:], error=str(e))
+                    return result
+                if i == len(tweets) - 1:
+                    logger.warning(f"⚠️ Твит {i + 1} дубликат, пропускаем")
+                    continue
+                logger.warning(f"⚠️ Твит {i + 1} дубликат: остаток треда не к чему цеплять, останавливаемся")
+                result.update(remaining=tweets[i + 1:], duplicate=True)
+                return result
+
+            posted.append(tweet_id)
+            result["reply_to"] = tweet_id
+            logger.info(f"  ✓ Твит {i + 1}/{len(tweets)} опубликован (ID: {tweet_id})")
+
+        return result
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_twitter_session(api_key, api_secret, access_token, access_token_secret, bearer_token=None):
+    """Возвращает общую сессию для набора ключей (создается при первом вызове)"""
+    credentials = (api_key, api_secret, access_token, access_token_secret, bearer_token)
+    with _sessions_lock:
+        session = _sessions.get(credentials)
+        if session is None:
+            session = TwitterSession(*credentials)
+            _sessions[credentials] = session
+            logger.info("✓ Twitter API клиент инициализирован")
+    return session
@@ -1,15 +1,26 @@
 """
 utils.py - Общие утилиты для Radar_CMC_AI
-Version: 1.0.0
+Version: 1.1.0
 
 Централизованные функции для:
-- Подсчёта длины текста для Twitter
-- Безопасного обрезания Unicode текста
-- Работы с emoji
+- Подсчёта длины текста для Twitter (weightedLength twitter-text: таблица весов, URL, emoji)
+- Безопасного обрезания Unicode текста (префиксные суммы весов, линейное время)
+- Работы с emoji и графемами (TextView: обрезка только по границам графем)
+- Ленивого импорта тяжелых зависимостей
 """
 
 import re
+import os
+import sys
+import time
+import bisect
+import itertools
 import logging
+import operator
+import importlib
+import subprocess
+import unicodedata
+from functools import lru_cache
 
 logger = logging.getLogger(__name__)
 
@@ -42,14 +53,263 @@ EMOJI_PATTERN = re.compile(
 )
 
 
+# Графема (видимый символ): базовый символ + combining marks, variation
+# selectors, модификаторы тона кожи, tag-последовательности и ZWJ-цепочки.
+# Флаг = пара regional indicators. Режем текст только по границам графем.
+GRAPHEME_CLUSTER_PATTERN = re.compile(
+    "\r\n"
+    "|[\U0001F1E6-\U0001F1FF]{2}"
+    "|.(?:["
+    "\u0300-\u036F\u1AB0-\u1AFF\u1DC0-\u1DFF\u20D0-\u20FF\uFE20-\uFE2F"  # Combining marks
+    "\uFE00-\uFE0F"                                                      # Variation Selectors
+    "\U0001F3FB-\U0001F3FF"                                              # Skin tones
+    "\U000E0020-\U000E007F"                                              # Tags (флаги регионов)
+    "]|\u200D.)*",
+    flags=re.DOTALL
+)
+
+
+def split_graphemes(text: str) -> list:
+    """Разбивает текст на графемы (emoji-последовательности не разрываются)."""
+    if not text:
+        return []
+    return GRAPHEME_CLUSTER_PATTERN.findall(text)
+
+
+# ══════════════════════════════════════════════════════════════════
+# TWITTER WEIGHTED LENGTH - как twitter-text v3 (weightedLength)
+# ══════════════════════════════════════════════════════════════════
+
+MAX_TWEET_LENGTH = 280
+TWITTER_WEIGHT_SCALE = 100
+TWITTER_DEFAULT_WEIGHT = 200
+TWITTER_URL_WEIGHT = 23 * TWITTER_WEIGHT_SCALE
+TWITTER_EMOJI_WEIGHT = 2 * TWITTER_WEIGHT_SCALE
+
+# Диапазоны кодпоинтов с весом 1 (включительно), остальное - 2
+TWITTER_LIGHT_RANGES = (
+    (0x0000, 0x10FF),  # Latin, Cyrillic, Greek, Arabic, Hebrew, ... до Hangul Jamo
+    (0x2000, 0x200D),  # Пробелы и ZWJ
+    (0x2010, 0x201F),  # Дефисы, тире, кавычки
+    (0x2032, 0x2037),  # Штрихи
+)
+
+
+def _build_weight_table(light_ranges):
+    """Отсортированные начала диапазонов и их веса для bisect: вес действует до следующего начала"""
+    starts, weights = [], []
+    for first, last in light_ranges:
+        if starts and starts[-1] == first:
+            weights[-1] = TWITTER_WEIGHT_SCALE
+        else:
+            starts.append(first)
+            weights.append(TWITTER_WEIGHT_SCALE)
+        starts.append(last + 1)
+        weights.append(TWITTER_DEFAULT_WEIGHT)
+    return tuple(starts), tuple(weights)
+
+
+TWITTER_WEIGHT_STARTS, TWITTER_WEIGHTS = _build_weight_table(TWITTER_LIGHT_RANGES)
+
+
+def codepoint_weight(codepoint: int) -> int:
+    """Вес кодпоинта в единицах TWITTER_WEIGHT_SCALE"""
+    return TWITTER_WEIGHTS[bisect.bisect_right(TWITTER_WEIGHT_STARTS, codepoint) - 1]
+
+
+# Emoji-последовательность из нескольких кодпоинтов Twitter считает как 2 целиком:
+# флаг, keycap, база + variation selector / тон кожи / tag / ZWJ-цепочка.
+# Одиночные кодпоинты (включая emoji) весят по таблице.
+# Модификаторы, которыми кластер продолжается после базового символа (все тяжелые)
+TWITTER_CLUSTER_TAIL_RANGES = ((0xFE0F, 0xFE0F), (0x20E3, 0x20E3), (0x1F3FB, 0x1F3FF), (0xE0020, 0xE007F))
+
+
+def _char_class(ranges) -> str:
+    return ''.join(f"\\U{first:08X}-\\U{last:08X}" for first, last in ranges)
+
+
+_HEAVY_CHARS = _char_class(
+    (start, end - 1)
+    for start, end, weight in zip(TWITTER_WEIGHT_STARTS, TWITTER_WEIGHT_STARTS[1:] + (0x110000,), TWITTER_WEIGHTS)
+    if weight != TWITTER_WEIGHT_SCALE
+)
+_CLUSTER_TAIL_CHARS = _char_class(TWITTER_CLUSTER_TAIL_RANGES)
+# Паттерн начинается с одного класса символов: regex-движок пропускает ASCII
+# без перебора веток. Ветки проверяют уже взятый не-ASCII символ через lookbehind.
+# Кластер - тяжелый символ (длина 1) или emoji-последовательность; keycap
+# начинается с FE0F/20E3 (цифра перед ним - отдельно, TWITTER_KEYCAP_PATTERN).
+TWITTER_WEIGHT_SCAN_PATTERN = re.compile(
+    "[^\\x00-\\x7F](?:"
+    "(?<=[0-9#*]\uFE0F)\u20E3|(?<=[0-9#*]\u20E3)"
+    "|(?<=[\U0001F1E6-\U0001F1FF])[\U0001F1E6-\U0001F1FF]"
+    f"|(?:[{_CLUSTER_TAIL_CHARS}]|\u200D[^\\x00-\\x7F])+"
+    f"|(?<=[{_HEAVY_CHARS}]))"
+)
+TWITTER_KEYCAP_PATTERN = re.compile("[0-9#*]\uFE0F?\u20E3")
+# Быстрый проход: кластер начинается только с тяжелого символа, поэтому
+# кириллица, латиница с диакритикой и типографика пропускаются без проверок.
+# Кластеры те же, что у TWITTER_WEIGHT_SCAN_PATTERN, если ни один не начинается
+# с модификатора и все ZWJ вошли в кластеры: иначе был keycap или
+# последовательность с легкой базой (_segment_weight)
+TWITTER_HEAVY_SCAN_PATTERN = re.compile(
+    f"[{_HEAVY_CHARS}](?:"
+    "(?<=[\U0001F1E6-\U0001F1FF])[\U0001F1E6-\U0001F1FF]"
+    f"|(?:[{_CLUSTER_TAIL_CHARS}]|\u200D[^\\x00-\\x7F])+"
+    ")?"
+)
+TWITTER_CLUSTER_TAIL_PATTERN = re.compile(f"[{_CLUSTER_TAIL_CHARS}]")
+_CLUSTER_TAIL_SET = frozenset(
+    chr(codepoint) for first, last in TWITTER_CLUSTER_TAIL_RANGES for codepoint in range(first, last + 1)
+)
+_first_char = operator.itemgetter(0)
+
+# URL (http/https, www., домен с распространенной TLD) = 23 независимо от длины.
+# Путь и query - только из допустимых символов twitter-text (validGeneralUrlPathChars,
+# validUrlQueryChars) и заканчиваются на допустимый последний символ: emoji, "…",
+# точка или запятая в конце - уже текст после URL.
+# Приближение: голый домен без схемы и www. распознается только с TLD из этого
+# списка (в twitter-text - полный список IANA, ~1500 TLD). Домен с другой TLD
+# ("example.store") считается как текст, а не как URL.
+TWITTER_URL_TLDS = (
+    "com|org|net|io|ai|co|xyz|app|gg|me|dev|info|finance|fi|exchange|news|tv|ly|to|"
+    "us|uk|de|fr|ru|eu"
+)
+_URL_LETTERS = "a-z0-9\u00C0-\u00D6\u00D8-\u00F6\u00F8-\u00FF\u0400-\u04FF"  # латиница с диакритикой, кириллица
+_URL_HOST = r"[a-z0-9](?:[a-z0-9-]*[a-z0-9])?"
+_URL_PATH_CHARS = _URL_LETTERS + r"!*';:=+,.$/%#\[\]\-\u2013_~&|@"
+_URL_PATH_END_CHARS = _URL_LETTERS + r"=_#/+\-"
+_URL_QUERY_CHARS = r"a-z0-9!?*'();:&=+$/%#\[\]\-_.,~|@"
+_URL_QUERY_END_CHARS = r"a-z0-9\-_&=#/"
+TWITTER_URL_PATTERN = re.compile(
+    r"(?<![\w@$#./-])"
+    r"(?:(?:https?://|www\.)" + _URL_HOST + r"(?:\." + _URL_HOST + r")*"
+    r"|(?:" + _URL_HOST + r"\.)+(?:" + TWITTER_URL_TLDS + r")\b)"
+    r"(?::\d+)?"
+    r"(?:/(?:[" + _URL_PATH_CHARS + r"]*[" + _URL_PATH_END_CHARS + r"])?)?"
+    r"(?:\?[" + _URL_QUERY_CHARS + r"]*[" + _URL_QUERY_END_CHARS + r"])?",
+    flags=re.IGNORECASE
+)
+_NON_SPACE_PATTERN = re.compile(r"\S*")
+def _url_hints(text: str) -> list:
+    """
+    Позиции признаков URL: точка перед буквой или цифрой (www., домен) и "://".
+    Через str.find, а не regex: на тексте без URL это почти бесплатно.
+    """
+    hints = []
+    position = text.find('.')
+    while position >= 0:
+        if text[position + 1:position + 2].isalnum():
+            hints.append(position)
+        position = text.find('.', position + 1)
+    if '://' in text:
+        position = text.find('://')
+        while position >= 0:
+            hints.append(position)
+            position = text.find('://', position + 1)
+        hints.sort()
+    return hints
+
+
+def find_urls(text: str) -> list:
+    """
+    Границы URL в тексте [(start, end), ...] - как TWITTER_URL_PATTERN.finditer(text),
+    но полный паттерн прогоняется только по словам с признаком URL: URL не содержит
+    пробельных символов, поэтому слово - достаточное окно поиска.
+    """
+    spans = []
+    scanned = 0
+    for hint in _url_hints(text):
+        if hint < scanned:
+            continue
+        # Окно - от пробела/перевода строки (другие пробельные символы только
+        # расширяют окно) до любого пробельного символа; lookbehind паттерна
+        # видит символ перед pos, \b на endpos - как на пробеле
+        start = max(text.rfind(' ', scanned, hint), text.rfind('\n', scanned, hint), scanned - 1) + 1
+        end = _NON_SPACE_PATTERN.match(text, hint).end()
+        match = TWITTER_URL_PATTERN.search(text, start, end)
+        while match:
+            spans.append(match.span())
+            match = match.end() < end and TWITTER_URL_PATTERN.search(text, match.end(), end)
+        scanned = end
+    return spans
+
+
+TWITTER_LENGTH_CACHE_SIZE = int(os.getenv('TWITTER_LENGTH_CACHE_SIZE', '1024'))
+
+
+def _segment_weight(segment: str) -> int:
+    """
+    Вес фрагмента без URL: по 1 за кодпоинт + поправки для тяжелых символов и emoji.
+
+    Кластер из n кодпоинтов весит 2: тяжелый символ - кластер из одного, и
+    TWITTER_DEFAULT_WEIGHT == TWITTER_EMOJI_WEIGHT,
+    поэтому поправка считается по числу и суммарной длине кластеров без цикла.
+    Keycap весит 2 вместе с цифрой, которая уже посчитана как 1.
+    """
+    weight = TWITTER_WEIGHT_SCALE * len(segment)
+    if segment.isascii():
+        return weight
+    clusters = TWITTER_HEAVY_SCAN_PATTERN.findall(segment)
+    joined = ''.join(clusters)
+    # Кластер с модификатора или ZWJ вне кластеров - значит, была keycap-цифра
+    # или легкая база: полный проход (модификаторы проверяются по короткой joined)
+    if ((TWITTER_CLUSTER_TAIL_PATTERN.search(joined)
+            and not _CLUSTER_TAIL_SET.isdisjoint(map(_first_char, clusters)))
+            or ('\u200D' in segment and joined.count('\u200D') != segment.count('\u200D'))):
+        clusters = TWITTER_WEIGHT_SCAN_PATTERN.findall(segment)
+        joined = ''.join(clusters)
+        if '\u20E3' in segment:
+            weight -= TWITTER_WEIGHT_SCALE * len(TWITTER_KEYCAP_PATTERN.findall(segment))
+    return weight + TWITTER_EMOJI_WEIGHT * len(clusters) - TWITTER_WEIGHT_SCALE * len(joined)
+
+
+def _weighted_length(text: str) -> int:
+    if text.isascii():
+        # ASCII: вес 1 за символ, URL заменяется на 23 - без разбора на фрагменты
+        if '.' not in text:
+            return len(text)
+        length = len(text)
+        for start, end in find_urls(text):
+            length += TWITTER_URL_WEIGHT // TWITTER_WEIGHT_SCALE - (end - start)
+        return length
+
+    text = unicodedata.normalize('NFC', text)
+    # Без точки нет домена - нет и URL (так же считает TextView)
+    urls = find_urls(text) if '.' in text else None
+    if not urls:
+        return _segment_weight(text) // TWITTER_WEIGHT_SCALE
+    # URL из ASCII с ASCII-символом (или концом текста) после него не граничит
+    # ни с одним кластером: вес текста целиком минус вес URL, без нарезки
+    if all(text[start:end + 1].isascii() for start, end in urls):
+        weight = _segment_weight(text)
+        for start, end in urls:
+            weight += TWITTER_URL_WEIGHT - TWITTER_WEIGHT_SCALE * (end - start)
+        return weight // TWITTER_WEIGHT_SCALE
+    weight = 0
+    position = 0
+    for start, end in urls:
+        weight += _segment_weight(text[position:start]) + TWITTER_URL_WEIGHT
+        position = end
+    weight += _segment_weight(text[position:])
+    return weight // TWITTER_WEIGHT_SCALE
+
+
+if TWITTER_LENGTH_CACHE_SIZE > 0:
+    _weighted_length = lru_cache(maxsize=TWITTER_LENGTH_CACHE_SIZE)(_weighted_length)
+
+
 def get_twitter_length(text: str) -> int:
     """
-    Вычисляет длину текста как её видит Twitter.
+    Вычисляет длину текста как её видит Twitter (weightedLength из twitter-text).
+    
+    Twitter считает (после NFC-нормализации):
+    - Символы из TWITTER_LIGHT_RANGES (латиница, кириллица, пунктуация) = 1
+    - Остальные кодпоинты (CJK, emoji, символы) = 2
+    - Emoji-последовательность (флаг, ZWJ-семья, тон кожи, keycap) = 2 целиком
+    - URL = 23 независимо от длины (домен без схемы и www. - только с TLD
+      из TWITTER_URL_TLDS, это приближение полного списка twitter-text)
     
-    Twitter считает:
-    - Обычные символы = 1
-    - Emoji = 2 (каждый emoji занимает 2 "weighted characters")
-    - URL = 23 (но мы не обрабатываем URL тут)
+    Результат кэшируется (TWITTER_LENGTH_CACHE_SIZE, 0 - без кэша).
     
     Args:
         text: Текст для подсчёта
@@ -59,16 +319,7 @@ def get_twitter_length(text: str) -> int:
     """
     if not text:
         return 0
-    
-    # Находим все emoji (каждый отдельно)
-    emoji_matches = EMOJI_PATTERN.findall(text)
-    emoji_count = len(emoji_matches)
-    
-    # Twitter: каждый emoji считается как 2, но занимает 1 позицию в строке
-    # Поэтому: len(text) + emoji_count (добавляем +1 за каждый emoji)
-    twitter_length = len(text) + emoji_count
-    
-    return twitter_length
+    return _weighted_length(text)
 
 
 def get_visual_length(text: str) -> int:
@@ -84,6 +335,183 @@ def get_visual_length(text: str) -> int:
     return len(clean)
 
 
+# ══════════════════════════════════════════════════════════════════
+# ОБРЕЗКА ПО ВЕСУ TWITTER - префиксные суммы + bisect
+# ══════════════════════════════════════════════════════════════════
+
+# Конец предложения: знаки препинания, за которыми идет пробел/перевод строки
+SENTENCE_END_PATTERN = re.compile(r'[.!?]+(?=\s)')
+# Обрезка по предложению не короче этого (иначе "1." из нумерованного списка)
+MIN_SENTENCE_CUT = 20
+
+
+class TextView:
+    """
+    Текст, разбитый на графемы один раз.
+
+    offsets - границы графем в кодпоинтах (len(view) + 1 значений),
+    prefix_weights[i] - вес Twitter первых i графем (считается при первом
+    обращении). URL весит 23 целиком: вес записан на его первую графему.
+    """
+
+    __slots__ = ('text', 'offsets', '_prefix')
+
+    def __init__(self, text: str):
+        self.text = text or ""
+        if self.text.isascii() and '\r' not in self.text:
+            self.offsets = range(len(self.text) + 1)
+        else:
+            offsets = [0]
+            position = 0
+            for grapheme in GRAPHEME_CLUSTER_PATTERN.findall(self.text):
+                position += len(grapheme)
+                offsets.append(position)
+            self.offsets = offsets
+        self._prefix = None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def prefix_weights(self):
+        if self._prefix is None:
+            self._prefix = self._build_prefix()
+        return self._prefix
+
+    def _build_prefix(self):
+        text = self.text
+        urls = find_urls(text) if '.' in text else []
+        if isinstance(self.offsets, range) and not urls:
+            return range(len(text) + 1)
+
+        offsets = self.offsets
+        weights = []
+        for start, end in zip(offsets, offsets[1:]):
+            grapheme = text[start:end]
+            if grapheme.isascii():
+                weights.append(end - start)
+            else:
+                grapheme = unicodedata.normalize('NFC', grapheme)
+                weights.append(_segment_weight(grapheme) // TWITTER_WEIGHT_SCALE)
+        for url_start, url_end in urls:
+            first = bisect.bisect_right(offsets, url_start) - 1
+            last = bisect.bisect_left(offsets, url_end)
+            weights[first] = TWITTER_URL_WEIGHT // TWITTER_WEIGHT_SCALE
+            for index in range(first + 1, last):
+                weights[index] = 0
+        return list(itertools.accumulate(weights, initial=0))
+
+    def weight(self) -> int:
+        """Вес Twitter всего текста"""
+        return self.prefix_weights[-1]
+
+    def fit(self, max_length: int) -> int:
+        """Сколько первых графем укладывается в max_length"""
+        return max(bisect.bisect_right(self.prefix_weights, max_length) - 1, 0)
+
+    def head(self, count: int) -> str:
+        """Первые count графем"""
+        return self.text[:self.offsets[min(max(count, 0), len(self))]]
+
+    def clip(self, max_chars: int, suffix: str = "...") -> str:
+        """
+        Замена text[:max_chars - len(suffix)] + suffix: не длиннее max_chars
+        кодпоинтов, но режет только по границе графемы (флаги, ZWJ-цепочки
+        и тоны кожи не разрываются). Короткий текст возвращается как есть.
+        """
+        if len(self.text) <= max_chars:
+            return self.text
+        budget = max_chars - len(suffix)
+        if budget <= 0:
+            return self.head(bisect.bisect_right(self.offsets, max(max_chars, 0)) - 1)
+        return self.head(bisect.bisect_right(self.offsets, budget) - 1) + suffix
+
+
+TEXT_VIEW_CACHE_SIZE = 256
+
+
+@lru_cache(maxsize=TEXT_VIEW_CACHE_SIZE)
+def text_view(text: str) -> TextView:
+    """Общий TextView на текст: графемы и веса считаются один раз на все места обрезки"""
+    return TextView(text)
+
+
+def _last_sentence_end(text: str, limit: int) -> int:
+    """Конец последнего предложения, целиком лежащего в text[:limit] (0 если нет)"""
+    end = 0
+    for match in SENTENCE_END_PATTERN.finditer(text, 0, limit + 1):
+        if match.end() <= limit:
+            end = match.end()
+    return end
+
+
+def _cut_within(view: TextView, max_length: int, budget: int, cut) -> str:
+    """
+    Вызывает cut(limit) для места обрезки по префиксным суммам и проверяет
+    результат точным get_twitter_length. Разрез может создать или разорвать
+    URL (вес 23 вместо суммы графем) - тогда бюджет уменьшается на превышение
+    и место ищется заново. Возвращает None, если cut ничего не дал.
+    """
+    while budget > 0:
+        result = cut(view.offsets[view.fit(budget)])
+        if not result:
+            return None
+        excess = get_twitter_length(result) - max_length
+        if excess <= 0:
+            return result
+        budget -= excess
+    return None
+
+
+def truncate_by_weight(text: str, max_length: int, suffix: str = "...",
+                       level: str = "word", view: TextView = None) -> str:
+    """
+    Обрезает текст до веса Twitter max_length за линейное время.
+
+    Веса графем считаются один раз, место обрезки ищется bisect по
+    префиксным суммам, затем отступает к ближайшей границе уровня:
+    - "sentence": целые предложения без суффикса, иначе как "word"
+    - "word": по последнему пробелу + suffix, иначе как "grapheme"
+    - "grapheme": по границе графемы + suffix (emoji не разрываются)
+    Результат всегда проверяется get_twitter_length.
+    """
+    if not text:
+        return ""
+    if get_twitter_length(text) <= max_length:
+        return text
+    view = view or text_view(text)
+
+    if level == "sentence":
+        def sentence_cut(limit):
+            end = _last_sentence_end(text, limit)
+            return text[:end] if end >= MIN_SENTENCE_CUT else None
+
+        result = _cut_within(view, max_length, max_length, sentence_cut)
+        if result:
+            return result
+
+    budget = max_length - get_twitter_length(suffix)
+    if budget <= 0:
+        # Даже суффикс не помещается
+        return _cut_within(view, max_length, max_length, lambda limit: text[:limit]) or ""
+
+    if level != "grapheme":
+        def word_cut(limit):
+            space = max(text.rfind(' ', 0, limit + 1), text.rfind('\n', 0, limit + 1))
+            cut = text[:space].rstrip() if space > 0 else ""
+            return cut + suffix if cut else None
+
+        result = _cut_within(view, max_length, budget, word_cut)
+        if result:
+            return result
+
+    def grapheme_cut(limit):
+        cut = text[:limit].rstrip()
+        return cut + suffix if cut else None
+
+    return _cut_within(view, max_length, budget, grapheme_cut) or ""
+
+
 def safe_truncate(text: str, max_length: int, suffix: str = "...") -> str:
     """
     Безопасно обрезает текст учитывая emoji и Unicode.
@@ -101,59 +529,7 @@ def safe_truncate(text: str, max_length: int, suffix: str = "...") -> str:
     Returns:
         str: Обрезанный текст
     """
-    if not text:
-        return ""
-    
-    # Если уже помещается - возвращаем как есть
-    if get_twitter_length(text) <= max_length:
-        return text
-    
-    suffix_length = get_twitter_length(suffix)
-    target_length = max_length - suffix_length
-    
-    if target_length <= 0:
-        # Даже суффикс не помещается
-        return text[:max_length] if max_length > 0 else ""
-    
-    # Разбиваем на "графемы" (визуальные символы)
-    # Используем простой подход: идём по символам и проверяем длину
-    result = []
-    current_length = 0
-    
-    # Разбиваем текст на слова для умного обрезания
-    words = text.split(' ')
-    
-    for i, word in enumerate(words):
-        word_length = get_twitter_length(word)
-        space_length = 1 if i > 0 else 0
-        
-        if current_length + space_length + word_length <= target_length:
-            if i > 0:
-                result.append(' ')
-                current_length += 1
-            result.append(word)
-            current_length += word_length
-        else:
-            # Слово не помещается целиком
-            if not result:
-                # Первое слово - обрезаем его
-                chars = list(word)
-                for char in chars:
-                    char_len = get_twitter_length(char)
-                    if current_length + char_len <= target_length:
-                        result.append(char)
-                        current_length += char_len
-                    else:
-                        break
-            break
-    
-    final_text = ''.join(result).rstrip()
-    
-    # Добавляем суффикс
-    if final_text and get_twitter_length(final_text + suffix) <= max_length:
-        return final_text + suffix
-    
-    return final_text
+    return truncate_by_weight(text, max_length, suffix, level="word")
 
 
 def count_emojis(text: str) -> int:
@@ -173,7 +549,7 @@ def remove_emojis(text: str) -> str:
     return text
 
 
-def truncate_to_tweet_length(text: str, max_length: int = 280) -> str:
+def truncate_to_tweet_length(text: str, max_length: int = MAX_TWEET_LENGTH) -> str:
     """
     Обрезает текст до длины твита.
     
@@ -182,30 +558,7 @@ def truncate_to_tweet_length(text: str, max_length: int = 280) -> str:
     2. Затем по слову
     3. В крайнем случае по символу
     """
-    if not text:
-        return ""
-    
-    if get_twitter_length(text) <= max_length:
-        return text
-    
-    # Пробуем обрезать по предложению
-    sentences = re.split(r'(?<=[.!?])\s+', text)
-    result = ""
-    
-    for sentence in sentences:
-        test = result + (" " if result else "") + sentence
-        if get_twitter_length(test) <= max_length - 3:  # -3 для "..."
-            result = test
-        else:
-            break
-    
-    if result:
-        if get_twitter_length(result) < max_length:
-            return result
-        return safe_truncate(result, max_length)
-    
-    # Fallback на safe_truncate
-    return safe_truncate(text, max_length)
+    return truncate_by_weight(text, max_length, level="sentence")
 
 
 def sanitize_hashtags(hashtags: str, max_count: int = 2, max_length: int = 10) -> str:
@@ -259,20 +612,191 @@ def sanitize_hashtags(hashtags: str, max_count: int = 2, max_length: int = 10) -
     return result
 
 
+# ══════════════════════════════════════════════════════════════════
+# LAZY IMPORTS - тяжелые зависимости грузятся при первом обращении
+# ══════════════════════════════════════════════════════════════════
+
+class LazyModule:
+    """Прокси модуля: реальный import выполняется при первом обращении к атрибуту."""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._module is not None
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<LazyModule {self._name} ({state})>"
+
+
+def lazy_import(name: str) -> LazyModule:
+    """
+    Отложенный import модуля.
+    
+    Example:
+        requests = lazy_import('requests')   # модуль еще не загружен
+        requests.get(url)                    # import происходит здесь
+    """
+    return LazyModule(name)
+
+
+# Модули, которые не должны грузиться при import проекта (только при использовании)
+HEAVY_MODULES = ('playwright', 'bs4', 'tweepy', 'openai', 'requests', 'httpx', 'PIL')
+
+
+def import_time_report(modules, budget_ms: float) -> dict:
+    """
+    Отчёт в стиле `python -X importtime`: импортирует modules в отдельном
+    процессе и сравнивает суммарное время с бюджетом.
+    
+    Args:
+        modules: Имена модулей проекта (например ["parser", "formatting"])
+        budget_ms: Бюджет на суммарный import в миллисекундах
+        
+    Returns:
+        dict: total_ms, budget_ms, top (самые дорогие import'ы верхнего уровня),
+              heavy (загруженные тяжелые зависимости), ok
+    """
+    project_dir = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + ', '.join(modules)],
+        cwd=project_dir, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import failed: {proc.stderr.strip().splitlines()[-1:]}")
+    
+    top_level = []
+    heavy = set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|', 2)
+        root = name.strip().split('.')[0]
+        if root in HEAVY_MODULES:
+            heavy.add(root)
+        # Вложенные import'ы отбиты пробелами - учитываем только верхний уровень
+        if not name[1:].startswith(' '):
+            top_level.append((name.strip(), int(cumulative) / 1000))
+    
+    total_ms = sum(ms for _, ms in top_level)
+    return {
+        "total_ms": total_ms,
+        "budget_ms": budget_ms,
+        "top": sorted(top_level, key=lambda x: x[1], reverse=True)[:10],
+        "heavy": sorted(heavy),
+        "ok": total_ms <= budget_ms and not heavy
+    }
+
+
 # ══════════════════════════════════════════════════════════════════
 # ТЕСТЫ (для отладки)
 # ══════════════════════════════════════════════════════════════════
 
+def legacy_twitter_length(text: str) -> int:
+    """Прежний подсчет: len + число emoji-кодпоинтов (для сравнения в бенчмарке)"""
+    if not text:
+        return 0
+    return len(text) + len(EMOJI_PATTERN.findall(text))
+
+
+BENCHMARK_TEXTS = [
+    "🚨 Market Sentiment\n\nBTC holds above $67K as funding stays positive. Stablecoin inflows rose 3% "
+    "week over week, ETH/BTC at a 3-year low.\n\n#BTC #Crypto",
+    "📊 Trending narratives: AI Agents +14%, RWA tokenized treasuries pass $2B TVL, Solana memes keep "
+    "rotating. More on coinmarketcap.com",
+    "Bitcoin 📈 to the moon 🚀 👨‍👩‍👧 🇺🇸 — “quote” … 日本語 café",
+    "Plain ASCII sentence without any links or emoji, the most common case for thread tweets.",
+    "Курс биткоина вырос на 3% за сутки, эфир держится выше $3K. Подробности в обзоре ниже.",
+    "Plain ASCII with a link https://coinmarketcap.com/currencies/bitcoin/ and more words after it.",
+]
+
+
+def _benchmark(rounds=5000):
+    """
+    get_twitter_length против прежнего regex-подсчета.
+
+    Тексты все разные (BENCHMARK_TEXTS с номером), поэтому LRU не попадает:
+    это цена первого подсчета. Попадания в кэш замеряются отдельно.
+    """
+    texts = [f"{text} {i}" for i in range(rounds) for text in BENCHMARK_TEXTS]
+    uncached = getattr(_weighted_length, '__wrapped__', _weighted_length)
+    variants = [("regex (прежний)", legacy_twitter_length), ("таблица + bisect, без кэша", uncached)]
+    if uncached is not _weighted_length:
+        _weighted_length.cache_clear()
+        variants.append((f"таблица + LRU({TWITTER_LENGTH_CACHE_SIZE}), промахи", _weighted_length))
+    for name, fn in variants:
+        start = time.perf_counter()
+        for text in texts:
+            fn(text)
+        elapsed = time.perf_counter() - start
+        print(f"  {name}: {elapsed * 1e9 / len(texts):.0f} ns/вызов")
+    if uncached is not _weighted_length:
+        hits = texts[-len(BENCHMARK_TEXTS):] * rounds
+        start = time.perf_counter()
+        for text in hits:
+            _weighted_length(text)
+        elapsed = time.perf_counter() - start
+        print(f"  таблица + LRU({TWITTER_LENGTH_CACHE_SIZE}), попадания: {elapsed * 1e9 / len(hits):.0f} ns/вызов")
+    print("  По текстам без кэша (прежний / таблица), ns/вызов:")
+    for sample in BENCHMARK_TEXTS:
+        texts = [f"{sample} {i}" for i in range(rounds)]
+        timings = []
+        for fn in (legacy_twitter_length, uncached):
+            start = time.perf_counter()
+            for text in texts:
+                fn(text)
+            timings.append((time.perf_counter() - start) * 1e9 / rounds)
+        print(f"    {timings[0]:.0f} / {timings[1]:.0f}  {sample[:40]!r}")
+
+
+def _benchmark_slicing(rounds=20000):
+    """text_view().clip против обычного text[:n] + "..." """
+    texts = BENCHMARK_TEXTS + [" ".join(BENCHMARK_TEXTS) * 8]
+    total_chars = rounds * sum(len(text) for text in texts)
+    variants = [
+        ("text[:n] + '...'", lambda text: text[:len(text) // 2 - 3] + "..."),
+        ("TextView(text).clip (без кэша)", lambda text: TextView(text).clip(len(text) // 2)),
+        ("text_view(text).clip (кэш)", lambda text: text_view(text).clip(len(text) // 2)),
+    ]
+    for name, fn in variants:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for text in texts:
+                fn(text)
+        elapsed = time.perf_counter() - start
+        print(f"  {name}: {total_chars / elapsed / 1e6:.1f} M символов/с")
+
+
 def _test():
     """Тестирование функций."""
-    # Twitter counting: regular char = 1, emoji = 2
-    # Formula: len(text) + emoji_count (because len() counts emoji as 1, but Twitter counts as 2)
+    # Twitter counting (twitter-text weightedLength): latin = 1, CJK/emoji = 2, URL = 23
     test_cases = [
         ("Hello World", 11),           # 11 chars, 0 emoji = 11
         ("Hello 🌍", 8),                # 6 chars + 1 emoji = 6 + 2 = 8 (len=7, +1=8)
         ("🚀🚀🚀", 6),                   # 0 chars + 3 emoji = 0 + 6 = 6 (len=3, +3=6)
         ("Bitcoin 📈 to the moon 🚀", 25),  # 21 chars + 2 emoji = 21 + 4 = 25 (len=23, +2=25)
         ("Test", 4),                   # 4 chars, 0 emoji = 4
+        ("👨‍👩‍👧 family", 9),            # ZWJ sequence = 2 целиком
+        ("🇺🇸 1️⃣ 👍🏽", 8),             # флаг, keycap, тон кожи = по 2
+        ("日本語", 6),                  # CJK = 2
+        ("cafe\u0301", 4),             # NFD -> NFC
+        ("— “quote” …", 12),           # тире и кавычки = 1, многоточие = 2
+        ("Read https://example.com/a/very/long/path.", 29),  # URL = 23, точка - пунктуация
+        ("via coinmarketcap.com", 27),
+        ("see https://example.com/x🚀 now", 33),  # emoji после URL - не часть URL
+        ("https://example.com/a…", 25),          # "…" после URL = 2
+        ("coinmarketcap.com, (https://x.com/a?b=1).", 51),
     ]
     
     print("Testing get_twitter_length():")
@@ -293,6 +817,36 @@ def _test():
     print(f"  Truncated: '{truncated}' ({get_twitter_length(truncated)} chars)")
     print(f"  Fits in 50: {'✓' if get_twitter_length(truncated) <= 50 else '✗'}")
 
+    print("\nTesting truncate_by_weight():")
+    text = "First sentence is here. Second one 🚀 follows 👨‍👩‍👧 with https://example.com/long/path and more words."
+    for level, max_length in (("sentence", 40), ("word", 40), ("grapheme", 37), ("word", 3)):
+        result = truncate_by_weight(text, max_length, level=level)
+        fits = get_twitter_length(result) <= max_length
+        print(f"  {'✓' if fits else '✗'} {level}/{max_length}: '{result}' ({get_twitter_length(result)} chars)")
+    # Разрез, создающий URL (вес 23), не должен превышать лимит
+    for glued, max_length in (("coinmarketcap.comé… more words", 20), ("see example.com/xyz,abc.io and more", 30)):
+        for level in ("sentence", "word", "grapheme"):
+            result = truncate_by_weight(glued, max_length, level=level)
+            if get_twitter_length(result) > max_length:
+                print(f"  ✗ {level}/{max_length}: '{result}' ({get_twitter_length(result)} chars)")
+    view = TextView(text)
+    exact = all(view.prefix_weights[i] == get_twitter_length(view.head(i)) for i in range(len(view) + 1)
+                if view.head(i).endswith(' '))
+    print(f"  {'✓' if exact else '✗'} prefix sums == get_twitter_length на границах слов")
+
+    print("\nTesting TextView.clip():")
+    for text, max_chars, expected in (
+        ("Flags 🇺🇸🇬🇧 here", 10, "Flags ..."),      # флаг целиком или никак
+        ("Family 👨‍👩‍👧 ok", 11, "Family ..."),
+        ("Short", 10, "Short"),
+    ):
+        result = text_view(text).clip(max_chars)
+        print(f"  {'✓' if result == expected else '✗'} '{text}'/{max_chars} → '{result}'")
+
 
 if __name__ == "__main__":
-    _test()
+    if '--benchmark' in sys.argv[1:]:
+        _benchmark()
+        _benchmark_slicing()
+    else:
+        _test()